@@ -3,16 +3,25 @@ Alpaca Trading Client
 Handles all interactions with Alpaca Markets API
 """
 import os
+import time
+import functools
+import inspect
 from typing import Dict, Optional, List, Any
 from decimal import Decimal
 from alpaca.trading.client import TradingClient
-from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest, StopOrderRequest, StopLimitOrderRequest, GetOrdersRequest
-from alpaca.trading.enums import OrderSide, TimeInForce, OrderStatus
+from alpaca.trading.requests import (
+    MarketOrderRequest, LimitOrderRequest, StopOrderRequest, StopLimitOrderRequest, GetOrdersRequest,
+    GetOrderByIdRequest, TakeProfitRequest, StopLossRequest, GetAssetsRequest
+)
+from alpaca.trading.enums import OrderSide, TimeInForce, OrderStatus, OrderClass, AssetClass
 from alpaca.data.historical import StockHistoricalDataClient
 from alpaca.data.requests import StockLatestQuoteRequest, StockLatestTradeRequest
 from alpaca.common.exceptions import APIError
 from dotenv import load_dotenv
 
+from metrics import BROKER_CALL_SECONDS
+from asset_cache import asset_cache
+
 load_dotenv()
 
 class AlpacaClient:
@@ -29,6 +38,9 @@ class AlpacaClient:
         self.api_key = api_key or os.getenv("ALPACA_API_KEY")
         self.secret_key = secret_key or os.getenv("ALPACA_API_SECRET")
         
+        # Route every client to one endpoint (e.g. fake_alpaca.py for offline runs)
+        base_url = os.getenv("ALPACA_URL_OVERRIDE") or base_url
+        
         if not self.api_key or not self.secret_key:
             raise ValueError("Alpaca API credentials not provided")
         
@@ -96,8 +108,9 @@ class AlpacaClient:
     
     async def place_order(self, symbol: str, action: str, quantity: float, 
                          order_type: str = "market", limit_price: float = None,
-                         stop_price: float = None, time_in_force: str = "day") -> str:
-        """Place an order with Alpaca"""
+                         stop_price: float = None, time_in_force: str = "day",
+                         client_order_id: str = None) -> str:
+        """Place an order with Alpaca. client_order_id makes resubmission idempotent (Alpaca rejects duplicates)."""
         try:
             # Convert action to OrderSide enum
             side = OrderSide.BUY if action.upper() == "BUY" else OrderSide.SELL
@@ -116,6 +129,9 @@ class AlpacaClient:
             
             print(f"Placing order: {symbol} {action} {quantity} shares, type={order_type}, fractional={is_fractional}")
             
+            # Idempotency key, only sent when given
+            id_kwargs = {"client_order_id": client_order_id} if client_order_id else {}
+            
             # Create order request based on type
             if order_type.lower() == "market":
                 if is_fractional:
@@ -124,14 +140,16 @@ class AlpacaClient:
                         symbol=symbol,
                         qty=quantity,  # Alpaca accepts fractional quantities
                         side=side,
-                        time_in_force=tif
+                        time_in_force=tif,
+                        **id_kwargs
                     )
                 else:
                     order_request = MarketOrderRequest(
                         symbol=symbol,
                         qty=int(quantity),
                         side=side,
-                        time_in_force=tif
+                        time_in_force=tif,
+                        **id_kwargs
                     )
             elif order_type.lower() == "limit":
                 # Fractional limit orders are supported by Alpaca
@@ -140,7 +158,8 @@ class AlpacaClient:
                     qty=quantity if is_fractional else int(quantity),
                     side=side,
                     time_in_force=tif,
-                    limit_price=limit_price
+                    limit_price=limit_price,
+                    **id_kwargs
                 )
             elif order_type.lower() == "stop":
                 # Stop order - becomes market order when stop price is reached
@@ -149,7 +168,8 @@ class AlpacaClient:
                     qty=quantity if is_fractional else int(quantity),
                     side=side,
                     time_in_force=tif,
-                    stop_price=stop_price
+                    stop_price=stop_price,
+                    **id_kwargs
                 )
             elif order_type.lower() == "stop_limit":
                 # Stop-limit order - becomes limit order when stop price is reached
@@ -159,7 +179,8 @@ class AlpacaClient:
                     side=side,
                     time_in_force=tif,
                     stop_price=stop_price,
-                    limit_price=limit_price
+                    limit_price=limit_price,
+                    **id_kwargs
                 )
             else:
                 raise ValueError(f"Unsupported order type: {order_type}")
@@ -198,6 +219,70 @@ class AlpacaClient:
             print(f"Error getting order status: {e}")
             return None
     
+    async def place_oco_order(self, symbol: str, action: str, quantity: int, take_profit_price: float,
+                              stop_price: float, client_order_id: str = None) -> Dict[str, str]:
+        """Place a GTC one-cancels-other exit: a limit leg at take_profit_price and a stop leg at stop_price.
+        Returns {"id": limit leg (parent) order id, "stop_leg_id": stop leg order id}."""
+        side = OrderSide.BUY if action.upper() == "BUY" else OrderSide.SELL
+        id_kwargs = {"client_order_id": client_order_id} if client_order_id else {}
+        
+        order_request = LimitOrderRequest(
+            symbol=symbol,
+            qty=int(quantity),
+            side=side,
+            time_in_force=TimeInForce.GTC,
+            order_class=OrderClass.OCO,
+            limit_price=take_profit_price,
+            take_profit=TakeProfitRequest(limit_price=take_profit_price),
+            stop_loss=StopLossRequest(stop_price=stop_price),
+            **id_kwargs
+        )
+        
+        order = self.trading_client.submit_order(order_request)
+        stop_leg = order.legs[0] if order.legs else None
+        print(f"OCO order placed successfully: {order.id} (stop leg {stop_leg.id if stop_leg else None})")
+        return {"id": str(order.id), "stop_leg_id": str(stop_leg.id) if stop_leg else None}
+    
+    async def get_order_with_legs(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """Get an order including its bracket/OCO legs, or None if it cannot be fetched"""
+        def to_dict(order):
+            return {
+                "id": str(order.id),
+                "status": order.status.value,
+                "order_type": order.order_type.value,
+                "filled_qty": float(order.filled_qty) if order.filled_qty else 0,
+                "filled_avg_price": float(order.filled_avg_price) if order.filled_avg_price else None,
+                "filled_at": order.filled_at,
+                "updated_at": order.updated_at
+            }
+        
+        try:
+            order = self.trading_client.get_order_by_id(order_id, filter=GetOrderByIdRequest(nested=True))
+            result = to_dict(order)
+            result["legs"] = [to_dict(leg) for leg in (order.legs or [])]
+            return result
+        except Exception as e:
+            print(f"Error getting order {order_id}: {e}")
+            return None
+    
+    async def get_order_by_client_order_id(self, client_order_id: str) -> Optional[Dict[str, Any]]:
+        """Get an order by the client_order_id it was submitted with, or None if there is none"""
+        try:
+            order = self.trading_client.get_order_by_client_id(client_order_id)
+            return {
+                "id": str(order.id),
+                "client_order_id": order.client_order_id,
+                "status": order.status.value,
+                "symbol": order.symbol,
+                "qty": float(order.qty) if order.qty else 0,
+                "filled_qty": float(order.filled_qty) if order.filled_qty else 0,
+                "filled_avg_price": float(order.filled_avg_price) if order.filled_avg_price else None
+            }
+        except APIError as e:
+            if getattr(e, 'status_code', None) == 404:
+                return None
+            raise
+    
     async def get_orders(self, status: str = 'all', limit: int = 100) -> List[Dict[str, Any]]:
         """Get orders from Alpaca"""
         try:
@@ -241,8 +326,8 @@ class AlpacaClient:
             print(f"Error canceling order: {e}")
             return False
     
-    async def get_positions(self) -> List[Dict[str, Any]]:
-        """Get all open positions"""
+    async def get_positions(self, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get all open positions (raise_errors: raise instead of returning [] so a failure is not mistaken for no positions)"""
         try:
             positions = self.trading_client.get_all_positions()
             return [
@@ -261,6 +346,8 @@ class AlpacaClient:
             ]
         except Exception as e:
             print(f"Error getting positions: {e}")
+            if raise_errors:
+                raise
             return []
     
     async def close_position(self, symbol: str) -> bool:
@@ -272,6 +359,50 @@ class AlpacaClient:
             print(f"Error closing position: {e}")
             return False
     
+    @staticmethod
+    def _asset_to_dict(asset) -> Dict[str, Any]:
+        def enum_value(value):
+            return getattr(value, 'value', value)
+        return {
+            "symbol": asset.symbol,
+            "name": asset.name,
+            "exchange": enum_value(asset.exchange),
+            "asset_class": enum_value(asset.asset_class),
+            "status": enum_value(asset.status),
+            "tradable": bool(asset.tradable),
+            "fractionable": bool(asset.fractionable),
+            "shortable": bool(asset.shortable),
+            "easy_to_borrow": bool(asset.easy_to_borrow),
+            "marginable": bool(asset.marginable)
+        }
+    
+    async def get_assets(self) -> List[Dict[str, Any]]:
+        """All US equity assets in one call (for the daily asset cache refresh); raises on failure"""
+        assets = self.trading_client.get_all_assets(GetAssetsRequest(asset_class=AssetClass.US_EQUITY))
+        return [self._asset_to_dict(asset) for asset in assets]
+    
+    async def get_asset(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Single asset lookup, or None if the broker does not list it"""
+        try:
+            return self._asset_to_dict(self.trading_client.get_asset(symbol))
+        except Exception as e:
+            print(f"Error getting asset {symbol}: {e}")
+            return None
+    
+    async def get_market_clock(self) -> Optional[Dict[str, Any]]:
+        """Get market clock (open/closed and next open/close times)"""
+        try:
+            clock = self.trading_client.get_clock()
+            return {
+                "is_open": bool(clock.is_open),
+                "timestamp": clock.timestamp,
+                "next_open": clock.next_open,
+                "next_close": clock.next_close
+            }
+        except Exception as e:
+            print(f"Error getting market clock: {e}")
+            return None
+    
     async def get_market_data(self, symbol: str) -> dict:
         """Get current market data for a symbol"""
         try:
@@ -283,14 +414,9 @@ class AlpacaClient:
             trade_request = StockLatestTradeRequest(symbol_or_symbols=symbol)
             trades = self.data_client.get_stock_latest_trade(trade_request)
             
-            # Try to get asset information to check fractional trading
-            fractionable = False
-            try:
-                asset = self.trading_client.get_asset(symbol)
-                fractionable = getattr(asset, 'fractionable', False)
-            except Exception:
-                # If we can't get asset info, assume not fractionable
-                pass
+            # Fractional trading from the asset cache (one get_asset() call for unlisted symbols)
+            asset = await asset_cache.lookup(symbol, self)
+            fractionable = asset.fractionable if asset else False
             
             quote = quotes.get(symbol)
             trade = trades.get(symbol)
@@ -355,5 +481,23 @@ class AlpacaClient:
             }
         return {"BuyingPower": 0}
 
+def _timed_broker_call(name: str, method):
+    """Record latency and outcome of one AlpacaClient call in the metrics registry"""
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await method(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            BROKER_CALL_SECONDS.observe(time.perf_counter() - start, name, outcome)
+    return wrapper
+
+for _name, _method in list(vars(AlpacaClient).items()):
+    if not _name.startswith('_') and inspect.iscoroutinefunction(_method):
+        setattr(AlpacaClient, _name, _timed_broker_call(_name, _method))
+
 # Singleton instance (will be replaced with account-specific instances)
 alpaca_client = None 
\ No newline at end of file
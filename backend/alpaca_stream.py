@@ -12,6 +12,9 @@ from dotenv import load_dotenv
 from alpaca.trading.stream import TradingStream
 from alpaca.trading.enums import TradeEvent
 
+from signal_latency import mark_trade_stage
+from positions_mirror import apply_fill
+
 load_dotenv()
 
 def get_db_connection():
@@ -42,7 +45,7 @@ class AlpacaStreamHandler:
             
             # Find the trade by broker_order_id
             cursor.execute("""
-                SELECT id, account_id FROM trades 
+                SELECT id, account_id, symbol, action FROM trades 
                 WHERE broker_order_id = %s
             """, (str(order.id),))
             
@@ -51,9 +54,15 @@ class AlpacaStreamHandler:
             if trade:
                 trade_id = trade['id']
                 
+                if event in (TradeEvent.FILL, TradeEvent.PARTIAL_FILL):
+                    apply_fill(cursor, trade['account_id'], order.id, trade['symbol'], trade['action'],
+                               float(order.filled_qty or 0), float(order.filled_avg_price or 0),
+                               order.filled_at or order.updated_at)
+                
                 # Handle different event types
                 if event == TradeEvent.FILL:
                     # Order fully filled
+                    mark_trade_stage(cursor, trade_id, 'filled_at')
                     cursor.execute("""
                         UPDATE trades 
                         SET status = 'closed',
@@ -112,6 +121,7 @@ class AlpacaStreamHandler:
                     print(f"  ⏳ Order PENDING")
                     
                 elif event == TradeEvent.NEW:
+                    mark_trade_stage(cursor, trade_id, 'broker_accepted_at')
                     print(f"  ✓ Order ACCEPTED by broker")
                     
                 elif event == TradeEvent.EXPIRED:
@@ -142,7 +152,8 @@ class AlpacaStreamHandler:
             stream = TradingStream(
                 api_key=api_key,
                 secret_key=api_secret,
-                paper=paper
+                paper=paper,
+                url_override=os.getenv("ALPACA_STREAM_URL_OVERRIDE")
             )
             
             # Subscribe to trade updates
@@ -0,0 +1,206 @@
+"""
+Asset metadata cache
+
+Alpaca asset attributes (tradable, fractionable, shortable, exchange, status)
+change at most once a day, yet get_market_data() used to call get_asset() on
+every price lookup just to read `fractionable`. Instead the asset_refresh
+process loads the whole US equity list in one call once a day into the assets
+table, and every process keeps a copy in memory:
+
+    asset_cache.get(symbol)             AssetInfo, or None if unknown or not loaded yet
+    asset_cache.is_known(symbol)        False only once loaded and the symbol is not listed
+    asset_cache.is_tradable(symbol)     membership in the resident set of active, tradable tickers
+    await asset_cache.ensure_loaded()   (re)load from the assets table when missing or stale
+    await asset_cache.lookup(symbol, client)
+                                        get(), falling back to one get_asset() call for
+                                        symbols listed after the last refresh
+
+Until migrations/create_assets_table.py has run and the first refresh has
+completed, nothing is rejected and lookups fall back to get_asset().
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+ASSET_REFRESH_HOURS = float(os.getenv('ASSET_REFRESH_HOURS', '24'))
+# How often processes that do not run the refresh pick up the leader's new snapshot
+ASSET_CACHE_RELOAD_SECONDS = float(os.getenv('ASSET_CACHE_RELOAD_SECONDS', '3600'))
+
+COLUMNS = ('symbol', 'name', 'exchange', 'asset_class', 'status', 'tradable',
+           'fractionable', 'shortable', 'easy_to_borrow', 'marginable')
+
+
+def create_assets_table(cursor):
+    """Create the assets table (daily snapshot of the broker's asset list)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS assets (
+            symbol VARCHAR(20) PRIMARY KEY,
+            name VARCHAR(255),
+            exchange VARCHAR(20),
+            asset_class VARCHAR(20),
+            status VARCHAR(20) NOT NULL,
+            tradable BOOLEAN NOT NULL DEFAULT FALSE,
+            fractionable BOOLEAN NOT NULL DEFAULT FALSE,
+            shortable BOOLEAN NOT NULL DEFAULT FALSE,
+            easy_to_borrow BOOLEAN NOT NULL DEFAULT FALSE,
+            marginable BOOLEAN NOT NULL DEFAULT FALSE,
+            refreshed_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+class AssetInfo:
+    __slots__ = COLUMNS
+
+    def __init__(self, symbol: str, name: Optional[str] = None, exchange: Optional[str] = None,
+                 asset_class: Optional[str] = None, status: str = 'active', tradable: bool = False,
+                 fractionable: bool = False, shortable: bool = False, easy_to_borrow: bool = False,
+                 marginable: bool = False):
+        self.symbol = symbol
+        self.name = name
+        self.exchange = exchange
+        self.asset_class = asset_class
+        self.status = status
+        self.tradable = bool(tradable)
+        self.fractionable = bool(fractionable)
+        self.shortable = bool(shortable)
+        self.easy_to_borrow = bool(easy_to_borrow)
+        self.marginable = bool(marginable)
+
+    @property
+    def is_active(self) -> bool:
+        return self.status == 'active'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {column: getattr(self, column) for column in COLUMNS}
+
+
+def replace_assets(cursor, assets: List[Dict[str, Any]]) -> int:
+    """Store a full broker snapshot (AlpacaClient.get_assets() output); symbols no longer listed are removed"""
+    if not assets:
+        return 0  # An empty list is a broker problem, not a delisting of everything
+    rows = [tuple(asset.get(column) for column in COLUMNS) for asset in assets]
+    execute_values(cursor, f"""
+        INSERT INTO assets ({', '.join(COLUMNS)}, refreshed_at)
+        VALUES %s
+        ON CONFLICT (symbol) DO UPDATE
+        SET {', '.join(f'{column} = EXCLUDED.{column}' for column in COLUMNS[1:])},
+            refreshed_at = EXCLUDED.refreshed_at
+    """, rows, template=f"({', '.join(['%s'] * len(COLUMNS))}, NOW())", page_size=1000)
+    cursor.execute("DELETE FROM assets WHERE refreshed_at < NOW()")
+    return len(rows)
+
+
+def needs_refresh(cursor) -> bool:
+    """True when the assets table is empty or older than ASSET_REFRESH_HOURS"""
+    cursor.execute("""
+        SELECT COALESCE(MAX(refreshed_at) < NOW() - make_interval(secs => %s), TRUE) AS stale
+        FROM assets
+    """, (ASSET_REFRESH_HOURS * 3600,))
+    row = cursor.fetchone()
+    return bool(row['stale'] if isinstance(row, dict) else row[0])
+
+
+class AssetCache:
+    def __init__(self):
+        self.assets: Dict[str, AssetInfo] = {}
+        self.tradable_symbols: set = set()  # Active and tradable - what signals may name
+        self.loaded = False  # A snapshot is in memory (single get_asset() results alone do not count)
+        self.refreshed_at: Optional[datetime] = None  # Broker snapshot time of the loaded rows
+        self.loaded_at = 0.0  # Monotonic time of the last load attempt
+        self.fallback_lookups = 0
+        self._misses: set = set()  # Symbols get_asset() did not find, until the next load
+        self._lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        return not self.loaded_at or time.monotonic() - self.loaded_at >= ASSET_CACHE_RELOAD_SECONDS
+
+    def load(self, force: bool = False):
+        """Read the assets table into memory (blocking - call from a thread)"""
+        with self._lock:
+            if not force and not self._stale():
+                return
+            self.loaded_at = time.monotonic()
+            from db import get_db_connection  # db imports this module for create_assets_table
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT to_regclass('assets') IS NOT NULL")
+                if not cursor.fetchone()[0]:
+                    return
+                cursor.execute(f"SELECT {', '.join(COLUMNS)}, refreshed_at FROM assets")
+                rows = cursor.fetchall()
+            finally:
+                conn.close()
+
+        if not rows:
+            return
+        # Swap in a complete dict so readers in other threads never see a partial load
+        assets = {row[0]: AssetInfo(*row[:len(COLUMNS)]) for row in rows}
+        self.tradable_symbols = {symbol for symbol, asset in assets.items() if asset.is_active and asset.tradable}
+        self.assets = assets
+        self.refreshed_at = max(row[-1] for row in rows)
+        self.loaded = True
+        self._misses = set()
+        logger.info(f"[ASSETS] Loaded {len(self.assets)} assets (refreshed {self.refreshed_at})")
+
+    async def ensure_loaded(self, force: bool = False):
+        if not force and not self._stale():
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.load, force)
+        except Exception as e:
+            logger.warning(f"[ASSETS] Could not load asset cache: {e}")
+
+    def get(self, symbol: str) -> Optional[AssetInfo]:
+        return self.assets.get(symbol.upper()) if symbol else None
+
+    def is_known(self, symbol: str) -> bool:
+        """Whether symbol is a listed, active asset - True while the cache is not loaded"""
+        if not self.loaded:
+            return True
+        asset = self.get(symbol)
+        return asset is not None and asset.is_active
+
+    def is_tradable(self, symbol: str) -> bool:
+        """Whether symbol is an active, tradable ticker - True while the cache is not loaded"""
+        return not self.loaded or symbol.upper() in self.tradable_symbols
+
+    async def lookup(self, symbol: str, broker_client=None) -> Optional[AssetInfo]:
+        """Cached asset, or one get_asset() call for a symbol missing from the snapshot"""
+        await self.ensure_loaded()
+        symbol = symbol.upper()
+        asset = self.assets.get(symbol)
+        if asset is not None or broker_client is None or symbol in self._misses:
+            return asset
+
+        self.fallback_lookups += 1
+        data = await broker_client.get_asset(symbol)
+        if data is None:
+            self._misses.add(symbol)
+            return None
+        asset = AssetInfo(**{column: data.get(column) for column in COLUMNS})
+        self.assets[symbol] = asset
+        if asset.is_active and asset.tradable:
+            self.tradable_symbols.add(symbol)
+        return asset
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "assets": len(self.assets),
+            "tradable": len(self.tradable_symbols),
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            "fallback_lookups": self.fallback_lookups
+        }
+
+
+asset_cache = AssetCache()
@@ -9,6 +9,7 @@ from dotenv import load_dotenv
 
 from models import User, TokenData
 from db import get_db_connection
+from executors import run_in_pool
 
 load_dotenv()
 
@@ -169,8 +170,8 @@ async def register(username: str, email: str, password: str):
     finally:
         conn.close()
     
-    # Create new user
-    user = create_user(username, email, password)
+    # Create new user (bcrypt hashing runs in the auth pool, off the event loop)
+    user = await run_in_pool('auth', create_user, username, email, password)
     if not user:
         raise HTTPException(
             status_code=500,
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmark the level-monitoring hot loop against Postgres and the fake broker
+
+Seeds synthetic users, accounts, trades and TP/SL levels (usernames prefixed
+bench_), drives prices through fake_alpaca.py so a known level is crossed
+every cycle, and measures for each target:
+
+- cycle latency (p50/p90/p99/max)
+- price-cross-to-order-submit latency (fake broker's submit time minus the
+  time the crossing price was published)
+- DB statements per cycle (counted on every connection from db.get_db_connection)
+- broker API calls per cycle (from the fake broker's request counters)
+
+Targets:
+- script_manager: process_modules.level_monitor.monitor_levels_process
+- standalone: monitor/main.py TradeLevelMonitor.run_monitoring_cycle
+
+Results are written as JSON (with the git commit) so runs can be compared
+across commits. Seeded rows are deleted afterwards unless --keep is given.
+
+Usage:
+    python fake_alpaca.py --tick 0 &
+    python benchmark_level_monitor.py [--accounts 10] [--trades-per-account 50]
+        [--tp-levels 3] [--symbols 50] [--cycles 30] [--crosses-per-cycle 2]
+        [--targets script_manager,standalone] [--output level_monitor_benchmark.json]
+
+By default the proximity scheduler is disabled (every symbol polled every
+cycle) so runs are comparable; pass --proximity to benchmark with it.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import psycopg2.extensions
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_PREFIX = 'bench_'
+TP_STEP = 0.02  # level k sits at base * (1 + k * TP_STEP)
+SL_DISTANCE = 0.05
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def increment(self):
+        with self.lock:
+            self.count += 1
+
+
+queries = QueryCounter()
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        queries.increment()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        queries.increment()
+        return super().executemany(query, vars_list)
+
+
+def install_query_counting():
+    """Count statements on every connection handed out by db.get_db_connection.
+
+    Must run before the monitor modules import get_db_connection.
+    """
+    import db
+    original = db.get_db_connection
+
+    def counted_connection():
+        conn = original()
+        conn.cursor_factory = CountingCursor
+        return conn
+
+    db.get_db_connection = counted_connection
+
+
+class FakeBrokerControl:
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+
+    def _call(self, method: str, path: str, body: Any = None) -> Any:
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def reset(self):
+        self._call('POST', '/_fake/reset')
+
+    def set_prices(self, prices: Dict[str, float]):
+        self._call('POST', '/_fake/prices', prices)
+
+    def request_count(self) -> int:
+        return self._call('GET', '/_fake/stats')['requests'].get('requests', 0)
+
+    def orders_since(self, since: float) -> List[Dict[str, Any]]:
+        return self._call('GET', f'/_fake/orders?since={since}')
+
+
+def base_prices(symbol_count: int) -> Dict[str, float]:
+    return {f"BN{i:04d}": round(20 + i * 1.5, 2) for i in range(symbol_count)}
+
+
+def seed(cursor, args, prices: Dict[str, float], trade_status: str) -> Dict[str, int]:
+    """Insert the synthetic book and return row counts"""
+    run = datetime.now().strftime('%H%M%S')
+    symbols = list(prices)
+    counts = {'users': 0, 'accounts': 0, 'trades': 0, 'take_profit_levels': 0, 'stop_loss_levels': 0}
+
+    for user_index in range(args.users):
+        cursor.execute("""
+            INSERT INTO users (username, email, password)
+            VALUES (%s, %s, 'benchmark') RETURNING id
+        """, (f"{BENCH_PREFIX}{run}_{user_index}", f"{BENCH_PREFIX}{run}_{user_index}@example.invalid"))
+        user_id = cursor.fetchone()[0]
+        counts['users'] += 1
+
+        for account_index in range(max(1, args.accounts // args.users)):
+            cursor.execute("""
+                INSERT INTO accounts (user_id, name, account_type, broker, api_key, api_secret, is_active)
+                VALUES (%s, %s, 'paper', 'alpaca', %s, 'benchmark', TRUE) RETURNING id
+            """, (user_id, f"Benchmark {account_index}", f"BENCH{run}U{user_index}A{account_index}"))
+            account_id = cursor.fetchone()[0]
+            counts['accounts'] += 1
+
+            for trade_index in range(args.trades_per_account):
+                symbol = symbols[(account_index * args.trades_per_account + trade_index) % len(symbols)]
+                base = prices[symbol]
+                cursor.execute("""
+                    INSERT INTO trades (user_id, account_id, symbol, action, quantity, entry_price, status, opened_at)
+                    VALUES (%s, %s, %s, 'BUY', %s, %s, %s, NOW()) RETURNING id
+                """, (user_id, account_id, symbol, args.quantity, base, trade_status))
+                trade_id = cursor.fetchone()[0]
+                counts['trades'] += 1
+
+                share = args.quantity // args.tp_levels
+                for level in range(1, args.tp_levels + 1):
+                    cursor.execute("""
+                        INSERT INTO take_profit_levels (trade_id, level_number, price, percentage, shares_quantity, status)
+                        VALUES (%s, %s, %s, %s, %s, 'pending')
+                    """, (trade_id, level, round(base * (1 + level * TP_STEP), 2),
+                          round(100 / args.tp_levels, 2), share))
+                    counts['take_profit_levels'] += 1
+
+                cursor.execute("""
+                    INSERT INTO stop_loss_levels (trade_id, price, status)
+                    VALUES (%s, %s, 'active')
+                """, (trade_id, round(base * (1 - SL_DISTANCE), 2)))
+                counts['stop_loss_levels'] += 1
+
+    return counts
+
+
+def cleanup(cursor):
+    """Delete everything seeded by this harness (levels and trades cascade from users)"""
+    cursor.execute("""
+        DELETE FROM trade_notifications WHERE user_id IN (SELECT id FROM users WHERE username LIKE %s)
+    """, (BENCH_PREFIX + '%',))
+    cursor.execute("DELETE FROM users WHERE username LIKE %s", (BENCH_PREFIX + '%',))
+    return cursor.rowcount
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {'count': len(ordered), 'p50_ms': at(0.50), 'p90_ms': at(0.90), 'p99_ms': at(0.99),
+            'max_ms': round(ordered[-1] * 1000, 3), 'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3)}
+
+
+def load_standalone_monitor():
+    """monitor/main.py, loaded under its own name (backend/main.py is the API)"""
+    spec = importlib.util.spec_from_file_location(
+        'level_monitor_service', os.path.join(BACKEND_DIR, 'monitor', 'main.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.TradeLevelMonitor(check_interval=0)
+
+
+async def run_target(target: str, args, broker: FakeBrokerControl) -> Dict[str, Any]:
+    from db import get_db_connection
+
+    prices = base_prices(args.symbols)
+    broker.reset()
+    broker.set_prices(prices)
+
+    # The script manager monitors 'filled' trades, the standalone service 'open' ones
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cleanup(cursor)
+    seeded = seed(cursor, args, prices, 'open' if target == 'standalone' else 'filled')
+    conn.commit()
+    conn.close()
+    print(f"🌱 {target}: seeded {seeded}")
+
+    if target == 'script_manager':
+        from process_modules.level_monitor import monitor_levels_process
+        run_cycle = monitor_levels_process
+    else:
+        run_cycle = load_standalone_monitor().run_monitoring_cycle
+
+    symbols = list(prices)
+    crosses: List[Tuple[str, float]] = []
+    cycle_times, cycle_queries, cycle_calls = [], [], []
+    started = time.time()
+
+    for cycle in range(args.cycles):
+        # Cross the next TP level on a few symbols
+        moves = {}
+        for offset in range(args.crosses_per_cycle):
+            index = cycle * args.crosses_per_cycle + offset
+            symbol = symbols[index % len(symbols)]
+            level = min(index // len(symbols) + 1, args.tp_levels)
+            moves[symbol] = round(prices[symbol] * (1 + level * TP_STEP) + 0.01, 2)
+        broker.set_prices(moves)
+        crossed_at = time.time()
+        crosses.extend((symbol, crossed_at) for symbol in moves)
+
+        queries_before, calls_before = queries.count, broker.request_count()
+        cycle_start = time.perf_counter()
+        await run_cycle()
+        cycle_times.append(time.perf_counter() - cycle_start)
+        cycle_queries.append(queries.count - queries_before)
+        cycle_calls.append(broker.request_count() - calls_before)
+
+        if args.cycle_interval:
+            await asyncio.sleep(args.cycle_interval)
+
+    # Each order's latency is measured from the latest cross of its symbol before it
+    submit_latencies = []
+    for order in broker.orders_since(started):
+        crossed = [t for symbol, t in crosses if symbol == order['symbol'] and t <= order['submitted_epoch']]
+        if crossed:
+            submit_latencies.append(order['submitted_epoch'] - max(crossed))
+
+    if not args.keep:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cleanup(cursor)
+        conn.commit()
+        conn.close()
+
+    return {
+        'seeded': seeded,
+        'cycles': args.cycles,
+        'cycle_latency': percentiles(cycle_times),
+        'cross_to_submit_latency': percentiles(submit_latencies),
+        'orders_submitted': len(submit_latencies),
+        'db_queries_per_cycle': {'mean': round(sum(cycle_queries) / len(cycle_queries), 1),
+                                 'max': max(cycle_queries)},
+        'broker_calls_per_cycle': {'mean': round(sum(cycle_calls) / len(cycle_calls), 1),
+                                   'max': max(cycle_calls)},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--fake-url', default='http://127.0.0.1:8765')
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--accounts', type=int, default=10, help='total accounts, spread over users')
+    parser.add_argument('--trades-per-account', type=int, default=50)
+    parser.add_argument('--tp-levels', type=int, default=3)
+    parser.add_argument('--quantity', type=int, default=30)
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--cycles', type=int, default=30)
+    parser.add_argument('--crosses-per-cycle', type=int, default=2)
+    parser.add_argument('--cycle-interval', type=float, default=0.0, help='seconds between cycles')
+    parser.add_argument('--targets', default='script_manager,standalone')
+    parser.add_argument('--proximity', action='store_true', help='keep the proximity scheduler enabled')
+    parser.add_argument('--keep', action='store_true', help='leave seeded rows in the database')
+    parser.add_argument('--output', default='level_monitor_benchmark.json')
+    args = parser.parse_args()
+
+    # Must be set before the monitor modules are imported
+    os.environ['ALPACA_URL_OVERRIDE'] = args.fake_url
+    os.environ.setdefault('LEVEL_MONITOR_MARKET_HOURS_ONLY', 'false')
+    if not args.proximity:
+        os.environ['LEVEL_MONITOR_MIN_INTERVAL'] = '0'
+        os.environ['LEVEL_MONITOR_MAX_INTERVAL'] = '0'
+    sys.path.insert(0, BACKEND_DIR)
+    install_query_counting()
+
+    broker = FakeBrokerControl(args.fake_url)
+    results = {
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(),
+        'parameters': vars(args),
+        'targets': {}
+    }
+    for target in args.targets.split(','):
+        results['targets'][target] = asyncio.run(run_target(target, args, broker))
+        summary = results['targets'][target]
+        print(f"📊 {target}: cycle p50 {summary['cycle_latency'].get('p50_ms')}ms "
+              f"p99 {summary['cycle_latency'].get('p99_ms')}ms, "
+              f"cross->submit p50 {summary['cross_to_submit_latency'].get('p50_ms')}ms, "
+              f"{summary['db_queries_per_cycle']['mean']} queries/cycle, "
+              f"{summary['broker_calls_per_cycle']['mean']} broker calls/cycle")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
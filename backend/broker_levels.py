@@ -0,0 +1,422 @@
+"""
+Broker-native take profit / stop loss execution
+
+With LEVEL_EXECUTION_MODE=broker the levels saved by process_trade_levels are
+also handed to Alpaca as resting GTC orders, so exits happen at exchange speed
+even while our backend is down and cost nothing to poll:
+
+- each take profit slice (take_profit_levels.shares_quantity) becomes an OCO
+  order: a limit leg at the TP price and a stop leg at the stop loss price
+- shares not covered by a TP slice get a plain stop order for the remainder
+- TP slices without a stop loss become plain GTC limit orders
+
+Levels at the broker are marked status = 'working', which every client-side
+monitor skips. Trade sync reconciles them from the broker's order state
+(reconcile_broker_levels). A level whose order the broker cancelled, expired
+or rejected goes back to 'pending'/'active' and client-side monitoring takes
+over again. Entries are already filled when levels are created, so bracket
+(entry + exits) orders are not used.
+
+Alpaca does not accept fractional quantities on GTC/OCO orders; trades whose
+slices are fractional stay on client-side monitoring.
+"""
+
+from __future__ import annotations
+
+import json
+import asyncio
+import logging
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from level_claims import DEAD_ORDER_STATUSES
+from positions_mirror import apply_fill
+
+if TYPE_CHECKING:
+    from alpaca_client import AlpacaClient  # Imported where used - the Alpaca SDK is slow to load
+
+logger = logging.getLogger(__name__)
+
+LEVEL_EXECUTION_MODE = os.getenv('LEVEL_EXECUTION_MODE', 'monitor').lower()  # monitor | broker
+BROKER_NATIVE_LEVELS = LEVEL_EXECUTION_MODE == 'broker'
+
+# cancel_broker_levels re-fetches a cancelled order until the broker reports it settled
+CANCEL_CONFIRM_ATTEMPTS = 5
+CANCEL_CONFIRM_INTERVAL_SECONDS = 0.4
+
+
+def ensure_broker_level_columns(cursor):
+    """Columns tracking which levels live at the broker"""
+    for table in ('take_profit_levels', 'stop_loss_levels'):
+        cursor.execute(f"""
+            ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS execution_mode VARCHAR(10) NOT NULL DEFAULT 'monitor'
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_working
+            ON {table}(trade_id)
+            WHERE status = 'working'
+        """)
+    cursor.execute("""
+        ALTER TABLE take_profit_levels
+        ADD COLUMN IF NOT EXISTS stop_leg_order_id VARCHAR(255)
+    """)
+
+
+def _is_whole(quantity) -> bool:
+    return float(quantity) == int(float(quantity))
+
+
+async def _as_order(place) -> Dict[str, Optional[str]]:
+    """Wrap place_order's order id in the same shape place_oco_order returns"""
+    return {"id": await place, "stop_leg_id": None}
+
+
+async def _submit(client: AlpacaClient, client_order_id: str, submit) -> Dict[str, Optional[str]]:
+    """Run submit(); if it fails because this client_order_id already exists, reuse that order"""
+    try:
+        return await submit()
+    except Exception:
+        existing = await client.get_order_by_client_order_id(client_order_id)
+        if existing and existing['status'] not in DEAD_ORDER_STATUSES:
+            legs = await client.get_order_with_legs(existing['id'])
+            stop_leg = next((leg for leg in (legs or {}).get('legs', []) if leg['order_type'] == 'stop'), None)
+            return {"id": existing['id'], "stop_leg_id": stop_leg['id'] if stop_leg else None}
+        raise
+
+
+async def submit_broker_levels(cursor, trade_id: int) -> bool:
+    """Place the trade's pending levels as native broker orders.
+
+    All-or-nothing: if any order fails, the ones already placed are cancelled
+    and the levels stay on client-side monitoring. Returns True when the
+    levels are now working at the broker.
+    """
+    cursor.execute("""
+        SELECT t.symbol, t.action, t.quantity, a.api_key, a.api_secret, a.account_type, a.broker
+        FROM trades t
+        JOIN accounts a ON t.account_id = a.id
+        WHERE t.id = %s
+    """, (trade_id,))
+    row = cursor.fetchone()
+    if not row:
+        return False
+    symbol, action, total_quantity, api_key, api_secret, account_type, broker = row
+    if broker != 'alpaca':
+        return False
+
+    cursor.execute("""
+        SELECT id, price, shares_quantity FROM take_profit_levels
+        WHERE trade_id = %s AND status = 'pending'
+        ORDER BY level_number
+    """, (trade_id,))
+    tp_levels = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT id, price FROM stop_loss_levels
+        WHERE trade_id = %s AND status = 'active'
+        ORDER BY id LIMIT 1
+    """, (trade_id,))
+    sl_level = cursor.fetchone()
+
+    if not tp_levels and not sl_level:
+        return False
+
+    remainder = float(total_quantity) - sum(float(level[2]) for level in tp_levels)
+    quantities = [level[2] for level in tp_levels] + ([remainder] if sl_level and remainder > 0 else [])
+    if not all(_is_whole(quantity) for quantity in quantities):
+        logger.info(f"Trade {trade_id}: fractional level quantities, keeping client-side monitoring")
+        return False
+
+    from alpaca_client import AlpacaClient
+    client = AlpacaClient(api_key=api_key, secret_key=api_secret, paper=(account_type == 'paper'))
+    exit_action = 'SELL' if action.upper() == 'BUY' else 'BUY'
+    placed: List[Dict[str, Optional[str]]] = []
+    tp_orders = []
+    remainder_order_id = None
+
+    try:
+        for level_id, tp_price, quantity in tp_levels:
+            client_order_id = f"native-tp-{level_id}"
+            if sl_level:
+                order = await _submit(client, client_order_id, lambda: client.place_oco_order(
+                    symbol, exit_action, int(float(quantity)), float(tp_price), float(sl_level[1]),
+                    client_order_id=client_order_id
+                ))
+            else:
+                order = await _submit(client, client_order_id, lambda: _as_order(client.place_order(
+                    symbol=symbol, action=exit_action, quantity=int(float(quantity)),
+                    order_type='limit', limit_price=float(tp_price), time_in_force='gtc',
+                    client_order_id=client_order_id
+                )))
+            placed.append(order)
+            tp_orders.append((level_id, order))
+
+        if sl_level and remainder > 0:
+            client_order_id = f"native-sl-{sl_level[0]}"
+            order = await _submit(client, client_order_id, lambda: _as_order(client.place_order(
+                symbol=symbol, action=exit_action, quantity=int(remainder),
+                order_type='stop', stop_price=float(sl_level[1]), time_in_force='gtc',
+                client_order_id=client_order_id
+            )))
+            placed.append(order)
+            remainder_order_id = order['id']
+
+    except Exception as e:
+        logger.error(f"Trade {trade_id}: broker-native levels failed ({e}), keeping client-side monitoring")
+        for order in placed:
+            await client.cancel_order(order['id'])
+        return False
+
+    for level_id, order in tp_orders:
+        cursor.execute("""
+            UPDATE take_profit_levels
+            SET status = 'working', execution_mode = 'broker',
+                broker_order_id = %s, stop_leg_order_id = %s
+            WHERE id = %s
+        """, (order['id'], order.get('stop_leg_id'), level_id))
+
+    if sl_level:
+        cursor.execute("""
+            UPDATE stop_loss_levels
+            SET status = 'working', execution_mode = 'broker', broker_order_id = %s
+            WHERE id = %s
+        """, (remainder_order_id, sl_level[0]))
+
+    logger.info(f"Trade {trade_id}: {len(placed)} exit orders working at the broker")
+    return True
+
+
+def _notify(cursor, user_id: int, trade_id: int, notification_type: str, data: Dict):
+    cursor.execute("""
+        INSERT INTO trade_notifications (user_id, trade_id, notification_type, data, created_at)
+        VALUES (%s, %s, %s, %s, NOW())
+    """, (user_id, trade_id, notification_type, json.dumps(data)))
+
+
+async def reconcile_broker_levels(cursor, client: AlpacaClient, account_id: int, trade_id: int = None) -> int:
+    """Apply broker fills/cancellations to this account's working levels. Returns API calls made."""
+    api_calls_made = 0
+
+    cursor.execute("""
+        SELECT tp.id, tp.trade_id, tp.level_number, tp.shares_quantity,
+               tp.broker_order_id, tp.stop_leg_order_id, t.symbol, t.user_id, t.action
+        FROM take_profit_levels tp
+        JOIN trades t ON tp.trade_id = t.id
+        WHERE t.account_id = %s AND tp.status = 'working'
+        AND (%s::int IS NULL OR t.id = %s)
+    """, (account_id, trade_id, trade_id))
+
+    for level_id, level_trade_id, level_number, quantity, order_id, stop_leg_id, symbol, user_id, action in cursor.fetchall():
+        order = await client.get_order_with_legs(order_id)
+        api_calls_made += 1
+        if not order:
+            continue
+
+        stop_leg = next((leg for leg in order['legs'] if leg['id'] == stop_leg_id), None)
+
+        if order['status'] == 'filled':
+            cursor.execute("""
+                UPDATE take_profit_levels
+                SET status = 'executed', executed_at = NOW(), executed_price = %s
+                WHERE id = %s AND status = 'working'
+            """, (order['filled_avg_price'], level_id))
+            apply_fill(cursor, account_id, order_id, symbol, 'sell' if action.upper() == 'BUY' else 'buy',
+                       float(quantity), order['filled_avg_price'], order['filled_at'])
+            _notify(cursor, user_id, level_trade_id, 'take_profit_executed', {
+                'level_number': level_number,
+                'executed_price': order['filled_avg_price'],
+                'quantity': float(quantity),
+                'symbol': symbol,
+                'broker_order_id': order_id
+            })
+            logger.info(f"🎯 Broker take profit filled: {symbol} Level {level_number} at ${order['filled_avg_price']}")
+
+        elif stop_leg and stop_leg['status'] == 'filled':
+            # This slice was stopped out - the stop loss row is finalized below
+            cursor.execute("""
+                UPDATE take_profit_levels
+                SET status = 'cancelled', executed_at = NOW(), executed_price = %s
+                WHERE id = %s AND status = 'working'
+            """, (stop_leg['filled_avg_price'], level_id))
+
+        elif order['status'] in DEAD_ORDER_STATUSES and (not stop_leg or stop_leg['status'] in DEAD_ORDER_STATUSES):
+            # Nothing working at the broker any more - hand back to client-side monitoring
+            cursor.execute("""
+                UPDATE take_profit_levels
+                SET status = 'pending', execution_mode = 'monitor'
+                WHERE id = %s AND status = 'working'
+            """, (level_id,))
+            logger.warning(f"Broker order {order_id} for TP level {level_id} is {order['status']}, monitoring it client-side")
+
+    cursor.execute("""
+        SELECT sl.id, sl.trade_id, sl.broker_order_id, t.symbol, t.user_id, t.quantity
+        FROM stop_loss_levels sl
+        JOIN trades t ON sl.trade_id = t.id
+        WHERE t.account_id = %s AND sl.status = 'working'
+        AND (%s::int IS NULL OR t.id = %s)
+    """, (account_id, trade_id, trade_id))
+
+    for sl_id, sl_trade_id, remainder_order_id, symbol, user_id, total_quantity in cursor.fetchall():
+        remainder_filled_qty = 0.0
+        remainder_price = None
+        if remainder_order_id:
+            order = await client.get_order_with_legs(remainder_order_id)
+            api_calls_made += 1
+            if not order or order['status'] not in ('filled',) + DEAD_ORDER_STATUSES:
+                continue  # Remainder stop still working
+            if order['status'] == 'filled':
+                remainder_filled_qty = order['filled_qty']
+                remainder_price = order['filled_avg_price']
+
+        cursor.execute("""
+            SELECT COUNT(*) FILTER (WHERE status = 'working'),
+                   COALESCE(SUM(shares_quantity) FILTER (WHERE status = 'cancelled' AND executed_price IS NOT NULL), 0),
+                   MAX(executed_price) FILTER (WHERE status = 'cancelled' AND executed_price IS NOT NULL)
+            FROM take_profit_levels
+            WHERE trade_id = %s AND execution_mode = 'broker'
+        """, (sl_trade_id,))
+        still_working, stopped_shares, stopped_price = cursor.fetchone()
+        if still_working:
+            continue
+
+        stopped_shares = float(stopped_shares) + remainder_filled_qty
+        if stopped_shares <= 0:
+            # Every slice filled at its take profit - nothing left to protect
+            cursor.execute("""
+                UPDATE stop_loss_levels SET status = 'cancelled', executed_at = NOW()
+                WHERE id = %s AND status = 'working'
+            """, (sl_id,))
+            continue
+
+        exit_price = remainder_price or float(stopped_price)
+        cursor.execute("""
+            UPDATE stop_loss_levels
+            SET status = 'executed', executed_at = NOW(), executed_price = %s, executed_shares = %s
+            WHERE id = %s AND status = 'working'
+        """, (exit_price, stopped_shares, sl_id))
+        cursor.execute("""
+            UPDATE trades
+            SET status = 'closed', close_reason = 'stop_loss', exit_price = %s, closed_at = NOW()
+            WHERE id = %s
+        """, (exit_price, sl_trade_id))
+        _notify(cursor, user_id, sl_trade_id, 'stop_loss_executed', {
+            'executed_price': exit_price,
+            'total_quantity': stopped_shares,
+            'symbol': symbol,
+            'broker_order_id': remainder_order_id,
+            'broker_native': True
+        })
+        logger.info(f"🛑 Broker stop loss filled: {symbol} {stopped_shares} shares at ${exit_price}")
+
+    return api_calls_made
+
+
+def _order_settled(order: Dict) -> bool:
+    """Neither the order nor any of its legs can still fill"""
+    statuses = [order['status']] + [leg['status'] for leg in order.get('legs') or []]
+    return all(status == 'filled' or status in DEAD_ORDER_STATUSES for status in statuses)
+
+
+def _order_sold_nothing(order: Dict) -> bool:
+    return order['status'] in DEAD_ORDER_STATUSES and not order['filled_qty'] and not any(
+        leg['filled_qty'] for leg in order.get('legs') or [])
+
+
+async def _cancel_and_settle(client: AlpacaClient, order_id: str) -> Optional[Dict]:
+    """Cancel an order and re-fetch it until it is settled; None if it may still fill"""
+    cancelled = await client.cancel_order(order_id)  # Cancelling an OCO parent cancels its stop leg too
+    for attempt in range(CANCEL_CONFIRM_ATTEMPTS):
+        order = await client.get_order_with_legs(order_id)
+        if order and _order_settled(order):
+            return order
+        if attempt < CANCEL_CONFIRM_ATTEMPTS - 1:
+            await asyncio.sleep(CANCEL_CONFIRM_INTERVAL_SECONDS)
+    logger.warning(f"Broker order {order_id} not settled after cancel "
+                   f"({'accepted' if cancelled else 'rejected'} by the broker), leaving its level working")
+    return None
+
+
+async def cancel_broker_levels(cursor, client: AlpacaClient, account_id: int, trade_id: int) -> Tuple[int, int]:
+    """Cancel a trade's working broker orders (e.g. before selling the position manually).
+
+    Every cancelled order is re-fetched until it can no longer fill. Levels whose
+    order is confirmed cancelled without selling anything go back to
+    'pending'/'active'; fills that raced the cancel are then applied by a second
+    reconcile, so trades.remaining_quantity is current. Levels whose order could
+    not be confirmed stay 'working'.
+    Returns (levels handed back, levels still working) - callers must not sell
+    while any level is still working.
+    """
+    await reconcile_broker_levels(cursor, client, account_id, trade_id)
+
+    cursor.execute("""
+        SELECT id, broker_order_id FROM take_profit_levels
+        WHERE trade_id = %s AND status = 'working' AND broker_order_id IS NOT NULL
+    """, (trade_id,))
+    tp_levels = cursor.fetchall()
+    cursor.execute("""
+        SELECT id, broker_order_id FROM stop_loss_levels
+        WHERE trade_id = %s AND status = 'working'
+    """, (trade_id,))
+    sl_levels = cursor.fetchall()
+    if not tp_levels and not sl_levels:
+        return 0, 0
+
+    cursor.execute("SELECT symbol, action FROM trades WHERE id = %s", (trade_id,))
+    symbol, action = cursor.fetchone()
+    handed_back = 0
+    unsettled = 0
+    stop_filled = False  # An OCO stop leg or the remainder stop sold shares - the stop loss must be booked
+
+    for level_id, order_id in tp_levels:
+        order = await _cancel_and_settle(client, order_id)
+        if order is None:
+            unsettled += 1
+            continue
+        if any(leg['status'] == 'filled' or leg['filled_qty'] for leg in order['legs']):
+            stop_filled = True
+        if _order_sold_nothing(order):
+            cursor.execute("""
+                UPDATE take_profit_levels SET status = 'pending', execution_mode = 'monitor'
+                WHERE id = %s AND status = 'working'
+            """, (level_id,))
+            handed_back += cursor.rowcount
+        elif order['status'] in DEAD_ORDER_STATUSES and order['filled_qty']:
+            # Cancelled mid-fill: book what it sold; the rest returns to the trade's remaining quantity
+            cursor.execute("""
+                UPDATE take_profit_levels
+                SET status = 'executed', executed_at = NOW(), executed_price = %s, shares_quantity = %s
+                WHERE id = %s AND status = 'working'
+            """, (order['filled_avg_price'], order['filled_qty'], level_id))
+            apply_fill(cursor, account_id, order_id, symbol, 'sell' if action.upper() == 'BUY' else 'buy',
+                       order['filled_qty'], order['filled_avg_price'], order['updated_at'])
+        # Filled orders stay working for the reconcile below
+
+    for level_id, order_id in sl_levels:
+        if order_id:
+            order = await _cancel_and_settle(client, order_id)
+            if order is None:
+                unsettled += 1
+                continue
+            if not _order_sold_nothing(order):
+                stop_filled = True
+                continue
+        if not stop_filled and not unsettled:
+            cursor.execute("""
+                UPDATE stop_loss_levels SET status = 'active', execution_mode = 'monitor'
+                WHERE id = %s AND status = 'working'
+            """, (level_id,))
+            handed_back += cursor.rowcount
+
+    # Book fills that happened between the first reconcile and the cancels
+    await reconcile_broker_levels(cursor, client, account_id, trade_id)
+
+    cursor.execute("""
+        SELECT (SELECT COUNT(*) FROM take_profit_levels WHERE trade_id = %s AND status = 'working')
+             + (SELECT COUNT(*) FROM stop_loss_levels WHERE trade_id = %s AND status = 'working')
+    """, (trade_id, trade_id))
+    still_working = cursor.fetchone()[0]
+    if still_working:
+        logger.warning(f"Trade {trade_id}: {still_working} broker level(s) still working after cancel")
+    return handed_back, still_working
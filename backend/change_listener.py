@@ -0,0 +1,198 @@
+"""
+Database change listener
+
+Postgres triggers on trades, take_profit_levels, stop_loss_levels and signals
+publish a NOTIFY on the 'table_changes' channel. ChangeListener holds one
+dedicated LISTEN connection and wakes the asyncio.Events of whoever
+subscribed to the changed table, so the Script Manager can run a process as
+soon as something relevant changes instead of on a fixed timer.
+
+Only meaningful changes notify: price-only updates to trades (current_price,
+floating_pnl written by the price updater) do not fire.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'table_changes'
+WATCHED_TABLES = ('trades', 'take_profit_levels', 'stop_loss_levels', 'signals')
+
+# Column changes on UPDATE that are worth waking processes for
+TRIGGER_UPDATE_COLUMNS = {
+    'trades': ('status', 'quantity', 'remaining_quantity', 'broker_order_id', 'broker_fill_price'),
+    'take_profit_levels': ('status', 'price', 'override_price', 'shares_quantity'),
+    'stop_loss_levels': ('status', 'price', 'override_price'),
+    'signals': ('status',),
+}
+
+KEEPALIVE_SECONDS = float(os.getenv('CHANGE_LISTENER_KEEPALIVE_SECONDS', '60'))
+RECONNECT_MAX_SECONDS = 30.0
+
+
+def install_notify_triggers(cursor):
+    """Create the notify function and per-table triggers (idempotent)"""
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+        DECLARE
+            row_data RECORD;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data := OLD;
+            ELSE
+                row_data := NEW;
+            END IF;
+            PERFORM pg_notify('{CHANNEL}', json_build_object(
+                'table', TG_TABLE_NAME,
+                'op', TG_OP,
+                'id', row_data.id
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    for table in WATCHED_TABLES:
+        condition = ' OR '.join(
+            f"OLD.{column} IS DISTINCT FROM NEW.{column}" for column in TRIGGER_UPDATE_COLUMNS[table]
+        )
+
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_notify_update ON {table}")
+
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_notify_change
+            AFTER INSERT OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_table_change()
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_notify_update
+            AFTER UPDATE ON {table}
+            FOR EACH ROW
+            WHEN ({condition})
+            EXECUTE FUNCTION notify_table_change()
+        """)
+
+
+class ChangeListener:
+    """Single LISTEN connection fanning table change notifications out to asyncio.Events"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, List[asyncio.Event]] = defaultdict(list)
+        self.connected = False
+        self.notifications_received = 0
+        self._conn = None
+        self._lost: Optional[asyncio.Event] = None
+
+    def subscribe(self, tables, event: asyncio.Event):
+        """Set event whenever one of tables changes"""
+        for table in tables:
+            self.subscribers[table].append(event)
+
+    def _dispatch(self, payload: str):
+        try:
+            table = json.loads(payload).get('table')
+        except (ValueError, AttributeError):
+            return
+
+        self.notifications_received += 1
+        for event in self.subscribers.get(table, []):
+            event.set()
+
+    def _drain(self):
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            self._dispatch(notify.payload)
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+            self._drain()
+        except Exception as e:
+            logger.warning(f"[LISTENER] Connection lost: {e}")
+            self._lost.set()
+
+    def _connect(self):
+        conn = get_db_connection()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def _close(self, loop):
+        self.connected = False
+        if self._conn is not None:
+            try:
+                loop.remove_reader(self._conn.fileno())
+            except Exception:
+                pass
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _wake_all(self):
+        """Wake every subscriber so nothing is missed across a reconnect"""
+        for events in self.subscribers.values():
+            for event in events:
+                event.set()
+
+    async def run(self, shutdown_event: asyncio.Event):
+        """Keep the LISTEN connection alive until shutdown"""
+        loop = asyncio.get_running_loop()
+        backoff = 1.0
+
+        while not shutdown_event.is_set():
+            try:
+                self._conn = await loop.run_in_executor(None, self._connect)
+                self._lost = asyncio.Event()
+                try:
+                    loop.add_reader(self._conn.fileno(), self._on_readable)
+                    poll_seconds = None
+                except NotImplementedError:
+                    # Windows proactor loop has no add_reader - poll the socket instead
+                    poll_seconds = 1.0
+                self.connected = True
+                backoff = 1.0
+                logger.info(f"[LISTENER] Listening on '{CHANNEL}'")
+                self._wake_all()
+
+                last_keepalive = loop.time()
+                while not shutdown_event.is_set() and not self._lost.is_set():
+                    try:
+                        await asyncio.wait_for(self._lost.wait(), timeout=poll_seconds or KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        if poll_seconds:
+                            self._on_readable()
+                        if loop.time() - last_keepalive >= KEEPALIVE_SECONDS:
+                            # Detect half-open connections the socket never reports
+                            self._conn.cursor().execute("SELECT 1")
+                            self._drain()
+                            last_keepalive = loop.time()
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"[LISTENER] {e} - retrying in {backoff:.0f}s")
+
+            self._close(loop)
+
+            if shutdown_event.is_set():
+                break
+
+            try:
+                await asyncio.wait_for(shutdown_event.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+        self._close(loop)
+
@@ -0,0 +1,135 @@
+"""
+Check that the level monitor / trade sync hot queries use their indexes
+
+Runs EXPLAIN on each hot query and exits non-zero if an expected index is
+missing from the plan. Sequential scans are disabled for the check so the
+result does not depend on how many rows the tables currently hold - on a
+small database the planner would otherwise (correctly) prefer a seq scan.
+
+Usage: python check_query_plans.py [account_id]
+"""
+import json
+import sys
+from typing import Any, Dict, List, Set
+
+from db import get_db_connection
+
+# name -> (sql, params builder, groups of index names; each group needs one hit)
+HOT_QUERIES = {
+    "level_monitor.active_accounts": (
+        """
+        SELECT DISTINCT a.id, a.api_key, a.api_secret, a.account_type
+        FROM accounts a
+        WHERE a.is_active = TRUE
+        AND a.broker = 'alpaca'
+        AND (
+            EXISTS (
+                SELECT 1 FROM take_profit_levels tp
+                JOIN trades t ON tp.trade_id = t.id
+                WHERE t.account_id = a.id AND tp.status = 'pending' AND t.status = 'filled'
+            )
+            OR EXISTS (
+                SELECT 1 FROM stop_loss_levels sl
+                JOIN trades t ON sl.trade_id = t.id
+                WHERE t.account_id = a.id AND sl.status = 'active' AND t.status = 'filled'
+            )
+        )
+        """,
+        lambda account_id: (),
+        [
+            {"idx_take_profit_levels_pending_trade", "idx_trades_account_status"},
+            {"idx_stop_loss_levels_active_trade", "idx_trades_account_status"},
+        ]
+    ),
+    "level_monitor.active_levels": (
+        """
+        SELECT 'take_profit', tp.id, tp.trade_id, tp.price, tp.shares_quantity, tp.level_number,
+               t.symbol, t.action
+        FROM take_profit_levels tp
+        JOIN trades t ON tp.trade_id = t.id
+        WHERE t.account_id = %s
+        AND t.status IN ('filled', 'closed')
+        AND tp.status = 'pending'
+        UNION ALL
+        SELECT 'stop_loss', sl.id, sl.trade_id, sl.price, t.remaining_quantity, NULL,
+               t.symbol, t.action
+        FROM stop_loss_levels sl
+        JOIN trades t ON sl.trade_id = t.id
+        WHERE t.account_id = %s
+        AND t.status IN ('filled', 'closed')
+        AND sl.status = 'active'
+        AND t.remaining_quantity > 0
+        """,
+        lambda account_id: (account_id, account_id),
+        [{"idx_take_profit_levels_pending_trade"}, {"idx_stop_loss_levels_active_trade"}]
+    ),
+    "trade_sync.pending_trades": (
+        """
+        SELECT id, broker_order_id, symbol, status
+        FROM trades
+        WHERE account_id = %s
+        AND status = 'pending'
+        AND broker_order_id IS NOT NULL
+        """,
+        lambda account_id: (account_id,),
+        [{"idx_trades_account_status"}]
+    ),
+    "trades.by_broker_order_id": (
+        """
+        SELECT id, entry_price, quantity, action, status, symbol
+        FROM trades
+        WHERE broker_order_id = %s
+        """,
+        lambda account_id: ("00000000-0000-0000-0000-000000000000",),
+        [{"idx_trades_broker_order_id"}]
+    ),
+}
+
+def collect_index_names(plan: Dict[str, Any], found: Set[str]) -> Set[str]:
+    """Walk an EXPLAIN (FORMAT JSON) plan tree collecting every index used"""
+    if "Index Name" in plan:
+        found.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        collect_index_names(child, found)
+    return found
+
+def check_query_plans(account_id: int = 0) -> List[str]:
+    """Return a list of failure messages, empty when every hot query uses its indexes"""
+    conn = get_db_connection()
+    failures = []
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET LOCAL enable_seqscan = off")
+
+        for name, (sql, params, expected_groups) in HOT_QUERIES.items():
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params(account_id))
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            used = collect_index_names(plan[0]["Plan"], set())
+
+            for group in expected_groups:
+                if not used & group:
+                    failures.append(
+                        f"{name}: expected one of {sorted(group)}, plan used {sorted(used) or 'no indexes'}"
+                    )
+                    break
+            else:
+                print(f"✅ {name}: {', '.join(sorted(used))}")
+
+    finally:
+        conn.rollback()
+        conn.close()
+
+    return failures
+
+if __name__ == "__main__":
+    account_id = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    failures = check_query_plans(account_id)
+
+    for failure in failures:
+        print(f"❌ {failure}")
+
+    sys.exit(1 if failures else 0)
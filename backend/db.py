@@ -1,9 +1,18 @@
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 import os
+import time
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 
+from query_stats import record_statement
+from webhook_logs import create_webhook_logs_table, ensure_partitions, get_webhook_logs_kind
+from pending_intents import create_pending_intents_table
+from signal_latency import create_signal_latency_table
+from positions_mirror import create_account_positions_table
+from asset_cache import create_assets_table
+
 load_dotenv()
 
 # Database configuration
@@ -15,6 +24,44 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'postgres')
 }
 
+_instrumented_cursors = {}
+
+def _instrumented_cursor(cursor_class):
+    """Subclass of cursor_class that times every statement and reports it to query_stats"""
+    instrumented = _instrumented_cursors.get(cursor_class)
+    if instrumented is None:
+        class InstrumentedCursor(cursor_class):
+            def execute(self, query, vars=None):
+                start = time.perf_counter()
+                failed = True
+                try:
+                    result = super().execute(query, vars)
+                    failed = False
+                    return result
+                finally:
+                    record_statement(self, query, vars, time.perf_counter() - start, failed)
+
+            def executemany(self, query, vars_list):
+                start = time.perf_counter()
+                failed = True
+                try:
+                    result = super().executemany(query, vars_list)
+                    failed = False
+                    return result
+                finally:
+                    record_statement(self, query, None, time.perf_counter() - start, failed, many=True)
+
+        instrumented = _instrumented_cursors[cursor_class] = InstrumentedCursor
+    return instrumented
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors (any cursor_factory) are timed and fingerprinted"""
+
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _instrumented_cursor(cursor_class)
+        return super().cursor(*args, **kwargs)
+
 def get_db_connection():
     """Create database connection with support for DATABASE_URL"""
     
@@ -27,7 +74,7 @@ def get_db_connection():
         if database_url.startswith('postgres://'):
             database_url = database_url.replace('postgres://', 'postgresql://', 1)
         
-        return psycopg2.connect(database_url)
+        return psycopg2.connect(database_url, connection_factory=InstrumentedConnection)
     else:
         # Fall back to individual variables
         return psycopg2.connect(
@@ -35,7 +82,8 @@ def get_db_connection():
             database=os.getenv('DB_NAME'),
             user=os.getenv('DB_USER'),
             password=os.getenv('DB_PASSWORD'),
-            port=os.getenv('DB_PORT', 5432)
+            port=os.getenv('DB_PORT', 5432),
+            connection_factory=InstrumentedConnection
         )
 
 def init_db():
@@ -127,21 +175,25 @@ def init_db():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol ON trades(symbol)")
         
-        # Create webhook_logs table for security and debugging
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS webhook_logs (
-                id SERIAL PRIMARY KEY,
-                instance_id VARCHAR(255),
-                event_type VARCHAR(50),
-                payload JSONB,
-                processed BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        # Create trade_pending_intents table for work applied when orders fill
+        create_pending_intents_table(cursor)
+        
+        # Create signal_latency table for per-stage signal-to-fill timestamps
+        create_signal_latency_table(cursor)
+        
+        # Create account_positions mirror (positions served to the API without a broker round trip)
+        create_account_positions_table(cursor)
+        
+        # Create assets table (daily broker asset snapshot behind the asset cache)
+        create_assets_table(cursor)
         
-        # Create indexes for webhook_logs
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_webhook_logs_created_at ON webhook_logs(created_at)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_webhook_logs_processed ON webhook_logs(processed)")
+        # Create webhook_logs table for security and debugging (partitioned by day)
+        webhook_logs_kind = get_webhook_logs_kind(cursor)
+        if webhook_logs_kind is None:
+            create_webhook_logs_table(cursor)
+            ensure_partitions(cursor)
+        elif webhook_logs_kind != 'p':
+            print("webhook_logs is not partitioned - run migrations/partition_webhook_logs.py")
         
         conn.commit()
         print("Database tables created successfully!")
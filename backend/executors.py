@@ -0,0 +1,157 @@
+"""
+Worker pools for blocking and CPU-bound work
+
+async endpoints must not run bcrypt, long pure-Python loops or large JSON
+encoding on the event loop - while they do, webhook acks, level execution and
+every other request wait. run_in_pool() hands such work to a named pool:
+
+    auth  threads    bcrypt hashing/verification (releases the GIL)    AUTH_EXECUTOR_WORKERS
+    cpu   processes  FIFO P&L matching (pnl.py)                        CPU_EXECUTOR_WORKERS
+    json  threads    encoding large API responses                      JSON_EXECUTOR_WORKERS
+
+Pools are created on first use. Functions sent to the 'cpu' pool and their
+arguments must be picklable (module-level functions, plain data). Queue depth,
+running tasks and wait/run times are exported per pool on /metrics and listed
+in /api/script-manager/status.
+"""
+
+import os
+import time
+import json
+import asyncio
+import logging
+import functools
+import contextvars
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from metrics import EXECUTOR_QUEUED, EXECUTOR_RUNNING, EXECUTOR_TASK_SECONDS, EXECUTOR_TASKS
+
+logger = logging.getLogger(__name__)
+
+# Responses with fewer items are encoded inline - a thread hop costs more than it saves
+JSON_OFFLOAD_MIN_ITEMS = int(os.getenv('JSON_OFFLOAD_MIN_ITEMS', '200'))
+
+
+class WorkerPool:
+    def __init__(self, name: str, workers: int, processes: bool = False):
+        self.name = name
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.in_flight = 0
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    # spawn: forking a process that runs an event loop and threads is not safe.
+                    # Workers re-import the __main__ module; main.py only serves under __name__ == "__main__"
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix=f'{self.name}-pool')
+                logger.info(f"[EXECUTORS] Started '{self.name}' pool with {self.workers} "
+                            f"{'processes' if self.processes else 'threads'}")
+            return self._executor
+
+    def _update_gauges(self):
+        # Pools run min(workers, in_flight) tasks; the rest wait in the pool's queue
+        EXECUTOR_RUNNING.set(min(self.in_flight, self.workers), self.name)
+        EXECUTOR_QUEUED.set(max(0, self.in_flight - self.workers), self.name)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "kind": "processes" if self.processes else "threads",
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "running": min(self.in_flight, self.workers),
+            "queued": max(0, self.in_flight - self.workers),
+            "wait_seconds": EXECUTOR_TASK_SECONDS.summary(self.name, 'wait'),
+            "run_seconds": EXECUTOR_TASK_SECONDS.summary(self.name, 'run')
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+pools: Dict[str, WorkerPool] = {
+    'auth': WorkerPool('auth', int(os.getenv('AUTH_EXECUTOR_WORKERS', '4'))),
+    'cpu': WorkerPool('cpu', int(os.getenv('CPU_EXECUTOR_WORKERS', '2')), processes=True),
+    'json': WorkerPool('json', int(os.getenv('JSON_EXECUTOR_WORKERS', '2'))),
+}
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Runs in the worker; returns when the task started so the wait can be measured"""
+    started = time.time()
+    return started, fn(*args, **kwargs)
+
+
+async def run_in_pool(pool_name: str, fn: Callable, *args, **kwargs) -> Any:
+    """Run fn(*args, **kwargs) in the named pool and await the result"""
+    pool = pools[pool_name]
+    call = functools.partial(_timed_call, fn, args, kwargs)
+    if not pool.processes:
+        # Threads keep the caller's context, so statements stay attributed to the endpoint
+        call = functools.partial(contextvars.copy_context().run, call)
+
+    submitted = time.time()
+    pool.in_flight += 1
+    pool._update_gauges()
+    try:
+        started, result = await asyncio.get_running_loop().run_in_executor(pool.executor, call)
+    except BrokenProcessPool:
+        # A worker died (OOM kill, segfault) - start a fresh pool for the next task
+        logger.error(f"[EXECUTORS] '{pool_name}' pool is broken, restarting it on next use")
+        EXECUTOR_TASKS.inc(pool_name, 'error')
+        pool.shutdown()
+        raise
+    except BaseException:
+        EXECUTOR_TASKS.inc(pool_name, 'error')
+        raise
+    finally:
+        pool.in_flight -= 1
+        pool._update_gauges()
+
+    finished = time.time()
+    EXECUTOR_TASK_SECONDS.observe(max(0.0, started - submitted), pool_name, 'wait')
+    EXECUTOR_TASK_SECONDS.observe(max(0.0, finished - started), pool_name, 'run')
+    EXECUTOR_TASKS.inc(pool_name, 'success')
+    return result
+
+
+def _encode_json(content: Any) -> bytes:
+    # Same output as FastAPI's default JSONResponse
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')
+    ).encode('utf-8')
+
+
+async def json_response(content: Any) -> Any:
+    """Encode a large list response in the 'json' pool; small ones are returned for FastAPI to encode"""
+    if not isinstance(content, (list, tuple)) or len(content) < JSON_OFFLOAD_MIN_ITEMS:
+        return content
+    body = await run_in_pool('json', _encode_json, content)
+    return Response(content=body, media_type='application/json')
+
+
+def executors_summary() -> Dict[str, Dict[str, Any]]:
+    return {name: pool.summary() for name, pool in pools.items()}
+
+
+def shutdown_executors():
+    for pool in pools.values():
+        pool.shutdown()
@@ -0,0 +1,739 @@
+#!/usr/bin/env python3
+"""
+Local fake Alpaca broker for benchmarks and offline testing
+
+Implements the parts of the Alpaca API this app uses, in memory:
+
+- Trading REST (/v2): account, orders (market/limit/stop/stop_limit, OCO with
+  a stop leg, client_order_id lookup and uniqueness), positions, close
+  position, clock, assets
+- Market data REST (/v2/stocks/...): latest quotes and trades
+- Trading stream websocket (/stream): authenticate, listen, trade_updates
+- Market data websocket (/v2/{feed}): auth, subscribe trades/quotes (JSON,
+  or msgpack when the client asks for it)
+
+Prices follow a deterministic path: a scripted per-symbol list of prices, or a
+seeded random walk for any other symbol. Each tick moves every known symbol
+one step and fills resting orders the step crosses. Market orders fill at
+once at the current price, limit orders at their limit price, and stop orders
+at the first price at or beyond the stop, so the same script and seed always
+produce the same fills.
+
+Any key/secret pair is accepted; each API key gets its own account.
+
+Usage:
+    python fake_alpaca.py [--port 8765] [--prices prices.json] [--tick 1.0]
+                          [--seed 1] [--latency-ms 0] [--rate-limit 0]
+
+    prices.json: {"AAPL": [190.0, 190.4, 191.2, ...], ...}
+
+Point the app at it with:
+    ALPACA_URL_OVERRIDE=http://localhost:8765
+    ALPACA_STREAM_URL_OVERRIDE=ws://localhost:8765/stream
+
+Control endpoints (no auth):
+    POST /_fake/prices  {"AAPL": 191.5}     set prices (fills crossed orders)
+    POST /_fake/step?n=1                    advance the price path n ticks
+    POST /_fake/config  {"latency_ms": 50, "rate_limit_per_minute": 200}
+    GET  /_fake/stats                       request counts per endpoint
+    GET  /_fake/orders?since=<epoch>        orders across all accounts
+    POST /_fake/reset                       drop all accounts, orders and stats
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import msgpack
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
+
+STARTING_CASH = 100000.0
+OPEN_STATUSES = ('new', 'accepted', 'held', 'partially_filled')
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def initial_price(symbol: str) -> float:
+    """Stable starting price for a symbol without a script (20.00 - 500.00)"""
+    return round(20 + (zlib.crc32(symbol.encode()) % 48000) / 100, 2)
+
+
+def format_qty(qty: float) -> str:
+    return str(int(qty)) if qty == int(qty) else str(qty)
+
+
+def api_error(status_code: int, code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"code": code, "message": message})
+
+
+class PricePath:
+    """Scripted prices per symbol, then a seeded random walk"""
+
+    def __init__(self, script: Dict[str, List[float]], seed: int, volatility: float):
+        self.script = {symbol.upper(): list(prices) for symbol, prices in script.items()}
+        self.rng = random.Random(seed)
+        self.volatility = volatility
+        self.step_index = 0
+        self.prices: Dict[str, float] = {symbol: prices[0] for symbol, prices in self.script.items() if prices}
+
+    def price(self, symbol: str) -> float:
+        if symbol not in self.prices:
+            self.prices[symbol] = initial_price(symbol)
+        return self.prices[symbol]
+
+    def step(self) -> Dict[str, float]:
+        """Advance every known symbol one tick and return the new prices"""
+        self.step_index += 1
+        for symbol in sorted(self.prices):
+            scripted = self.script.get(symbol)
+            if scripted:
+                self.prices[symbol] = scripted[min(self.step_index, len(scripted) - 1)]
+            else:
+                move = self.rng.gauss(0, self.volatility)
+                self.prices[symbol] = round(max(0.01, self.prices[symbol] * (1 + move)), 2)
+        return dict(self.prices)
+
+
+class FakeAccount:
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.id = str(uuid.uuid5(uuid.NAMESPACE_OID, api_key))
+        self.cash = STARTING_CASH
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.client_order_ids: Dict[str, str] = {}
+        self.positions: Dict[str, Dict[str, float]] = {}  # symbol -> {qty (signed), avg_entry_price}
+        self.request_times: deque = deque()
+        self.streams: List[WebSocket] = []
+
+
+class FakeBroker:
+    """All broker state; accessed only from the server's event loop"""
+
+    def __init__(self, path: PricePath, latency_ms: float = 0, rate_limit_per_minute: int = 0,
+                 market_open: bool = True):
+        self.path = path
+        self.latency_ms = latency_ms
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.market_open = market_open
+        self.accounts: Dict[str, FakeAccount] = {}
+        self.stats: Counter = Counter()
+        self.data_subscribers: Dict[WebSocket, Dict[str, Any]] = {}
+        self.data_trade_id = 0
+
+    def account(self, api_key: str) -> FakeAccount:
+        if api_key not in self.accounts:
+            self.accounts[api_key] = FakeAccount(api_key)
+        return self.accounts[api_key]
+
+    def rate_limited(self, account: FakeAccount) -> bool:
+        if not self.rate_limit_per_minute:
+            return False
+        now = time.monotonic()
+        while account.request_times and now - account.request_times[0] > 60:
+            account.request_times.popleft()
+        if len(account.request_times) >= self.rate_limit_per_minute:
+            return True
+        account.request_times.append(now)
+        return False
+
+    # Orders
+
+    def new_order(self, account: FakeAccount, body: Dict[str, Any], parent_id: Optional[str] = None) -> Dict[str, Any]:
+        timestamp = now_iso()
+        order_type = body.get('type') or body.get('order_type') or 'market'
+        order = {
+            "id": str(uuid.uuid4()),
+            "client_order_id": body.get('client_order_id') or str(uuid.uuid4()),
+            "created_at": timestamp,
+            "updated_at": timestamp,
+            "submitted_at": timestamp,
+            "filled_at": None,
+            "expired_at": None,
+            "canceled_at": None,
+            "failed_at": None,
+            "replaced_at": None,
+            "replaced_by": None,
+            "replaces": None,
+            "asset_id": str(uuid.uuid5(uuid.NAMESPACE_OID, body['symbol'])),
+            "symbol": body['symbol'].upper(),
+            "asset_class": "us_equity",
+            "notional": None,
+            "qty": format_qty(float(body['qty'])),
+            "filled_qty": "0",
+            "filled_avg_price": None,
+            "order_class": body.get('order_class') or 'simple',
+            "order_type": order_type,
+            "type": order_type,
+            "side": body['side'],
+            "time_in_force": body.get('time_in_force', 'day'),
+            "limit_price": str(body['limit_price']) if body.get('limit_price') is not None else None,
+            "stop_price": str(body['stop_price']) if body.get('stop_price') is not None else None,
+            "status": "new",
+            "extended_hours": bool(body.get('extended_hours', False)),
+            "legs": None,
+            "trail_percent": None,
+            "trail_price": None,
+            "hwm": None,
+        }
+        account.orders[order['id']] = order
+        account.client_order_ids[order['client_order_id']] = order['id']
+        order['_submitted_epoch'] = time.time()
+        if parent_id:
+            order['_parent_id'] = parent_id
+        return order
+
+    def submit(self, account: FakeAccount, body: Dict[str, Any]) -> Dict[str, Any]:
+        order = self.new_order(account, body)
+        self.emit(account, 'new', order)
+
+        if order['order_class'] == 'oco':
+            # Parent is the take-profit limit; the stop leg is a sibling that cancels with it
+            order['order_type'] = order['type'] = 'limit'
+            order['limit_price'] = str((body.get('take_profit') or {}).get('limit_price', body.get('limit_price')))
+            stop = body.get('stop_loss') or {}
+            leg = self.new_order(account, {
+                'symbol': order['symbol'], 'qty': body.get('qty'), 'side': body['side'],
+                'type': 'stop_limit' if stop.get('limit_price') else 'stop',
+                'time_in_force': order['time_in_force'], 'order_class': 'oco',
+                'stop_price': stop.get('stop_price'), 'limit_price': stop.get('limit_price'),
+            }, parent_id=order['id'])
+            order['legs'] = [leg['id']]
+            self.emit(account, 'new', leg)
+
+        self.match(account, order['symbol'], self.path.price(order['symbol']))
+        return order
+
+    def view(self, account: FakeAccount, order: Dict[str, Any], nested: bool = True) -> Dict[str, Any]:
+        """Order as the API returns it (legs expanded when nested)"""
+        result = {key: value for key, value in order.items() if not key.startswith('_')}
+        if order['legs']:
+            result['legs'] = [self.view(account, account.orders[leg_id], False) for leg_id in order['legs']] if nested else None
+        return result
+
+    def fill_price(self, order: Dict[str, Any], price: float) -> Optional[float]:
+        """Fill price at this market price, or None if the order does not execute"""
+        buy = order['side'] == 'buy'
+        order_type = order['order_type']
+        limit = float(order['limit_price']) if order['limit_price'] else None
+        stop = float(order['stop_price']) if order['stop_price'] else None
+
+        if order_type == 'market':
+            return price
+        if order_type == 'limit':
+            return limit if (price <= limit if buy else price >= limit) else None
+        if order_type in ('stop', 'stop_limit'):
+            if not (price >= stop if buy else price <= stop):
+                return None
+            if order_type == 'stop':
+                return price
+            return limit if (price <= limit if buy else price >= limit) else None
+        return None
+
+    def match(self, account: FakeAccount, symbol: str, price: float):
+        for order in list(account.orders.values()):
+            if order['symbol'] != symbol or order['status'] not in OPEN_STATUSES:
+                continue
+            if order['order_type'] != 'market' and not self.market_open and order['time_in_force'] == 'day':
+                continue
+            fill = self.fill_price(order, price)
+            if fill is not None:
+                self.fill(account, order, fill)
+
+    def fill(self, account: FakeAccount, order: Dict[str, Any], price: float):
+        qty = float(order['qty'])
+        signed = qty if order['side'] == 'buy' else -qty
+        timestamp = now_iso()
+
+        order.update(status='filled', filled_qty=order['qty'], filled_avg_price=str(round(price, 4)),
+                     filled_at=timestamp, updated_at=timestamp)
+        account.cash -= signed * price
+
+        position = account.positions.setdefault(order['symbol'], {'qty': 0.0, 'avg_entry_price': 0.0})
+        before = position['qty']
+        after = before + signed
+        if before == 0 or (before > 0) == (signed > 0):
+            position['avg_entry_price'] = (before * position['avg_entry_price'] + signed * price) / after
+        elif after != 0 and (after > 0) != (before > 0):
+            position['avg_entry_price'] = price  # flipped through zero
+        position['qty'] = after
+        if after == 0:
+            del account.positions[order['symbol']]
+
+        self.emit(account, 'fill', order, price=price, qty=qty, position_qty=after)
+
+        # OCO: a filled leg cancels its sibling
+        siblings = order['legs'] or ([order['_parent_id']] if order.get('_parent_id') else [])
+        for sibling_id in siblings:
+            sibling = account.orders[sibling_id]
+            if sibling['status'] in OPEN_STATUSES:
+                self.cancel(account, sibling)
+
+    def cancel(self, account: FakeAccount, order: Dict[str, Any]):
+        timestamp = now_iso()
+        order.update(status='canceled', canceled_at=timestamp, updated_at=timestamp)
+        self.emit(account, 'canceled', order)
+
+    # Prices
+
+    def set_prices(self, prices: Dict[str, float]):
+        for symbol, price in prices.items():
+            self.path.prices[symbol.upper()] = float(price)
+        self.on_prices({symbol.upper(): float(price) for symbol, price in prices.items()})
+
+    def step(self, ticks: int = 1):
+        for _ in range(ticks):
+            self.on_prices(self.path.step())
+
+    def on_prices(self, prices: Dict[str, float]):
+        for account in self.accounts.values():
+            for symbol, price in prices.items():
+                self.match(account, symbol, price)
+        if self.data_subscribers:
+            asyncio.get_event_loop().create_task(self.publish_market_data(prices))
+
+    # Streams
+
+    def emit(self, account: FakeAccount, event: str, order: Dict[str, Any], **fill):
+        if not account.streams:
+            return
+        data = {"event": event, "execution_id": str(uuid.uuid4()),
+                "order": self.view(account, order), "timestamp": now_iso()}
+        if event == 'fill':
+            data.update(price=str(fill['price']), qty=str(fill['qty']), position_qty=str(fill['position_qty']))
+        message = json.dumps({"stream": "trade_updates", "data": data})
+        for websocket in list(account.streams):
+            asyncio.get_event_loop().create_task(self._send_text(account, websocket, message))
+
+    async def _send_text(self, account: FakeAccount, websocket: WebSocket, message: str):
+        try:
+            await websocket.send_text(message)
+        except Exception:
+            if websocket in account.streams:
+                account.streams.remove(websocket)
+
+    async def publish_market_data(self, prices: Dict[str, float]):
+        timestamp = time.time()
+        for websocket, subscription in list(self.data_subscribers.items()):
+            messages = []
+            for symbol, price in prices.items():
+                if symbol in subscription['trades'] or '*' in subscription['trades']:
+                    self.data_trade_id += 1
+                    messages.append({"T": "t", "S": symbol, "i": self.data_trade_id, "x": "V",
+                                     "p": price, "s": 100, "c": ["@"], "z": "C", "t": timestamp})
+                if symbol in subscription['quotes'] or '*' in subscription['quotes']:
+                    messages.append({"T": "q", "S": symbol, "bx": "V", "bp": round(price - 0.01, 2), "bs": 1,
+                                     "ax": "V", "ap": round(price + 0.01, 2), "as": 1, "c": ["R"], "z": "C",
+                                     "t": timestamp})
+            if messages:
+                try:
+                    await send_data_message(websocket, subscription['msgpack'], messages)
+                except Exception:
+                    self.data_subscribers.pop(websocket, None)
+
+
+async def send_data_message(websocket: WebSocket, use_msgpack: bool, messages: List[Dict[str, Any]]):
+    """Send market data messages; "t" is given as epoch seconds and encoded per format"""
+    for message in messages:
+        if 't' in message:
+            epoch = message['t']
+            message['t'] = (msgpack.Timestamp.from_unix(epoch) if use_msgpack else
+                            datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace('+00:00', 'Z'))
+    if use_msgpack:
+        await websocket.send_bytes(msgpack.packb(messages))
+    else:
+        await websocket.send_text(json.dumps(messages))
+
+
+async def receive_data_message(websocket: WebSocket) -> Dict[str, Any]:
+    message = await websocket.receive()
+    if message.get('bytes') is not None:
+        return msgpack.unpackb(message['bytes'])
+    if message.get('text') is not None:
+        return json.loads(message['text'])
+    raise WebSocketDisconnect(message.get('code', 1000))
+
+
+def order_body_number(value: Any) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def create_app(broker: FakeBroker, tick_seconds: float = 1.0) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async def run_price_path():
+            while True:
+                await asyncio.sleep(tick_seconds)
+                broker.step()
+
+        task = asyncio.create_task(run_price_path()) if tick_seconds > 0 else None
+        yield
+        if task:
+            task.cancel()
+
+    app = FastAPI(title="Fake Alpaca", lifespan=lifespan)
+
+    @app.middleware("http")
+    async def broker_behaviour(request: Request, call_next):
+        path = request.url.path
+        if path.startswith('/_fake'):
+            return await call_next(request)
+
+        api_key = request.headers.get('APCA-API-KEY-ID')
+        if not api_key or not request.headers.get('APCA-API-SECRET-KEY'):
+            return api_error(401, 40110000, "request is not authorized")
+        account = broker.account(api_key)
+        request.state.account = account
+
+        if broker.latency_ms:
+            await asyncio.sleep(broker.latency_ms / 1000)
+        if broker.rate_limited(account):
+            broker.stats['rate_limited'] += 1
+            return api_error(429, 42910000, "rate limit exceeded")
+        response = await call_next(request)
+
+        # Count by route template so ids and symbols do not each get their own key
+        route = request.scope.get('route')
+        broker.stats[f"{request.method} {route.path if route else path}"] += 1
+        broker.stats['requests'] += 1
+        return response
+
+    # Trading
+
+    @app.get("/v2/account")
+    async def get_account(request: Request):
+        account: FakeAccount = request.state.account
+        long_value = sum(p['qty'] * broker.path.price(s) for s, p in account.positions.items() if p['qty'] > 0)
+        short_value = sum(p['qty'] * broker.path.price(s) for s, p in account.positions.items() if p['qty'] < 0)
+        equity = account.cash + long_value + short_value
+        return {
+            "id": account.id, "account_number": account.id[:9].upper(), "status": "ACTIVE",
+            "crypto_status": "INACTIVE", "currency": "USD",
+            "cash": str(round(account.cash, 2)), "portfolio_value": str(round(equity, 2)),
+            "equity": str(round(equity, 2)), "last_equity": str(STARTING_CASH),
+            "buying_power": str(round(max(account.cash, 0) * 2, 2)),
+            "regt_buying_power": str(round(max(account.cash, 0) * 2, 2)),
+            "daytrading_buying_power": "0", "non_marginable_buying_power": str(round(max(account.cash, 0), 2)),
+            "long_market_value": str(round(long_value, 2)), "short_market_value": str(round(short_value, 2)),
+            "initial_margin": "0", "maintenance_margin": "0", "last_maintenance_margin": "0",
+            "sma": "0", "multiplier": "2", "daytrade_count": 0, "pattern_day_trader": False,
+            "trading_blocked": False, "transfers_blocked": False, "account_blocked": False,
+            "trade_suspended_by_user": False, "shorting_enabled": True, "accrued_fees": "0",
+            "created_at": "2024-01-02T00:00:00Z",
+        }
+
+    @app.post("/v2/orders")
+    async def submit_order(request: Request):
+        account: FakeAccount = request.state.account
+        body = await request.json()
+        if not body.get('symbol') or body.get('side') not in ('buy', 'sell') or not body.get('qty'):
+            return api_error(422, 40010001, "symbol, side and qty are required")
+        if body.get('client_order_id') in account.client_order_ids:
+            return api_error(422, 40010001, "client_order_id must be unique")
+        for field in ('qty', 'limit_price', 'stop_price'):
+            body[field] = order_body_number(body.get(field))
+        body['symbol'] = body['symbol'].upper()
+        order = broker.submit(account, body)
+        return broker.view(account, order)
+
+    @app.get("/v2/orders")
+    async def list_orders(request: Request, status: str = 'open', limit: int = 50, nested: bool = False):
+        account: FakeAccount = request.state.account
+        orders = [o for o in account.orders.values() if not o.get('_parent_id') or not nested]
+        if status == 'open':
+            orders = [o for o in orders if o['status'] in OPEN_STATUSES]
+        elif status == 'closed':
+            orders = [o for o in orders if o['status'] not in OPEN_STATUSES]
+        orders = sorted(orders, key=lambda o: o['submitted_at'], reverse=True)[:limit]
+        return [broker.view(account, o, nested) for o in orders]
+
+    @app.get("/v2/orders:by_client_order_id")
+    async def get_order_by_client_order_id(request: Request, client_order_id: str):
+        account: FakeAccount = request.state.account
+        order_id = account.client_order_ids.get(client_order_id)
+        if not order_id:
+            return api_error(404, 40410000, "order not found")
+        return broker.view(account, account.orders[order_id])
+
+    @app.get("/v2/orders/{order_id}")
+    async def get_order(request: Request, order_id: str, nested: bool = False):
+        account: FakeAccount = request.state.account
+        order = account.orders.get(order_id)
+        if not order:
+            return api_error(404, 40410000, "order not found")
+        return broker.view(account, order, nested)
+
+    @app.delete("/v2/orders/{order_id}")
+    async def cancel_order(request: Request, order_id: str):
+        account: FakeAccount = request.state.account
+        order = account.orders.get(order_id)
+        if not order:
+            return api_error(404, 40410000, "order not found")
+        if order['status'] not in OPEN_STATUSES:
+            return api_error(422, 42210000, f"order is already in \"{order['status']}\" state")
+        broker.cancel(account, order)
+        for leg_id in order['legs'] or []:
+            if account.orders[leg_id]['status'] in OPEN_STATUSES:
+                broker.cancel(account, account.orders[leg_id])
+        return Response(status_code=204)
+
+    def position_view(symbol: str, position: Dict[str, float]) -> Dict[str, Any]:
+        qty = position['qty']
+        price = broker.path.price(symbol)
+        cost_basis = qty * position['avg_entry_price']
+        market_value = qty * price
+        unrealized = market_value - cost_basis
+        return {
+            "asset_id": str(uuid.uuid5(uuid.NAMESPACE_OID, symbol)), "symbol": symbol, "exchange": "NASDAQ",
+            "asset_class": "us_equity", "asset_marginable": True,
+            "avg_entry_price": str(round(position['avg_entry_price'], 4)),
+            "qty": format_qty(abs(qty)),
+            "qty_available": format_qty(abs(qty)),
+            "side": "long" if qty > 0 else "short",
+            "market_value": str(round(market_value, 2)), "cost_basis": str(round(cost_basis, 2)),
+            "unrealized_pl": str(round(unrealized, 2)),
+            "unrealized_plpc": str(round(unrealized / abs(cost_basis), 6) if cost_basis else 0),
+            "unrealized_intraday_pl": str(round(unrealized, 2)),
+            "unrealized_intraday_plpc": str(round(unrealized / abs(cost_basis), 6) if cost_basis else 0),
+            "current_price": str(price), "lastday_price": str(price), "change_today": "0",
+        }
+
+    @app.get("/v2/positions")
+    async def list_positions(request: Request):
+        account: FakeAccount = request.state.account
+        return [position_view(symbol, position) for symbol, position in sorted(account.positions.items())]
+
+    @app.get("/v2/positions/{symbol}")
+    async def get_position(request: Request, symbol: str):
+        account: FakeAccount = request.state.account
+        position = account.positions.get(symbol.upper())
+        if not position:
+            return api_error(404, 40410000, "position does not exist")
+        return position_view(symbol.upper(), position)
+
+    @app.delete("/v2/positions/{symbol}")
+    async def close_position(request: Request, symbol: str):
+        account: FakeAccount = request.state.account
+        symbol = symbol.upper()
+        position = account.positions.get(symbol)
+        if not position:
+            return api_error(404, 40410000, "position does not exist")
+        for order in account.orders.values():
+            if order['symbol'] == symbol and order['status'] in OPEN_STATUSES:
+                broker.cancel(account, order)
+        order = broker.submit(account, {'symbol': symbol, 'qty': abs(position['qty']), 'type': 'market',
+                                        'side': 'sell' if position['qty'] > 0 else 'buy', 'time_in_force': 'day'})
+        return broker.view(account, order)
+
+    @app.get("/v2/clock")
+    async def get_clock():
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        return {
+            "timestamp": now.isoformat(),
+            "is_open": broker.market_open,
+            "next_open": (now + timedelta(hours=1 if not broker.market_open else 24)).isoformat(),
+            "next_close": (now + timedelta(hours=6)).isoformat(),
+        }
+
+    def asset_view(symbol: str) -> Dict[str, Any]:
+        return {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_OID, symbol)), "class": "us_equity", "exchange": "NASDAQ",
+            "symbol": symbol, "name": f"{symbol} Fake Inc.", "status": "active", "tradable": True,
+            "marginable": True, "shortable": True, "easy_to_borrow": True, "fractionable": True,
+            "maintenance_margin_requirement": 30, "attributes": [],
+        }
+
+    @app.get("/v2/assets")
+    async def list_assets():
+        return [asset_view(symbol) for symbol in sorted(broker.path.prices)]
+
+    @app.get("/v2/assets/{symbol}")
+    async def get_asset(symbol: str):
+        return asset_view(symbol.upper())
+
+    # Market data
+
+    def latest_trade(symbol: str) -> Dict[str, Any]:
+        return {"t": now_iso(), "x": "V", "p": broker.path.price(symbol), "s": 100,
+                "c": ["@"], "i": broker.path.step_index, "z": "C"}
+
+    def latest_quote(symbol: str) -> Dict[str, Any]:
+        price = broker.path.price(symbol)
+        return {"t": now_iso(), "ax": "V", "ap": round(price + 0.01, 2), "as": 1,
+                "bx": "V", "bp": round(price - 0.01, 2), "bs": 1, "c": ["R"], "z": "C"}
+
+    def symbols_param(symbols: str) -> List[str]:
+        return [symbol.strip().upper() for symbol in symbols.split(',') if symbol.strip()]
+
+    @app.get("/v2/stocks/trades/latest")
+    async def latest_trades(symbols: str):
+        return {"trades": {symbol: latest_trade(symbol) for symbol in symbols_param(symbols)}}
+
+    @app.get("/v2/stocks/quotes/latest")
+    async def latest_quotes(symbols: str):
+        return {"quotes": {symbol: latest_quote(symbol) for symbol in symbols_param(symbols)}}
+
+    @app.get("/v2/stocks/{symbol}/trades/latest")
+    async def symbol_latest_trade(symbol: str):
+        return {"symbol": symbol.upper(), "trade": latest_trade(symbol.upper())}
+
+    @app.get("/v2/stocks/{symbol}/quotes/latest")
+    async def symbol_latest_quote(symbol: str):
+        return {"symbol": symbol.upper(), "quote": latest_quote(symbol.upper())}
+
+    # Streams
+
+    @app.websocket("/stream")
+    async def trading_stream(websocket: WebSocket):
+        await websocket.accept()
+        account = None
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                payload = json.loads(message.get('text') or message.get('bytes') or '{}')
+                action = payload.get('action')
+                data = payload.get('data') or {}
+
+                if action in ('authenticate', 'auth'):
+                    key = data.get('key_id') or payload.get('key')
+                    status = 'authorized' if key else 'unauthorized'
+                    await websocket.send_text(json.dumps({"stream": "authorization",
+                                                          "data": {"action": "authenticate", "status": status}}))
+                    if key:
+                        account = broker.account(key)
+                elif action == 'listen' and account:
+                    streams = data.get('streams', [])
+                    if 'trade_updates' in streams and websocket not in account.streams:
+                        account.streams.append(websocket)
+                    await websocket.send_text(json.dumps({"stream": "listening", "data": {"streams": streams}}))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if account and websocket in account.streams:
+                account.streams.remove(websocket)
+
+    @app.websocket("/v2/{feed}")
+    async def market_data_stream(websocket: WebSocket, feed: str):
+        use_msgpack = 'msgpack' in websocket.headers.get('content-type', '')
+        await websocket.accept()
+        await send_data_message(websocket, use_msgpack, [{"T": "success", "msg": "connected"}])
+        subscription = {'msgpack': use_msgpack, 'trades': set(), 'quotes': set()}
+        try:
+            while True:
+                payload = await receive_data_message(websocket)
+                action = payload.get('action')
+                if action == 'auth':
+                    await send_data_message(websocket, use_msgpack, [{"T": "success", "msg": "authenticated"}])
+                    broker.data_subscribers[websocket] = subscription
+                elif action in ('subscribe', 'unsubscribe'):
+                    for channel in ('trades', 'quotes'):
+                        symbols = {symbol.upper() if symbol != '*' else symbol for symbol in payload.get(channel, [])}
+                        if action == 'subscribe':
+                            subscription[channel] |= symbols
+                            for symbol in symbols - {'*'}:
+                                broker.path.price(symbol)
+                        else:
+                            subscription[channel] -= symbols
+                    await send_data_message(websocket, use_msgpack, [{
+                        "T": "subscription", "trades": sorted(subscription['trades']),
+                        "quotes": sorted(subscription['quotes']), "bars": []
+                    }])
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            broker.data_subscribers.pop(websocket, None)
+
+    # Control
+
+    @app.post("/_fake/prices")
+    async def set_prices(prices: Dict[str, float]):
+        broker.set_prices(prices)
+        return {"prices": {symbol.upper(): broker.path.price(symbol.upper()) for symbol in prices}}
+
+    @app.post("/_fake/step")
+    async def step(n: int = 1):
+        broker.step(n)
+        return {"step": broker.path.step_index, "prices": broker.path.prices}
+
+    @app.post("/_fake/config")
+    async def configure(config: Dict[str, Any]):
+        for field in ('latency_ms', 'rate_limit_per_minute', 'market_open'):
+            if field in config:
+                setattr(broker, field, config[field])
+        return {"latency_ms": broker.latency_ms, "rate_limit_per_minute": broker.rate_limit_per_minute,
+                "market_open": broker.market_open}
+
+    @app.get("/_fake/stats")
+    async def stats():
+        return {
+            "requests": dict(broker.stats),
+            "accounts": len(broker.accounts),
+            "orders": sum(len(a.orders) for a in broker.accounts.values()),
+            "step": broker.path.step_index,
+        }
+
+    @app.get("/_fake/orders")
+    async def all_orders(since: float = 0):
+        """Every order across accounts submitted at or after since (epoch seconds)"""
+        return [
+            {"id": order['id'], "client_order_id": order['client_order_id'], "account": account.api_key,
+             "symbol": order['symbol'], "side": order['side'], "order_type": order['order_type'],
+             "status": order['status'], "submitted_epoch": order['_submitted_epoch']}
+            for account in broker.accounts.values()
+            for order in account.orders.values()
+            if order['_submitted_epoch'] >= since
+        ]
+
+    @app.post("/_fake/reset")
+    async def reset():
+        broker.accounts.clear()
+        broker.stats.clear()
+        return {"reset": True}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Alpaca broker")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--prices', help='JSON file of scripted prices per symbol')
+    parser.add_argument('--tick', type=float, default=1.0, help='seconds per price step (0 = only via /_fake/step)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--volatility', type=float, default=0.001, help='random walk step (fraction of price)')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per minute per API key (0 = unlimited)')
+    parser.add_argument('--market-closed', action='store_true')
+    args = parser.parse_args()
+
+    script = {}
+    if args.prices:
+        with open(args.prices) as f:
+            script = json.load(f)
+
+    broker = FakeBroker(
+        PricePath(script, args.seed, args.volatility),
+        latency_ms=args.latency_ms,
+        rate_limit_per_minute=args.rate_limit,
+        market_open=not args.market_closed
+    )
+    print(f"🧪 Fake Alpaca on http://{args.host}:{args.port} "
+          f"(tick {args.tick}s, latency {args.latency_ms}ms, rate limit {args.rate_limit or 'off'})")
+    uvicorn.run(create_app(broker, args.tick), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Postgres advisory-lock leader election
+
+Only one Script Manager across all uvicorn workers / instances should run the
+background processes. Each candidate tries pg_try_advisory_lock on a
+dedicated connection; the session that gets it is the leader and keeps the
+connection open. If the leader dies, Postgres drops the session and the lock
+with it, and the next candidate to retry takes over.
+
+Session-level advisory locks need a direct connection (or session pooling),
+not a transaction-pooling pgbouncer.
+"""
+
+import logging
+import os
+import socket
+
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant identifying the "script manager leader" lock
+LEADER_LOCK_KEY = int(os.getenv('SCRIPT_MANAGER_LOCK_KEY', '7428301'))
+
+
+class LeaderLock:
+    """Holds (or tries to hold) the leader advisory lock on its own connection"""
+
+    def __init__(self, lock_key: int = LEADER_LOCK_KEY):
+        self.lock_key = lock_key
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._conn = None
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None
+
+    def try_acquire(self) -> bool:
+        """Blocking: try to become leader. Returns True if the lock is now held."""
+        if self._conn is not None:
+            return self.is_held()
+
+        conn = None
+        try:
+            conn = get_db_connection()
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_key,))
+            acquired = cursor.fetchone()[0]
+        except Exception as e:
+            logger.warning(f"[LEADER] Could not attempt leader lock: {e}")
+            if conn:
+                conn.close()
+            return False
+
+        if acquired:
+            self._conn = conn
+            cursor.execute("SELECT set_config('application_name', %s, false)", (f"script-manager-leader {self.instance_id}",))
+        else:
+            conn.close()
+
+        return acquired
+
+    def is_held(self) -> bool:
+        """Blocking: check the lock session is still alive (the lock lives as long as it does)"""
+        if self._conn is None:
+            return False
+        try:
+            cursor = self._conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except Exception as e:
+            logger.error(f"[LEADER] Leader lock connection lost: {e}")
+            self._drop()
+            return False
+
+    def release(self):
+        """Blocking: give up leadership"""
+        if self._conn is None:
+            return
+        try:
+            self._conn.cursor().execute("SELECT pg_advisory_unlock(%s)", (self.lock_key,))
+        except Exception:
+            pass
+        self._drop()
+
+    def _drop(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
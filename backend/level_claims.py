@@ -0,0 +1,150 @@
+"""
+Level execution claims
+
+Several executors can see the same triggered take profit / stop loss row (the
+Script Manager level monitor, its shard workers, the standalone monitor service
+and the legacy in-API loop). Before an order is sent the row is claimed:
+
+    UPDATE ... SET status = 'executing' WHERE id = (SELECT ... FOR UPDATE SKIP LOCKED)
+
+and the claim is committed, so every other executor skips it without waiting.
+The order is submitted with a deterministic client_order_id derived from the
+level and its attempt number, so a retry after a crash can never create a
+second order - Alpaca rejects the duplicate and the existing order is used.
+The executor then marks the level executed, or releases the claim (back to
+pending/active, attempt + 1) when the broker refused the order.
+
+Claims older than LEVEL_CLAIM_TIMEOUT_SECONDS belong to an executor that died
+between claim and finalize; they can be reclaimed and resolved through the
+broker using the same client_order_id.
+"""
+
+import os
+import socket
+from typing import List, Optional, Tuple
+
+# level type -> (table, status of a level waiting to trigger)
+LEVEL_TABLES = {
+    'take_profit': ('take_profit_levels', 'pending'),
+    'stop_loss': ('stop_loss_levels', 'active'),
+}
+
+# Statuses every level may have besides its waiting status ('working' = live
+# broker-native exit order, see broker_levels.py)
+LEVEL_STATUSES = ('executing', 'working', 'executed', 'cancelled', 'cancelled_by_sell_all')
+
+CLAIM_TIMEOUT_SECONDS = int(os.getenv('LEVEL_CLAIM_TIMEOUT_SECONDS', '60'))
+
+# Broker states meaning the order will never fill - the level may try again
+DEAD_ORDER_STATUSES = ('rejected', 'canceled', 'expired')
+
+EXECUTOR_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_level_claim_columns(cursor):
+    """Allow the claim/working statuses and add claim tracking columns to both level tables"""
+    for level_type, (table, waiting_status) in LEVEL_TABLES.items():
+        statuses = ", ".join(f"'{status}'" for status in (waiting_status,) + LEVEL_STATUSES)
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_status_check")
+        cursor.execute(f"""
+            ALTER TABLE {table}
+            ADD CONSTRAINT {table}_status_check
+            CHECK (status IN ({statuses}))
+        """)
+        cursor.execute(f"""
+            ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255),
+            ADD COLUMN IF NOT EXISTS execution_attempts INTEGER NOT NULL DEFAULT 0
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_executing
+            ON {table}(claimed_at)
+            WHERE status = 'executing'
+        """)
+
+
+def level_client_order_id(level_type: str, level_id: int, attempt: int) -> str:
+    """Deterministic Alpaca client_order_id for one execution attempt of a level"""
+    prefix = 'tp' if level_type == 'take_profit' else 'sl'
+    return f"level-{prefix}-{level_id}-{attempt}"
+
+
+def claim_level(cursor, level_type: str, level_id: int) -> Optional[str]:
+    """Claim a waiting (or abandoned) level and commit the claim.
+
+    Returns the client_order_id to submit with, or None if the level is gone,
+    already executed, or being executed by someone else.
+    """
+    table, waiting_status = LEVEL_TABLES[level_type]
+    cursor.execute(f"""
+        UPDATE {table}
+        SET status = 'executing',
+            claimed_at = NOW(),
+            claimed_by = %s
+        WHERE id = (
+            SELECT id FROM {table}
+            WHERE id = %s
+            AND (status = %s
+                 OR (status = 'executing' AND claimed_at < NOW() - make_interval(secs => %s)))
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING execution_attempts
+    """, (EXECUTOR_ID, level_id, waiting_status, CLAIM_TIMEOUT_SECONDS))
+    row = cursor.fetchone()
+    cursor.connection.commit()
+
+    if not row:
+        return None
+    return level_client_order_id(level_type, level_id, row[0])
+
+
+def release_level(cursor, level_type: str, level_id: int):
+    """Give a claimed level back after the broker refused the order, and commit"""
+    table, waiting_status = LEVEL_TABLES[level_type]
+    cursor.execute(f"""
+        UPDATE {table}
+        SET status = %s,
+            claimed_at = NULL,
+            claimed_by = NULL,
+            execution_attempts = execution_attempts + 1
+        WHERE id = %s AND status = 'executing'
+    """, (waiting_status, level_id))
+    cursor.connection.commit()
+
+
+def stale_claims(cursor, account_id: int) -> List[Tuple[str, int]]:
+    """(level_type, level_id) of abandoned claims on this account's trades"""
+    stale = []
+    for level_type, (table, _) in LEVEL_TABLES.items():
+        cursor.execute(f"""
+            SELECT l.id FROM {table} l
+            JOIN trades t ON l.trade_id = t.id
+            WHERE t.account_id = %s
+            AND l.status = 'executing'
+            AND l.claimed_at < NOW() - make_interval(secs => %s)
+        """, (account_id, CLAIM_TIMEOUT_SECONDS))
+        stale.extend((level_type, row[0]) for row in cursor.fetchall())
+    return stale
+
+
+async def submit_level_order(client, client_order_id: str, symbol: str, action: str, quantity: float) -> str:
+    """Submit the market order for a claimed level and return the broker order id.
+
+    A resubmission of an attempt that already reached the broker returns the
+    existing order instead of creating a new one.
+    """
+    try:
+        return await client.place_order(
+            symbol=symbol,
+            action=action,
+            quantity=quantity,
+            order_type='market',
+            time_in_force='day',
+            client_order_id=client_order_id
+        )
+    except Exception:
+        existing = await client.get_order_by_client_order_id(client_order_id)
+        if existing and existing['status'] not in DEAD_ORDER_STATUSES:
+            return existing['id']
+        raise
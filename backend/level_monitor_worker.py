@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Sharded Level Monitor Worker
+
+Runs the level monitor for the subset of accounts this worker owns. Start as
+many copies as needed (LEVEL_MONITOR_SHARDING=true makes the Script Manager
+leave level monitoring to them):
+
+    python level_monitor_worker.py
+
+Workers find each other through heartbeat rows in Postgres and split accounts
+by consistent hashing on account id, so adding a worker or losing one
+rebalances automatically within LEVEL_MONITOR_LEASE_TTL_SECONDS.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db import get_db_connection
+from process_modules.level_monitor import monitor_levels_process
+from process_modules.level_shards import ShardCoordinator, create_shard_tables
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+CYCLE_SECONDS = float(os.getenv('LEVEL_MONITOR_WORKER_INTERVAL', '0.5'))
+MEMBERSHIP_REFRESH_SECONDS = float(os.getenv('LEVEL_MONITOR_MEMBERSHIP_REFRESH_SECONDS', '5'))
+
+
+def refresh_shard(coordinator: ShardCoordinator, account_count: int, last_cycle_ms: int):
+    """Heartbeat, recompute ownership and renew leases. Returns the leased account ids."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        coordinator.heartbeat(cursor, account_count, last_cycle_ms)
+
+        cursor.execute("""
+            SELECT id FROM accounts
+            WHERE is_active = TRUE AND broker = 'alpaca'
+        """)
+        all_accounts = [row[0] for row in cursor.fetchall()]
+
+        owned = coordinator.owned_accounts(all_accounts)
+        leased = coordinator.claim_leases(cursor, owned)
+        conn.commit()
+
+        waiting = owned - leased
+        if waiting:
+            logger.info(f"[SHARDS] Waiting for {len(waiting)} account leases held by previous owners")
+        return sorted(leased)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def leave_shard(coordinator: ShardCoordinator):
+    conn = get_db_connection()
+    try:
+        coordinator.leave(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def run_worker():
+    """Main worker loop"""
+    loop = asyncio.get_running_loop()
+    coordinator = ShardCoordinator()
+    shutdown = asyncio.Event()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, shutdown.set)
+        except NotImplementedError:
+            pass  # Windows
+
+    conn = get_db_connection()
+    try:
+        create_shard_tables(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+
+    logger.info(f"[SHARDS] Level monitor worker {coordinator.worker_id} starting")
+
+    account_ids = []
+    last_refresh = 0.0
+    last_cycle_ms = None
+
+    try:
+        while not shutdown.is_set():
+            cycle_start = time.time()
+
+            if cycle_start - last_refresh >= MEMBERSHIP_REFRESH_SECONDS:
+                try:
+                    account_ids = await loop.run_in_executor(
+                        None, refresh_shard, coordinator, len(account_ids), last_cycle_ms
+                    )
+                    last_refresh = cycle_start
+                except Exception as e:
+                    # Without a fresh heartbeat our leases may expire - stop monitoring until we recover
+                    logger.error(f"[SHARDS] Membership refresh failed: {e}")
+                    account_ids = []
+
+            await monitor_levels_process(account_ids)
+
+            cycle_duration = time.time() - cycle_start
+            last_cycle_ms = int(cycle_duration * 1000)
+            if cycle_duration > CYCLE_SECONDS:
+                logger.warning(f"[TIMING] Shard cycle took {cycle_duration:.2f}s for {len(account_ids)} accounts")
+
+            try:
+                await asyncio.wait_for(shutdown.wait(), timeout=max(0, CYCLE_SECONDS - cycle_duration))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        logger.info(f"[SHARDS] Worker {coordinator.worker_id} leaving")
+        try:
+            await loop.run_in_executor(None, leave_shard, coordinator)
+        except Exception as e:
+            logger.error(f"[SHARDS] Failed to leave cleanly: {e}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -0,0 +1,79 @@
+"""
+Compact in-memory records for monitored levels and cached prices
+
+The standalone monitor used to hold every active level as a dict carrying its
+own copy of the account credentials, rebuilt every cycle. These classes use
+__slots__ instead of a per-instance __dict__, and credentials are kept once
+per account, so a single process can hold hundreds of thousands of levels.
+
+measure_level_memory.py reports bytes per level for each representation
+(dict, LevelRecord, LevelBook arrays).
+"""
+
+import time
+from typing import Dict, Optional
+
+
+class LevelRecord:
+    """One pending take profit or active stop loss level"""
+
+    __slots__ = ('type', 'id', 'trade_id', 'level_number', 'price', 'shares',
+                 'symbol', 'action', 'user_id', 'account_id')
+
+    def __init__(self, type: str, id: int, trade_id: int, level_number: Optional[int],
+                 price: float, shares: float, symbol: str, action: str,
+                 user_id: int, account_id: int):
+        self.type = type
+        self.id = id
+        self.trade_id = trade_id
+        self.level_number = level_number
+        self.price = price
+        self.shares = shares
+        self.symbol = symbol
+        self.action = action
+        self.user_id = user_id
+        self.account_id = account_id
+
+    def __repr__(self) -> str:
+        return f"LevelRecord({self.type} {self.id} trade={self.trade_id} {self.symbol} @ {self.price})"
+
+
+class PriceTick:
+    """Last known price of a symbol and when it was fetched (time.time())"""
+
+    __slots__ = ('price', 'updated_at')
+
+    def __init__(self, price: float, updated_at: float):
+        self.price = price
+        self.updated_at = updated_at
+
+
+class PriceCache:
+    """Symbol -> PriceTick, with a maximum age for reads"""
+
+    __slots__ = ('max_age', 'ticks')
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self.ticks: Dict[str, PriceTick] = {}
+
+    def get(self, symbol: str, now: Optional[float] = None) -> Optional[float]:
+        """Cached price, or None if missing or older than max_age"""
+        tick = self.ticks.get(symbol)
+        if tick is None:
+            return None
+        if (now if now is not None else time.time()) - tick.updated_at >= self.max_age:
+            return None
+        return tick.price
+
+    def put(self, symbol: str, price: float, now: Optional[float] = None):
+        now = now if now is not None else time.time()
+        tick = self.ticks.get(symbol)
+        if tick is None:
+            self.ticks[symbol] = PriceTick(price, now)
+        else:
+            tick.price = price
+            tick.updated_at = now
+
+    def __len__(self) -> int:
+        return len(self.ticks)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Load test for WHAPI webhook ingestion (/api/webhook/whapi/{webhook_token})
+
+Sends recorded payloads replayed from webhook_logs (--replay N) or synthetic
+WHAPI text messages at a configurable rate and shape, and reports:
+
+- accepted per second (2xx responses) and the status code mix
+- response time p50/p90/p99/max
+- signal-creation lag: send time -> signals.created_at of that message
+- event-loop lag: /health response times polled during the load, next to
+  a baseline taken before it (a blocked loop shows up here first)
+
+By default the API runs in-process with SCRIPT_MANAGER_MODE=off, a stub
+message analyzer (signal_parser based, blocking for --analyzer-latency-ms
+like the synchronous OpenAI client) and ALPACA_URL_OVERRIDE pointing at
+fake_alpaca.py. --url targets an already running server instead (its own
+analyzer/broker configuration applies).
+
+A bench_ user, account and signal source are created for the run and removed
+afterwards (with the messages and signals they received) unless --keep.
+
+Usage:
+    python load_test_webhooks.py [--rate 50] [--duration 10] [--shape constant|burst|ramp]
+        [--burst-size 100] [--burst-interval 2] [--replay 500] [--signal-ratio 0.5]
+        [--analyzer-latency-ms 800] [--output webhook_load_test.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_PREFIX = 'bench_'
+MARKER = '#lt'
+
+SIGNAL_TEMPLATES = [
+    "BUY {symbol} @ {price} SL {stop} TP {target}",
+    "{symbol} breakout above {price}, stop {stop}, target {target}",
+    "SELL {symbol} at {price} stop loss {stop} take profit {target}",
+]
+CHATTER = [
+    "good morning everyone",
+    "market looks choppy today, staying patient",
+    "anyone watching the fed minutes?",
+    "closed my position earlier, nice move",
+]
+
+
+class StubAnalyzer:
+    """Stand-in for MessageAnalyzer: regex parsing plus a blocking delay in place of the OpenAI call"""
+
+    def __init__(self, latency_ms: float):
+        from signal_parser import signal_parser
+        self.latency = latency_ms / 1000
+        self.parser = signal_parser
+
+    def analyze_message(self, message: str) -> Dict[str, Any]:
+        time.sleep(self.latency)  # the real client is synchronous too
+        signals = self.parser.parse_multiple_signals(message)
+        return {"is_signal": bool(signals), "signals": signals,
+                "original_message": message, "analysis_notes": "load test stub"}
+
+    def extract_signals_for_db(self, analysis_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        from message_analyzer import MessageAnalyzer
+        return MessageAnalyzer.extract_signals_for_db(self, analysis_result)
+
+
+def synthetic_payload(rng: random.Random, chat_id: str, signal_ratio: float) -> Dict[str, Any]:
+    if rng.random() < signal_ratio:
+        price = round(rng.uniform(5, 400), 2)
+        text = rng.choice(SIGNAL_TEMPLATES).format(
+            symbol=rng.choice(['AAPL', 'MSFT', 'NVDA', 'TSLA', 'AMD', 'META', 'PLTR', 'SOFI']),
+            price=price, stop=round(price * 0.95, 2), target=round(price * 1.08, 2)
+        )
+    else:
+        text = rng.choice(CHATTER)
+    return {
+        "event": {
+            "type": "message",
+            "message": {"id": secrets.token_hex(8), "type": "text", "text": text,
+                        "from": f"{rng.randint(1000000, 9999999)}", "timestamp": int(time.time())},
+            "chat": {"id": chat_id, "name": "Load Test"}
+        }
+    }
+
+
+def replay_payloads(cursor, limit: int) -> List[Dict[str, Any]]:
+    """Recent text-message payloads kept in webhook_logs (hash-only rows have no payload)"""
+    cursor.execute("""
+        SELECT payload FROM webhook_logs
+        WHERE payload IS NOT NULL AND event_type = 'message'
+        ORDER BY created_at DESC
+        LIMIT %s
+    """, (limit,))
+    payloads = []
+    for (payload,) in cursor.fetchall():
+        data = json.loads(payload) if isinstance(payload, str) else payload
+        if data.get('event', {}).get('message', {}).get('type') == 'text':
+            payloads.append(data)
+    return payloads
+
+
+def mark(payload: Dict[str, Any], index: int, chat_id: str) -> Dict[str, Any]:
+    """Copy of payload tagged with a per-request marker and routed to the load-test chat"""
+    payload = json.loads(json.dumps(payload))
+    event = payload.setdefault('event', {})
+    message = event.setdefault('message', {})
+    message['text'] = f"{message.get('text', '')} {MARKER}{index}"
+    event['chat'] = {**event.get('chat', {}), 'id': chat_id}
+    return payload
+
+
+def setup_source(cursor) -> Tuple[str, str]:
+    """Create a bench_ user, account and auto-approving source; return (webhook_token, chat_id)"""
+    run = datetime.now().strftime('%H%M%S')
+    cursor.execute("""
+        INSERT INTO users (username, email, password) VALUES (%s, %s, 'benchmark') RETURNING id
+    """, (f"{BENCH_PREFIX}webhook_{run}", f"{BENCH_PREFIX}webhook_{run}@example.invalid"))
+    user_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO accounts (user_id, name, account_type, broker, api_key, api_secret, is_active)
+        VALUES (%s, 'Load Test', 'paper', 'alpaca', %s, 'benchmark', TRUE) RETURNING id
+    """, (user_id, f"BENCHWEBHOOK{run}"))
+    account_id = cursor.fetchone()[0]
+
+    webhook_token = secrets.token_urlsafe(24)
+    chat_id = f"loadtest-{run}@g.us"
+    cursor.execute("""
+        INSERT INTO signal_sources (user_id, source_type, source_identifier, name, webhook_token, filter_config)
+        VALUES (%s, 'whapi', %s, 'Load Test', %s, %s) RETURNING id
+    """, (user_id, f"{BENCH_PREFIX}{run}", webhook_token, json.dumps({'chat_id': chat_id})))
+    source_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO source_accounts (source_id, account_id, auto_approve) VALUES (%s, %s, TRUE)
+    """, (source_id, account_id))
+    return webhook_token, chat_id
+
+
+def cleanup(cursor, chat_ids: List[str]):
+    """Remove load-test messages, their signals and the bench_ user tree"""
+    cursor.execute("""
+        DELETE FROM signals WHERE whatsapp_message_id IN (
+            SELECT id FROM whatsapp_messages WHERE instance_id = ANY(%s)
+        )
+    """, ([f"chat-{chat_id}" for chat_id in chat_ids],))
+    cursor.execute("DELETE FROM whatsapp_messages WHERE instance_id = ANY(%s)",
+                   ([f"chat-{chat_id}" for chat_id in chat_ids],))
+    cursor.execute("DELETE FROM users WHERE username LIKE %s", (BENCH_PREFIX + 'webhook_%',))
+
+
+def signal_lags(cursor, chat_id: str, sent_at: Dict[int, float]) -> List[float]:
+    """Seconds from sending each message to its first signal row"""
+    cursor.execute("""
+        SELECT substring(wm.raw_message FROM %s)::int AS marker,
+               EXTRACT(EPOCH FROM MIN(s.created_at)::timestamptz)
+        FROM whatsapp_messages wm
+        JOIN signals s ON s.whatsapp_message_id = wm.id
+        WHERE wm.instance_id = %s
+        GROUP BY marker
+    """, (MARKER + r'(\d+)$', f"chat-{chat_id}"))
+    return [float(created) - sent_at[marker] for marker, created in cursor.fetchall() if marker in sent_at]
+
+
+def send_offsets(shape: str, rate: float, duration: float, burst_size: int, burst_interval: float) -> List[float]:
+    """Seconds after start at which each request is sent"""
+    if shape == 'burst':
+        starts = [i * burst_interval for i in range(int(duration / burst_interval) + 1)]
+        return [start for start in starts if start < duration for _ in range(burst_size)]
+    if shape == 'ramp':
+        # Rate grows linearly from 0 to `rate`: n(t) = rate * t^2 / (2 * duration)
+        total = int(rate * duration / 2)
+        return [(2 * duration * (i + 1) / rate) ** 0.5 for i in range(total)]
+    return [i / rate for i in range(int(rate * duration))]
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {'count': len(ordered), 'p50_ms': at(0.50), 'p90_ms': at(0.90), 'p99_ms': at(0.99),
+            'max_ms': round(ordered[-1] * 1000, 3)}
+
+
+async def probe_loop(client: httpx.AsyncClient, interval: float, stop: asyncio.Event, samples: List[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get('/health')
+            samples.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def run_load(args, base_url: str, webhook_token: str, payloads: List[Dict[str, Any]],
+                   chat_id: str) -> Dict[str, Any]:
+    offsets = send_offsets(args.shape, args.rate, args.duration, args.burst_size, args.burst_interval)
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    sent_at: Dict[int, float] = {}
+    response_times: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client, \
+            httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as probe_client:
+        # Baseline /health latency with no load
+        baseline: List[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_loop(probe_client, args.probe_interval, stop, baseline))
+        await asyncio.sleep(1.0)
+        stop.set()
+        await probe
+
+        during: List[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_loop(probe_client, args.probe_interval, stop, during))
+
+        async def send(index: int, payload: Dict[str, Any]):
+            sent_at[index] = time.time()
+            start = time.perf_counter()
+            try:
+                response = await client.post(f'/api/webhook/whapi/{webhook_token}', json=payload)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            response_times.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        tasks = []
+        for index, offset in enumerate(offsets):
+            delay = offset - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(index, mark(payloads[index % len(payloads)], index, chat_id))))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        await probe
+
+    accepted = sum(count for status, count in statuses.items() if status.startswith('2'))
+    return {
+        'sent': len(offsets),
+        'elapsed_seconds': round(elapsed, 3),
+        'accepted': accepted,
+        'accepted_per_second': round(accepted / elapsed, 2) if elapsed else 0,
+        'statuses': statuses,
+        'response_time': percentiles(response_times),
+        'event_loop_probe_baseline': percentiles(baseline),
+        'event_loop_probe_under_load': percentiles(during),
+        '_sent_at': sent_at,
+    }
+
+
+def start_in_process_server(args) -> str:
+    """Run the API in a background thread with the script manager off and a stub analyzer"""
+    os.environ.setdefault('SCRIPT_MANAGER_MODE', 'off')
+    os.environ.setdefault('ALPACA_URL_OVERRIDE', args.fake_url)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import uvicorn
+    import main
+    if args.analyzer == 'stub':
+        stub = StubAnalyzer(args.analyzer_latency_ms)
+        main.get_message_analyzer = lambda: stub
+    elif args.analyzer == 'regex':
+        main.get_message_analyzer = lambda: None
+
+    config = uvicorn.Config(main.app, host='127.0.0.1', port=args.port, log_level='warning')
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{args.port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', help='target a running server instead of starting one in-process')
+    parser.add_argument('--port', type=int, default=8099, help='port for the in-process server')
+    parser.add_argument('--fake-url', default='http://127.0.0.1:8765', help='fake_alpaca.py for the in-process server')
+    parser.add_argument('--analyzer', choices=['stub', 'regex'], default='stub')
+    parser.add_argument('--analyzer-latency-ms', type=float, default=800)
+    parser.add_argument('--rate', type=float, default=20, help='requests per second (peak for ramp)')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--shape', choices=['constant', 'burst', 'ramp'], default='constant')
+    parser.add_argument('--burst-size', type=int, default=100)
+    parser.add_argument('--burst-interval', type=float, default=2.0)
+    parser.add_argument('--replay', type=int, default=0, help='replay up to N payloads from webhook_logs')
+    parser.add_argument('--signal-ratio', type=float, default=0.5, help='share of synthetic messages that are signals')
+    parser.add_argument('--max-in-flight', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--probe-interval', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help='leave the load-test rows in the database')
+    parser.add_argument('--output', default='webhook_load_test.json')
+    args = parser.parse_args()
+
+    base_url = args.url or start_in_process_server(args)
+    sys.path.insert(0, BACKEND_DIR)
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        webhook_token, chat_id = setup_source(cursor)
+        payloads = replay_payloads(cursor, args.replay) if args.replay else []
+        conn.commit()
+    finally:
+        conn.close()
+
+    source = 'webhook_logs' if payloads else 'synthetic'
+    if not payloads:
+        rng = random.Random(args.seed)
+        payloads = [synthetic_payload(rng, chat_id, args.signal_ratio) for _ in range(1000)]
+    print(f"🚀 {args.shape} load at {args.rate}/s for {args.duration}s against {base_url} ({source} payloads)")
+
+    result = asyncio.run(run_load(args, base_url, webhook_token, payloads, chat_id))
+    sent_at = result.pop('_sent_at')
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        result['signal_creation_lag'] = percentiles(signal_lags(cursor, chat_id, sent_at))
+        if not args.keep:
+            cleanup(cursor, [chat_id])
+        conn.commit()
+    finally:
+        conn.close()
+
+    result.update(parameters=vars(args), payload_source=source, started_at=datetime.now().isoformat())
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"📊 {result['accepted_per_second']} accepted/s, response p50 {result['response_time'].get('p50_ms')}ms "
+          f"p99 {result['response_time'].get('p99_ms')}ms, signal lag p50 {result['signal_creation_lag'].get('p50_ms')}ms, "
+          f"/health p99 {result['event_loop_probe_baseline'].get('p99_ms')}ms idle -> "
+          f"{result['event_loop_probe_under_load'].get('p99_ms')}ms under load")
+    print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Event loop lag watchdog
+
+A heartbeat task sleeps for a fixed interval and records how late it wakes up
+(event_loop_lag_seconds). Anything that blocks the loop - synchronous Alpaca
+SDK calls, OpenAI requests, bcrypt, psycopg2 - shows up as lag.
+
+A daemon thread watches the heartbeat. When it has not ticked for longer than
+EVENT_LOOP_LAG_THRESHOLD_MS, the thread samples the loop thread's stack and
+records the innermost frame in our own code (plus the frame that was actually
+running, e.g. inside bcrypt or a socket read). When the heartbeat resumes, the
+full stall duration is added to that blocker. Blockers are listed in
+/api/script-manager/status and, with stacks, in /api/debug/event-loop.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_ENABLED = os.getenv('EVENT_LOOP_WATCHDOG', 'true').lower() == 'true'
+LAG_THRESHOLD_MS = float(os.getenv('EVENT_LOOP_LAG_THRESHOLD_MS', '100'))
+HEARTBEAT_INTERVAL_MS = float(os.getenv('EVENT_LOOP_WATCHDOG_INTERVAL_MS', '100'))
+MAX_BLOCKERS = 200
+STACK_DEPTH = 20
+LOG_EVERY_SECONDS = 60  # Per blocker, so a hot spot does not flood the log
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+UNSAMPLED = '<not sampled>'
+
+
+def _is_app_frame(filename: str) -> bool:
+    return (filename.startswith(APP_ROOT) and 'site-packages' not in filename
+            and not filename.endswith('loop_watchdog.py'))
+
+
+class Blocker:
+    __slots__ = ('location', 'leaf', 'stalls', 'samples', 'total_time', 'max_time', 'last_seen', 'stack', 'logged_at')
+
+    def __init__(self, location: str, leaf: str, stack: List[str]):
+        self.location = location
+        self.leaf = leaf
+        self.stalls = 0
+        self.samples = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_seen = datetime.now()
+        self.stack = stack
+        self.logged_at = 0.0
+
+    def to_dict(self, include_stack: bool) -> Dict[str, Any]:
+        result = {
+            "location": self.location,
+            "leaf": self.leaf,
+            "stalls": self.stalls,
+            "samples": self.samples,
+            "total_ms": round(self.total_time * 1000, 1),
+            "max_ms": round(self.max_time * 1000, 1),
+            "last_seen": self.last_seen.isoformat()
+        }
+        if include_stack:
+            result["stack"] = self.stack
+        return result
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float = LAG_THRESHOLD_MS, interval_ms: float = HEARTBEAT_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.blockers: Dict[str, Blocker] = {}
+        self.stalls = 0
+        self.started_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._last_tick = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._stall_key: Optional[str] = None  # Blocker of the stall in progress
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start watching the running event loop (call from inside it)"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self.started_at = datetime.now()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._sampler, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"[LOOP_WATCHDOG] Watching event loop lag (threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            self._last_tick = start
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                self._end_stall(lag)
+
+    def _sampler(self):
+        """Runs in its own thread - the loop thread cannot observe itself while blocked"""
+        tick_sampled = None
+        while not self._stop.wait(self.threshold / 2):
+            tick = self._last_tick
+            if tick == tick_sampled:
+                continue  # One sample per stall is enough to name the blocker
+            if time.monotonic() - tick - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._record_sample(traceback.extract_stack(frame), tick)
+            tick_sampled = tick
+            del frame
+
+    def _record_sample(self, stack: traceback.StackSummary, tick: float):
+        app_frames = [f for f in stack if _is_app_frame(f.filename)]
+        app_frame = app_frames[-1] if app_frames else stack[-1]
+        leaf = stack[-1]
+        location = f"{os.path.relpath(app_frame.filename, APP_ROOT)}:{app_frame.lineno} {app_frame.name}"
+        leaf_name = f"{os.path.basename(leaf.filename)}:{leaf.lineno} {leaf.name}"
+        key = f"{location} | {leaf_name}"
+
+        with self._lock:
+            blocker = self.blockers.get(key)
+            if blocker is None:
+                if len(self.blockers) >= MAX_BLOCKERS:
+                    # Overflow is pooled under one entry that names no particular location
+                    key = UNSAMPLED
+                    blocker = self.blockers.get(key)
+                    if blocker is None:
+                        blocker = self.blockers[key] = Blocker(UNSAMPLED, UNSAMPLED, [])
+                else:
+                    lines = [f"{f.filename}:{f.lineno} in {f.name}" for f in stack[-STACK_DEPTH:]]
+                    blocker = self.blockers[key] = Blocker(location, leaf_name, lines)
+            blocker.samples += 1
+            blocker.last_seen = datetime.now()
+            if self._last_tick == tick:  # Stall still in progress, so the heartbeat will report its length
+                self._stall_key = key
+
+    def _end_stall(self, lag: float):
+        EVENT_LOOP_STALLS.inc()
+        with self._lock:
+            self.stalls += 1
+            key = self._stall_key or UNSAMPLED
+            self._stall_key = None
+            blocker = self.blockers.get(key)
+            if blocker is None:
+                blocker = self.blockers[key] = Blocker(UNSAMPLED, UNSAMPLED, [])
+            blocker.stalls += 1
+            blocker.total_time += lag
+            blocker.max_time = max(blocker.max_time, lag)
+            now = time.monotonic()
+            should_log = now - blocker.logged_at >= LOG_EVERY_SECONDS
+            if should_log:
+                blocker.logged_at = now
+        if should_log:
+            logger.warning(f"[LOOP_LAG] Event loop blocked {lag * 1000:.0f}ms in {blocker.location} ({blocker.leaf})")
+
+    def summary(self, limit: int = 10, include_stacks: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            ranked = sorted(self.blockers.values(), key=lambda b: b.total_time, reverse=True)[:limit]
+            blockers = [blocker.to_dict(include_stacks) for blocker in ranked]
+            stalls = self.stalls
+        return {
+            "enabled": self._task is not None,
+            "since": self.started_at.isoformat() if self.started_at else None,
+            "threshold_ms": self.threshold * 1000,
+            "lag_seconds": EVENT_LOOP_LAG_SECONDS.summary(),
+            "stalls": stalls,
+            "blockers": blockers
+        }
+
+    def reset(self):
+        with self._lock:
+            self.blockers.clear()
+            self.stalls = 0
+
+
+loop_watchdog = LoopWatchdog()
@@ -1,8 +1,11 @@
+# Imported first so the startup clock covers every other import
+from startup_timing import startup_timer, lazy_import
 from fastapi import FastAPI, Depends, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional, Dict, Any
+from fastapi.responses import PlainTextResponse
+from typing import TYPE_CHECKING, List, Optional, Dict, Any
 import uvicorn
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import hashlib
 import hmac
@@ -15,6 +18,7 @@ from contextlib import asynccontextmanager
 from math import floor
 import traceback
 import logging
+import time
 import psycopg2
 
 logger = logging.getLogger(__name__)
@@ -31,14 +35,45 @@ from models import (
     SchemaComparisonCreate, ApplyMigrationsRequest
 )
 from db import get_db_connection
+from metrics import (
+    registry as metrics_registry, query_context,
+    HTTP_REQUEST_SECONDS, HTTP_REQUESTS, HTTP_REQUEST_DB_QUERIES,
+    PROCESS_CYCLE_SECONDS, BROKER_CALL_SECONDS, DB_QUERIES
+)
+from query_stats import statement_stats
+from loop_watchdog import loop_watchdog, WATCHDOG_ENABLED
+from signal_latency import start_trace, mark_signal_stage, mark_trade_stage, latency_summary, GROUPINGS
+from executors import run_in_pool, json_response, executors_summary, shutdown_executors
+from pnl import fifo_realized_pnl
+from positions_mirror import load_positions
+from asset_cache import asset_cache
+from webhook_logs import log_webhook
+from level_claims import claim_level, release_level, submit_level_order
+from broker_levels import BROKER_NATIVE_LEVELS, submit_broker_levels, cancel_broker_levels
+from pending_intents import (
+    add_pending_intent, get_pending_intent, get_intents, complete_intent,
+    CUSTOM_LEVELS, POSITION_CLOSE
+)
 from auth import get_current_user, create_access_token, authenticate_user, register
-from alpaca_client import AlpacaClient
 from signal_parser import signal_parser
-from message_analyzer import message_analyzer
-from services.database_compare_service import DatabaseCompareService
+from message_analyzer import get_message_analyzer
+
+# Heavy subsystems (Alpaca SDK, OpenAI, cryptography) load on first use or in the
+# post-ready warm-up, not at import - see startup_timing.py
+if TYPE_CHECKING:
+    from alpaca_client import AlpacaClient
+
+startup_timer.mark('imports')
 
-# Initialize database compare service
-db_compare_service = DatabaseCompareService()
+_db_compare_service = None
+
+
+def get_db_compare_service():
+    """DatabaseCompareService, created on first use (it loads cryptography)"""
+    global _db_compare_service
+    if _db_compare_service is None:
+        _db_compare_service = lazy_import('services.database_compare_service').DatabaseCompareService()
+    return _db_compare_service
 
 # Background task for auto-sync
 async def auto_sync_trades():
@@ -63,6 +98,7 @@ async def auto_sync_trades():
             for account in accounts:
                 try:
                     # Get broker client
+                    from alpaca_client import AlpacaClient
                     client = AlpacaClient(
                         api_key=account[1],
                         secret_key=account[2],
@@ -132,6 +168,7 @@ async def auto_sync_trades():
                                         order_status.get('filled_at'),
                                         trade_id
                                     ))
+                                    mark_trade_stage(cursor, trade_id, 'filled_at')
                                     print(f"Auto-sync: Trade {symbol} filled at ${fill_price} - {filled_qty} shares")
                             
                             elif current_status == 'filled':
@@ -159,22 +196,15 @@ async def auto_sync_trades():
                                     # Convert signal data to dict
                                     signal_dict = dict(zip([desc[0] for desc in cursor.description], signal_data))
                                     
-                                    # Check for custom levels in trade_notifications
-                                    cursor.execute("""
-                                        SELECT data FROM trade_notifications 
-                                        WHERE trade_id = %s AND data->>'notification_type' = 'custom_levels_pending'
-                                        ORDER BY created_at DESC LIMIT 1
-                                    """, (trade_id,))
-                                    custom_levels_row = cursor.fetchone()
-                                    custom_levels = None
-                                    
-                                    if custom_levels_row:
-                                        notification_data = custom_levels_row[0]
-                                        custom_levels = notification_data.get('custom_levels')
+                                    # Check for custom levels stored when the order was placed
+                                    pending = get_pending_intent(cursor, trade_id, CUSTOM_LEVELS)
+                                    custom_levels = pending[1].get('custom_levels') if pending else None
                                     
                                     # Process take profit and stop loss levels
                                     try:
                                         await process_trade_levels(trade_id, signal_dict, filled_qty, fill_price, cursor, custom_levels)
+                                        if pending:
+                                            complete_intent(cursor, pending[0])
                                         print(f"✅ Successfully processed levels for trade {trade_id}")
                                     except Exception as level_error:
                                         print(f"❌ ERROR processing levels for trade {trade_id}: {level_error}")
@@ -232,6 +262,7 @@ async def monitor_and_execute_levels(conn):
         for account in active_accounts:
             try:
                 # Get broker client
+                from alpaca_client import AlpacaClient
                 client = AlpacaClient(
                     api_key=account[1],
                     secret_key=account[2],
@@ -256,12 +287,13 @@ async def monitor_and_execute_levels(conn):
                 # Get stop loss levels for this account
                 cursor.execute("""
                     SELECT 
-                        sl.id, sl.trade_id, sl.price, t.symbol, t.action, t.user_id, t.quantity
+                        sl.id, sl.trade_id, sl.price, t.symbol, t.action, t.user_id, t.remaining_quantity
                     FROM stop_loss_levels sl
                     JOIN trades t ON sl.trade_id = t.id
                     WHERE t.account_id = %s 
                     AND sl.status = 'active'
                     AND t.status = 'open'
+                    AND t.remaining_quantity > 0
                 """, (account[0],))
                 
                 sl_levels = cursor.fetchall()
@@ -294,24 +326,14 @@ async def monitor_and_execute_levels(conn):
                     if symbol not in levels_by_symbol:
                         levels_by_symbol[symbol] = {'take_profit': [], 'stop_loss': []}
                     
-                    # Calculate remaining shares (total - executed take profits)
-                    cursor.execute("""
-                        SELECT COALESCE(SUM(shares_quantity), 0) 
-                        FROM take_profit_levels 
-                        WHERE trade_id = %s AND status = 'executed'
-                    """, (sl[1],))
-                    executed_tp_shares = cursor.fetchone()[0] or 0
-                    remaining_shares = float(sl[6]) - float(executed_tp_shares)
-                    
-                    if remaining_shares > 0:
-                        levels_by_symbol[symbol]['stop_loss'].append({
-                            'id': sl[0],
-                            'trade_id': sl[1],
-                            'price': float(sl[2]),
-                            'shares': remaining_shares,
-                            'action': sl[4],
-                            'user_id': sl[5]
-                        })
+                    levels_by_symbol[symbol]['stop_loss'].append({
+                        'id': sl[0],
+                        'trade_id': sl[1],
+                        'price': float(sl[2]),
+                        'shares': float(sl[6]),  # Maintained remaining_quantity
+                        'action': sl[4],
+                        'user_id': sl[5]
+                    })
                 
                 # Check prices and execute levels for each symbol
                 for symbol, levels in levels_by_symbol.items():
@@ -385,20 +407,23 @@ async def execute_level_as_market_order(client, level, current_price, level_type
         # Determine execution action (opposite of original trade)
         execution_action = 'SELL' if original_action.upper() == 'BUY' else 'BUY'
         
+        # Claim the level so no other executor sends an order for it
+        client_order_id = claim_level(cursor, level_type, level_id)
+        if not client_order_id:
+            print(f"⏭️ {level_type} level {level_id} already claimed or executed, skipping")
+            return False
+        
         print(f"🎯 Executing {level_type} level {level_id}: {execution_action} {shares} {symbol} at ${current_price}")
         
         # Place market order for immediate execution
-        order_result = await client.place_order(
-            symbol=symbol,
-            qty=shares,
-            side=execution_action.lower(),
-            type='market',
-            time_in_force='day'
-        )
+        try:
+            broker_order_id = await submit_level_order(client, client_order_id, symbol, execution_action, shares)
+        except Exception as e:
+            print(f"❌ Failed to execute {level_type} level {level_id}: {e}")
+            release_level(cursor, level_type, level_id)
+            return False
         
-        if order_result and 'id' in order_result:
-            broker_order_id = order_result['id']
-            
+        if broker_order_id:
             # Get account info for the trade
             cursor.execute("""
                 SELECT account_id FROM trades WHERE id = %s
@@ -476,7 +501,7 @@ async def execute_level_as_market_order(client, level, current_price, level_type
                         executed_at = %s,
                         executed_price = %s,
                         broker_order_id = %s
-                    WHERE id = %s
+                    WHERE id = %s AND status = 'executing'
                 """, (datetime.utcnow(), current_price, broker_order_id, level_id))
             
             elif level_type == 'stop_loss':
@@ -487,9 +512,11 @@ async def execute_level_as_market_order(client, level, current_price, level_type
                         executed_price = %s,
                         executed_shares = %s,
                         broker_order_id = %s
-                    WHERE id = %s
+                    WHERE id = %s AND status = 'executing'
                 """, (datetime.utcnow(), current_price, shares, broker_order_id, level_id))
             
+            cursor.connection.commit()
+            
             print(f"✅ {level_type.replace('_', ' ').title()} executed: {symbol} {shares} shares at ${current_price} (Order: {broker_order_id})")
             print(f"💰 Realized P&L: ${realized_pnl:.2f}")
             
@@ -505,36 +532,88 @@ async def execute_level_as_market_order(client, level, current_price, level_type
         traceback.print_exc()
         return False
 
-# Lifespan context manager for background tasks
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup
-    print("🎯 Starting Centralized Script Manager...")
+# Script Manager processes start this long after the server is ready, so the first
+# health check / webhook is answered before they compete for the loop and the database
+BACKGROUND_START_DELAY_SECONDS = float(os.getenv('BACKGROUND_START_DELAY_SECONDS', '1'))
+
+# Loaded in a thread once the server is up, so the first trade or webhook does not pay for them
+WARM_UP_MODULES = ('alpaca_client', 'services.database_compare_service')
+
+
+async def start_background_processes(app: FastAPI):
+    """Start the Script Manager (or the legacy auto-sync) after the server is ready, then warm up"""
+    await asyncio.sleep(BACKGROUND_START_DELAY_SECONDS)
+    loop = asyncio.get_running_loop()
     
-    # Import and start script manager
+    print("🎯 Starting Centralized Script Manager...")
     try:
-        from script_manager import script_manager
-        await script_manager.start_all_processes()
-        print("✅ Script Manager started successfully")
+        # Importing it pulls in every process module and the Alpaca SDK - keep that off the loop
+        module = await loop.run_in_executor(None, lazy_import, 'script_manager')
+        app.state.script_manager = module.script_manager
+        await app.state.script_manager.start()
+        print(f"✅ Script Manager started ({app.state.script_manager.mode} mode)")
+        print(startup_timer.background_started())
     except ImportError:
         # Fallback to old system if script manager not available
         print("⚠️  Script Manager not found, using legacy auto-sync")
-        task = asyncio.create_task(auto_sync_trades())
+        app.state.legacy_sync_task = asyncio.create_task(auto_sync_trades())
+        print(startup_timer.background_started())
+    except Exception as e:
+        # The API keeps serving; the failure is reported in /api/script-manager/status
+        print(f"❌ {startup_timer.background_failed(e)}")
+        traceback.print_exc()
+    
+    await asset_cache.ensure_loaded()
+    
+    warm_up = WARM_UP_MODULES + (('openai',) if os.getenv("OPENAI_API_KEY") else ())
+    for name in warm_up:
+        try:
+            await loop.run_in_executor(None, lazy_import, name)
+        except Exception as e:
+            print(f"⚠️  Could not preload {name}: {e}")
+
+
+def _background_start_done(task: asyncio.Task):
+    """Record a background start that died outside its own error handling"""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ {startup_timer.background_failed(task.exception())}")
+
+# Lifespan context manager for background tasks
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup
+    if WATCHDOG_ENABLED:
+        loop_watchdog.start()
+    
+    app.state.script_manager = None
+    app.state.legacy_sync_task = None
+    background_start = asyncio.create_task(start_background_processes(app))
+    background_start.add_done_callback(_background_start_done)
+    startup_timer.mark('lifespan')
+    print(startup_timer.ready())
     
     yield
     
     # Shutdown
+    if not background_start.done():
+        background_start.cancel()
+        try:
+            await background_start
+        except asyncio.CancelledError:
+            pass
+    
     print("🛑 Stopping Script Manager...")
-    try:
-        from script_manager import script_manager
-        await script_manager.shutdown()
-    except ImportError:
-        if 'task' in locals():
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                pass
+    if app.state.script_manager:
+        await app.state.script_manager.shutdown()
+    elif app.state.legacy_sync_task:
+        app.state.legacy_sync_task.cancel()
+        try:
+            await app.state.legacy_sync_task
+        except asyncio.CancelledError:
+            pass
+    
+    await loop_watchdog.stop()
+    shutdown_executors()
 
 app = FastAPI(title="Trade Signal Filter & IBKR Execution API", lifespan=lifespan)
 
@@ -570,6 +649,24 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latency, status and database statement count per route template"""
+    start = time.perf_counter()
+    status = "500"
+    with query_context(scope=request.scope) as queries:
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            # Label by route template so ids in the path do not each get their own series
+            route = request.scope.get("route")
+            route_path = route.path if route else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, route_path)
+            HTTP_REQUESTS.inc(request.method, route_path, status)
+            HTTP_REQUEST_DB_QUERIES.observe(queries.count, request.method, route_path)
+
 # Webhook secret for WHAPI
 WEBHOOK_SECRET = os.getenv("WHAPI_WEBHOOK_SECRET", "your-webhook-secret")
 
@@ -645,9 +742,10 @@ async def get_active_account(user: User) -> Optional[Account]:
     finally:
         conn.close()
 
-def get_broker_client(account: Account) -> Optional[AlpacaClient]:
+def get_broker_client(account: Account) -> Optional["AlpacaClient"]:
     """Get broker client for the account"""
     if account.broker == "alpaca":
+        from alpaca_client import AlpacaClient
         return AlpacaClient(
             api_key=account.api_key,
             secret_key=account.api_secret,
@@ -657,9 +755,11 @@ def get_broker_client(account: Account) -> Optional[AlpacaClient]:
     # Add other brokers here in the future
     return None
 
-def process_with_regex_parser(cursor, message_id, message_data, source_id, accounts_config):
+def process_with_regex_parser(cursor, message_id, message_data, source_id, accounts_config,
+                              received_at=None, message_at=None):
     """Process message with regex parser for multiple accounts"""
     parsed_signals = signal_parser.parse_multiple_signals(message_data.get('text', ''))
+    analyzed_at = datetime.utcnow()
     
     if parsed_signals:
         for account_config in accounts_config:
@@ -669,6 +769,7 @@ def process_with_regex_parser(cursor, message_id, message_data, source_id, accou
             
             for signal_data in parsed_signals:
                 status = 'approved' if auto_approve else 'pending'
+                approved_at = datetime.utcnow() if auto_approve else None
                 
                 cursor.execute("""
                     INSERT INTO signals (
@@ -678,6 +779,7 @@ def process_with_regex_parser(cursor, message_id, message_data, source_id, accou
                         approved_by, approved_at
                     )
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
                 """, (
                     message_id,
                     signal_data['symbol'],
@@ -692,8 +794,12 @@ def process_with_regex_parser(cursor, message_id, message_data, source_id, accou
                     account_id if status == 'approved' else None,
                     user_id,
                     user_id if auto_approve else None,
-                    datetime.utcnow() if auto_approve else None
+                    approved_at
                 ))
+                
+                if received_at:
+                    start_trace(cursor, cursor.fetchone()[0], source_id, account_id, message_at,
+                                received_at, analyzed_at, datetime.utcnow(), approved_at)
         
         cursor.execute(
             "UPDATE whatsapp_messages SET is_signal = TRUE WHERE id = %s",
@@ -712,6 +818,8 @@ async def whapi_webhook_per_source(
     x_webhook_signature: Optional[str] = Header(None)
 ):
     """Receive WhatsApp messages for a specific source"""
+    received_at = datetime.utcnow()
+    
     # Parse webhook data
     try:
         payload = await request.body()
@@ -719,6 +827,9 @@ async def whapi_webhook_per_source(
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
     
+    event_type = data.get('event', {}).get('type', '')
+    instance_id = f"token-{webhook_token[:8]}"
+    
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
@@ -748,14 +859,10 @@ async def whapi_webhook_per_source(
         
         if not source_data:
             # Log unknown webhook attempts
-            cursor.execute("""
-                INSERT INTO webhook_logs (instance_id, event_type, payload)
-                VALUES (%s, %s, %s)
-            """, (
-                f"unknown-token-{webhook_token[:8]}",
-                data.get('event', {}).get('type', ''),
-                json.dumps(data)
-            ))
+            log_webhook(
+                cursor, f"unknown-token-{webhook_token[:8]}", event_type, payload, data,
+                processed=False, error_message="Invalid webhook token"
+            )
             conn.commit()
             raise HTTPException(status_code=404, detail="Invalid webhook token")
         
@@ -763,16 +870,7 @@ async def whapi_webhook_per_source(
         source_id = source_dict['id']
         filter_config = source_dict.get('filter_config', {})
         accounts_config = source_dict['accounts']
-        
-        # Log webhook for debugging
-        cursor.execute("""
-            INSERT INTO webhook_logs (instance_id, event_type, payload)
-            VALUES (%s, %s, %s)
-        """, (
-            f"source-{source_id}",
-            data.get('event', {}).get('type', ''),
-            json.dumps(data)
-        ))
+        instance_id = f"source-{source_id}"
         
         # Process message if it's a text message
         event = data.get('event', {})
@@ -784,6 +882,7 @@ async def whapi_webhook_per_source(
             # Check chat_id filter if configured
             if filter_config.get('chat_id') and filter_config['chat_id'] != chat_id:
                 # Message from different chat, ignore
+                log_webhook(cursor, instance_id, event_type, payload, data, processed=True)
                 conn.commit()
                 return {"status": "ignored", "reason": "chat_id mismatch"}
             
@@ -801,9 +900,11 @@ async def whapi_webhook_per_source(
             ))
             
             message_id = cursor.fetchone()[0]
+            message_at = datetime.utcfromtimestamp(message_data['timestamp']) if message_data.get('timestamp') else None
             
             # Process message with AI or regex parser
             signals_created = []
+            message_analyzer = get_message_analyzer()
             if message_analyzer:
                 try:
                     analysis_result = message_analyzer.analyze_message(message_data.get('text', ''))
@@ -811,6 +912,7 @@ async def whapi_webhook_per_source(
                     if analysis_result.get("is_signal"):
                         # Extract signals for database
                         db_signals = message_analyzer.extract_signals_for_db(analysis_result)
+                        analyzed_at = datetime.utcnow()
                         
                         # Create signals for each configured account
                         for account_config in accounts_config:
@@ -821,6 +923,7 @@ async def whapi_webhook_per_source(
                             for signal_data in db_signals:
                                 # Determine status based on auto_approve setting
                                 status = 'approved' if auto_approve else 'pending'
+                                approved_at = datetime.utcnow() if auto_approve else None
                                 
                                 cursor.execute("""
                                     INSERT INTO signals (
@@ -847,10 +950,12 @@ async def whapi_webhook_per_source(
                                     account_id if status == 'approved' else None,
                                     user_id,
                                     user_id if auto_approve else None,
-                                    datetime.utcnow() if auto_approve else None
+                                    approved_at
                                 ))
                                 
                                 signal_id = cursor.fetchone()[0]
+                                start_trace(cursor, signal_id, source_id, account_id, message_at,
+                                            received_at, analyzed_at, datetime.utcnow(), approved_at)
                                 signals_created.append({
                                     'signal_id': signal_id,
                                     'account': account_config['account_name'],
@@ -871,13 +976,18 @@ async def whapi_webhook_per_source(
                 except Exception as e:
                     print(f"Error analyzing WhatsApp message: {e}")
                     # Fall back to regex parser
-                    process_with_regex_parser(cursor, message_id, message_data, source_id, accounts_config)
+                    process_with_regex_parser(cursor, message_id, message_data, source_id, accounts_config,
+                                              received_at, message_at)
             else:
                 # No AI analyzer available, use regex parser
-                process_with_regex_parser(cursor, message_id, message_data, source_id, accounts_config)
+                process_with_regex_parser(cursor, message_id, message_data, source_id, accounts_config,
+                                          received_at, message_at)
             
             print(f"Processed message for source '{source_dict['name']}' with {len(signals_created)} signals created")
         
+        # Log webhook for debugging (hash only in WEBHOOK_LOG_PAYLOAD_MODE=hash)
+        log_webhook(cursor, instance_id, event_type, payload, data, processed=True)
+        
         conn.commit()
         return {"status": "success", "message": "Webhook processed"}
         
@@ -886,6 +996,14 @@ async def whapi_webhook_per_source(
     except Exception as e:
         conn.rollback()
         print(f"Error processing webhook: {e}")
+        # Keep the full payload of failed deliveries for debugging
+        try:
+            log_webhook(conn.cursor(), instance_id, event_type, payload, data,
+                        processed=False, error_message=str(e))
+            conn.commit()
+        except Exception as log_error:
+            conn.rollback()
+            print(f"Error logging failed webhook: {log_error}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         conn.close()
@@ -955,7 +1073,7 @@ async def get_signals(
             signal_dict.pop('approver_username', None)
             signals.append(Signal(**signal_dict))
         
-        return signals
+        return await json_response(signals)
     finally:
         conn.close()
 
@@ -1020,11 +1138,13 @@ async def approve_signal(
         new_status = 'approved' if approval.approved else 'rejected'
         
         if approval.approved and account:
+            approved_at = datetime.utcnow()
             cursor.execute("""
                 UPDATE signals 
                 SET status = %s, approved_at = %s, approved_by = %s, account_id = %s
                 WHERE id = %s
-            """, (new_status, datetime.utcnow(), current_user.id, account.id, signal_id))
+            """, (new_status, approved_at, current_user.id, account.id, signal_id))
+            mark_signal_stage(cursor, signal_id, 'approved_at', approved_at, account_id=account.id)
         else:
             cursor.execute("""
                 UPDATE signals 
@@ -1076,6 +1196,15 @@ async def validate_order(
         # Ensure quantity is a float for fractional shares
         quantity = float(quantity)
         
+        # Reject unknown or untradable symbols before any broker call
+        asset = await asset_cache.lookup(signal_dict['symbol'], broker_client)
+        if not asset_cache.is_known(signal_dict['symbol']) or (asset and not asset.tradable):
+            return {
+                "valid": False,
+                "errors": [f"{signal_dict['symbol']} is not a tradable symbol"],
+                "symbol_info": asset.to_dict() if asset else None
+            }
+        
         # Get account info
         account_info = await broker_client.get_account_info()
         buying_power = account_info.get('buying_power', 0)
@@ -1139,7 +1268,8 @@ async def validate_order(
                 "last": market_data.get('last', 0),
                 "timestamp": str(market_data.get('timestamp', '')),
                 "fractionable": market_data.get('fractionable', False)
-            }
+            },
+            "asset": asset.to_dict() if asset else None
         }
         
         # Add errors/warnings
@@ -1201,6 +1331,10 @@ async def validate_market_order(
         errors.append("Stop price is required for stop orders")
     if order_type == 'STOP_LIMIT' and (not stop_price or not limit_price):
         errors.append("Both stop price and limit price are required for stop-limit orders")
+    if symbol:
+        asset = await asset_cache.lookup(symbol, broker_client)
+        if not asset_cache.is_known(symbol) or (asset and not asset.tradable):
+            errors.append(f"{symbol} is not a tradable symbol")
     
     # Get market data
     market_data = None
@@ -1263,6 +1397,7 @@ async def analyze_message(
     current_user: User = Depends(get_current_user)
 ):
     """Analyze a message to extract trading signals using AI"""
+    message_analyzer = get_message_analyzer()
     if not message_analyzer:
         raise HTTPException(
             status_code=503, 
@@ -1550,7 +1685,7 @@ async def get_trades(
                 continue
         
         logger.debug(f"Successfully processed {len(trades_list)} trades")
-        return trades_list
+        return await json_response(trades_list)
     finally:
         conn.close()
 
@@ -1647,6 +1782,7 @@ async def execute_trade(
             )
         
         # Execute trade via broker
+        order_submitted_at = datetime.utcnow()
         order_id = await broker_client.place_order(
             symbol=signal_dict['symbol'],
             action=signal_dict['action'],
@@ -1659,6 +1795,7 @@ async def execute_trade(
         
         if not order_id:
             raise HTTPException(status_code=500, detail="Failed to place order with broker")
+        broker_accepted_at = datetime.utcnow()
         
         # Record trade in database with account_id
         cursor.execute("""
@@ -1681,6 +1818,9 @@ async def execute_trade(
             "UPDATE signals SET status = 'executed', account_id = %s WHERE id = %s",
             (account.id, signal_id)
         )
+        mark_signal_stage(cursor, signal_id, 'order_submitted_at', order_submitted_at,
+                          account_id=account.id, trade_id=trade_id)
+        mark_signal_stage(cursor, signal_id, 'broker_accepted_at', broker_accepted_at)
         
         # If custom take profit/stop loss levels were provided, store them for later processing
         if custom_take_profit_levels or custom_stop_loss_price:
@@ -1689,20 +1829,10 @@ async def execute_trade(
                 'stop_loss_price': custom_stop_loss_price
             }
             
-            # Store custom levels in trade_notifications for processing when order fills
-            cursor.execute("""
-                INSERT INTO trade_notifications (
-                    user_id, trade_id, data, created_at
-                )
-                VALUES (%s, %s, %s, %s)
-            """, (
-                current_user.id, trade_id, 
-                json.dumps({
-                    'notification_type': 'custom_levels_pending',
-                    'custom_levels': custom_levels_data
-                }),
-                datetime.utcnow()
-            ))
+            # Store custom levels for processing when order fills
+            add_pending_intent(cursor, current_user.id, trade_id, CUSTOM_LEVELS, {
+                'custom_levels': custom_levels_data
+            })
         
         conn.commit()
         
@@ -1848,22 +1978,11 @@ async def close_position(
             
             remaining_to_close -= close_quantity
         
-        # Store the position closing info in a JSON field for later P&L calculation
-        # We'll store the type info inside the JSON data itself to avoid column name issues
-        cursor.execute("""
-            INSERT INTO trade_notifications (
-                user_id, trade_id, data, created_at
-            )
-            VALUES (%s, %s, %s, %s)
-        """, (
-            current_user.id, sell_trade_id, 
-            json.dumps({
-                'notification_type': 'position_close_pending',  # Store type in JSON
-                'positions_to_close': positions_to_update,
-                'total_quantity': quantity_to_close
-            }),
-            datetime.utcnow()
-        ))
+        # Store the position closing info for P&L calculation when the sell fills
+        add_pending_intent(cursor, current_user.id, sell_trade_id, POSITION_CLOSE, {
+            'positions_to_close': positions_to_update,
+            'total_quantity': quantity_to_close
+        })
         
         conn.commit()
         
@@ -2129,7 +2248,8 @@ async def get_analytics(current_user: User = Depends(get_current_user)):
         
         if broker_client:
             try:
-                positions = await broker_client.get_positions()
+                positions = await load_positions(cursor, account.id, broker_client)
+                conn.commit()
                 print(f"Analytics: Retrieved {len(positions)} positions")
                 
                 for pos in positions:
@@ -2157,6 +2277,7 @@ async def get_analytics(current_user: User = Depends(get_current_user)):
             except Exception as e:
                 print(f"Analytics: ERROR getting positions: {e}")
                 traceback.print_exc()
+                conn.rollback()
                 
                 # Fallback to trades table floating_pnl if positions fail
                 try:
@@ -2227,7 +2348,8 @@ async def login(request: Request):
         if not username or not password:
             raise HTTPException(status_code=422, detail="Username and password required")
         
-        user = authenticate_user(username, password)
+        # bcrypt takes ~100-300ms per check; keep it off the event loop
+        user = await run_in_pool('auth', authenticate_user, username, password)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid username or password")
         
@@ -2734,97 +2856,25 @@ async def calculate_pnl_from_alpaca(current_user: User = Depends(get_current_use
         # Get all filled orders from Alpaca
         all_orders = await broker_client.get_orders(status='all', limit=500)
         
-        # Filter only filled orders and organize by symbol
-        orders_by_symbol = {}
-        for order in all_orders:
-            if order['status'] == 'filled':
-                symbol = order['symbol']
-                if symbol not in orders_by_symbol:
-                    orders_by_symbol[symbol] = {'buys': [], 'sells': []}
-                
-                order_data = {
-                    'id': order['id'],
-                    'qty': float(order['filled_qty']),
-                    'price': float(order['filled_avg_price']),
-                    'time': order['filled_at'],
-                    'side': order['side'].upper()
-                }
-                
-                if order['side'].upper() == 'BUY':
-                    orders_by_symbol[symbol]['buys'].append(order_data)
-                else:
-                    orders_by_symbol[symbol]['sells'].append(order_data)
-        
-        # Calculate P&L for each symbol using FIFO
-        total_realized_pnl = 0
-        symbol_pnls = {}
-        winning_trades = 0
-        losing_trades = 0
-        total_closed_trades = 0
-        
-        for symbol, orders in orders_by_symbol.items():
-            # Sort by time (oldest first for FIFO)
-            buys = sorted(orders['buys'], key=lambda x: x['time'])
-            sells = sorted(orders['sells'], key=lambda x: x['time'])
-            
-            # FIFO matching
-            buy_queue = []
-            realized_pnl = 0
-            
-            for buy in buys:
-                buy_queue.append({
-                    'qty': buy['qty'],
-                    'price': buy['price'],
-                    'remaining': buy['qty']
-                })
-            
-            for sell in sells:
-                sell_qty = sell['qty']
-                sell_price = sell['price']
-                sell_id = sell['id']
-                sell_pnl = 0
-                matched = False
-                
-                # Match against buy queue (FIFO)
-                while sell_qty > 0 and buy_queue:
-                    buy_order = buy_queue[0]
-                    match_qty = min(buy_order['remaining'], sell_qty)
-                    pnl = (sell_price - buy_order['price']) * match_qty
-                    sell_pnl += pnl
-                    realized_pnl += pnl
-                    buy_order['remaining'] -= match_qty
-                    sell_qty -= match_qty
-                    matched = True
-                    # Track win/loss per match
-                    total_closed_trades += 1
-                    if pnl > 0:
-                        winning_trades += 1
-                    elif pnl < 0:
-                        losing_trades += 1
-                    if buy_order['remaining'] == 0:
-                        buy_queue.pop(0)
-                
-                # Update database with calculated P&L for this SELL trade
-                if matched:
-                    cursor.execute("""
-                        UPDATE trades 
-                        SET pnl = %s
-                        WHERE broker_order_id = %s AND action = 'SELL'
-                    """, (
-                        sell_pnl,
-                        sell_id
-                    ))
-            
-            symbol_pnls[symbol] = realized_pnl
-            total_realized_pnl += realized_pnl
+        # FIFO matching is pure CPU work over the whole order history - run it in the process pool
+        pnl_results = await run_in_pool('cpu', fifo_realized_pnl, all_orders)
+        total_realized_pnl = pnl_results['total_realized_pnl']
+        symbol_pnls = pnl_results['symbol_pnls']
+        winning_trades = pnl_results['winning_trades']
+        losing_trades = pnl_results['losing_trades']
+        total_closed_trades = pnl_results['total_closed_trades']
+        win_rate = pnl_results['win_rate']
+        
+        # Update database with calculated P&L for each matched SELL trade
+        if pnl_results['sell_pnls']:
+            cursor.executemany("""
+                UPDATE trades 
+                SET pnl = %s
+                WHERE broker_order_id = %s AND action = 'SELL'
+            """, [(sell_pnl, sell_id) for sell_id, sell_pnl in pnl_results['sell_pnls']])
         
         conn.commit()
         
-        # Calculate win rate
-        win_rate = 0
-        if total_closed_trades > 0:
-            win_rate = (winning_trades / total_closed_trades) * 100
-        
         # Save realized P&L and win rate to the account
         cursor.execute("""
             UPDATE accounts
@@ -2858,6 +2908,62 @@ async def health_check():
     """Health check endpoint for deployment monitoring"""
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, Script Manager cycle, broker call and database metrics in Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/debug/db/statements")
+async def get_top_db_statements(limit: int = 20, order_by: str = "total",
+                                current_user: User = Depends(get_current_user)):
+    """Top SQL statement fingerprints by total/calls/mean/max time, with the endpoints and processes issuing them"""
+    if order_by not in statement_stats.ORDERINGS:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of {', '.join(statement_stats.ORDERINGS)}")
+    return {
+        **statement_stats.summary(),
+        "order_by": order_by,
+        "statements": statement_stats.top(limit, order_by)
+    }
+
+@app.post("/api/debug/db/statements/reset")
+async def reset_db_statements(current_user: User = Depends(get_current_user)):
+    """Clear the statement statistics of this worker, to measure one workload at a time"""
+    statement_stats.reset()
+    return {"message": "Statement statistics cleared"}
+
+@app.get("/api/debug/event-loop")
+async def get_event_loop_blockers(limit: int = 20, current_user: User = Depends(get_current_user)):
+    """Event loop lag percentiles and the code that blocked the loop longest, with sampled stacks"""
+    return loop_watchdog.summary(limit, include_stacks=True)
+
+@app.post("/api/debug/event-loop/reset")
+async def reset_event_loop_blockers(current_user: User = Depends(get_current_user)):
+    """Clear this worker's recorded blockers and stall count"""
+    loop_watchdog.reset()
+    return {"message": "Event loop blockers cleared"}
+
+@app.get("/api/latency/signals")
+async def get_signal_latency(
+    group_by: str = "source",
+    hours: float = 24,
+    current_user: User = Depends(get_current_user)
+):
+    """Per-stage signal-to-fill latency (seconds) for the user's signals, per source or account"""
+    if group_by not in GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUPINGS)}")
+    
+    since = datetime.utcnow() - timedelta(hours=hours)
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        return {
+            "group_by": group_by,
+            "since": since.isoformat(),
+            "groups": latency_summary(cursor, current_user.id, group_by, since)
+        }
+    finally:
+        conn.close()
+
 @app.get("/api/trades/sync")
 async def sync_trades_with_broker(current_user: User = Depends(get_current_user)):
     """Sync trade statuses with broker (Alpaca)"""
@@ -2880,8 +2986,8 @@ async def sync_trades_with_broker(current_user: User = Depends(get_current_user)
         imported_count = 0
         updated_count = 0
         
-        # Fetch all open positions from Alpaca
-        positions = await broker_client.get_positions()
+        # Open positions from the positions mirror (fetched from Alpaca only when stale)
+        positions = await load_positions(cursor, account.id, broker_client)
         # Build a symbol -> position map for quick lookup
         position_map = {pos['symbol']: pos for pos in positions}
         
@@ -2922,69 +3028,48 @@ async def sync_trades_with_broker(current_user: User = Depends(get_current_user)
                 # Special handling for SELL orders that are filled
                 if action == 'SELL' and our_status == 'open' and alpaca_status == 'filled':
                     # Check if this is a position close
-                    cursor.execute("""
-                        SELECT data FROM trade_notifications 
-                        WHERE trade_id = %s
-                    """, (trade_id,))
-                    notifications = cursor.fetchall()
+                    pending = get_pending_intent(cursor, trade_id, POSITION_CLOSE)
                     
-                    for notification in notifications:
-                        if notification[0]:
-                            # Parse the JSON data
-                            notif_data = notification[0] if isinstance(notification[0], dict) else json.loads(notification[0])
+                    if pending:
+                        intent_id, intent_data = pending
+                        # This is a position close, calculate P&L
+                        positions_to_close = intent_data.get('positions_to_close', [])
+                        sell_price = float(order.get('filled_avg_price', 0))
+                        
+                        total_pnl = 0
+                        for pos in positions_to_close:
+                            pos_entry_price = pos['entry_price']
+                            pos_close_quantity = pos['close_quantity']
+                            # Calculate P&L for this portion
+                            pos_pnl = (sell_price - pos_entry_price) * pos_close_quantity
+                            total_pnl += pos_pnl
                             
-                            # Check if this is a position close notification
-                            if notif_data.get('notification_type') == 'position_close_pending':
-                                # This is a position close, calculate P&L
-                                positions_to_close = notif_data.get('positions_to_close', [])
-                                sell_price = float(order.get('filled_avg_price', 0))
-                                
-                                total_pnl = 0
-                                for pos in positions_to_close:
-                                    pos_entry_price = pos['entry_price']
-                                    pos_close_quantity = pos['close_quantity']
-                                    # Calculate P&L for this portion
-                                    pos_pnl = (sell_price - pos_entry_price) * pos_close_quantity
-                                    total_pnl += pos_pnl
-                                    
-                                    # Update the original BUY trade
-                                    if pos['remaining_quantity'] > 0:
-                                        # Partial close - update quantity
-                                        cursor.execute("""
-                                            UPDATE trades 
-                                            SET quantity = %s
-                                            WHERE id = %s
-                                        """, (pos['remaining_quantity'], pos['id']))
-                                    else:
-                                        # Full close - mark as closed
-                                        cursor.execute("""
-                                            UPDATE trades 
-                                            SET status = 'closed',
-                                                exit_price = %s,
-                                                pnl = %s,
-                                                closed_at = %s,
-                                                close_reason = 'Position closed'
-                                            WHERE id = %s
-                                        """, (sell_price, pos_pnl, order.get('filled_at'), pos['id']))
-                                
-                                # Update the SELL trade with total P&L
-                                pnl = total_pnl
-                                our_status = 'closed'  # Mark SELL trades as closed when filled
-                                
-                                # Update the notification to mark it as processed
-                                notif_data['notification_type'] = 'position_close_completed'
+                            # Update the original BUY trade
+                            if pos['remaining_quantity'] > 0:
+                                # Partial close - update quantity
                                 cursor.execute("""
-                                    UPDATE trade_notifications 
-                                    SET data = %s
-                                    WHERE trade_id = %s AND id = (
-                                        SELECT id FROM trade_notifications 
-                                        WHERE trade_id = %s 
-                                        ORDER BY created_at DESC 
-                                        LIMIT 1
-                                    )
-                                """, (json.dumps(notif_data), trade_id, trade_id))
-                                
-                                break  # We found and processed the position close
+                                    UPDATE trades 
+                                    SET quantity = %s
+                                    WHERE id = %s
+                                """, (pos['remaining_quantity'], pos['id']))
+                            else:
+                                # Full close - mark as closed
+                                cursor.execute("""
+                                    UPDATE trades 
+                                    SET status = 'closed',
+                                        exit_price = %s,
+                                        pnl = %s,
+                                        closed_at = %s,
+                                        close_reason = 'Position closed'
+                                    WHERE id = %s
+                                """, (sell_price, pos_pnl, order.get('filled_at'), pos['id']))
+                        
+                        # Update the SELL trade with total P&L
+                        pnl = total_pnl
+                        our_status = 'closed'  # Mark SELL trades as closed when filled
+                        
+                        # Mark the intent as processed
+                        complete_intent(cursor, intent_id)
                 
                 # Always try to get the latest price for open trades
                 if our_status == 'open' and action == 'BUY':
@@ -3428,7 +3513,7 @@ async def delete_signal(signal_id: int, current_user: User = Depends(get_current
 
 @app.get("/api/positions")
 async def get_positions(current_user: User = Depends(get_current_user)):
-    """Get aggregated positions from Alpaca"""
+    """Get aggregated positions from the positions mirror (refreshed from Alpaca when stale)"""
     # Get active account
     account = await get_active_account(current_user)
     if not account:
@@ -3439,9 +3524,11 @@ async def get_positions(current_user: User = Depends(get_current_user)):
     if not broker_client:
         raise HTTPException(status_code=400, detail="Failed to initialize broker client")
     
+    conn = get_db_connection()
     try:
-        # Get positions from Alpaca
-        positions = await broker_client.get_positions()
+        cursor = conn.cursor()
+        positions = await load_positions(cursor, account.id, broker_client)
+        conn.commit()
         
         # Format positions for frontend
         formatted_positions = []
@@ -3475,7 +3562,8 @@ async def get_positions(current_user: User = Depends(get_current_user)):
                 'today_pnl': today_pnl,
                 'today_pnl_pct': today_pnl_pct,
                 'asset_class': pos.get('asset_class', 'us_equity'),
-                'exchange': pos.get('exchange', 'NASDAQ')
+                'exchange': pos.get('exchange', 'NASDAQ'),
+                'price_updated_at': pos.get('price_updated_at')
             })
         
         return formatted_positions
@@ -3483,10 +3571,12 @@ async def get_positions(current_user: User = Depends(get_current_user)):
     except Exception as e:
         print(f"Error fetching positions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
 
 @app.get("/api/positions/sync")
 async def sync_positions(current_user: User = Depends(get_current_user)):
-    """Sync positions from Alpaca - similar to trades sync but for positions view"""
+    """Sync open trade prices from the positions mirror - similar to trades sync but for positions view"""
     # Get active account
     account = await get_active_account(current_user)
     if not account:
@@ -3498,13 +3588,11 @@ async def sync_positions(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Failed to initialize broker client")
     
     try:
-        # Get positions from Alpaca
-        positions = await broker_client.get_positions()
-        
         # Update current prices for open trades in database
         conn = get_db_connection()
         try:
             cursor = conn.cursor()
+            positions = await load_positions(cursor, account.id, broker_client)
             
             for pos in positions:
                 symbol = pos.get('symbol')
@@ -3569,40 +3657,29 @@ async def recalculate_pnl(current_user: User = Depends(get_current_user)):
         for sell_trade in sell_trades:
             trade_id, symbol, sell_quantity, sell_price, broker_order_id = sell_trade
             
-            # Check if we have position close notification
-            cursor.execute("""
-                SELECT data FROM trade_notifications 
-                WHERE trade_id = %s
-            """, (trade_id,))
-            
-            notifications = cursor.fetchall()
-            
-            for notification in notifications:
-                if notification[0]:
-                    notif_data = notification[0] if isinstance(notification[0], dict) else json.loads(notification[0])
+            # Check if we have a position close intent (pending or completed)
+            for intent_data in get_intents(cursor, trade_id, POSITION_CLOSE):
+                positions_to_close = intent_data.get('positions_to_close', [])
+                
+                if positions_to_close:
+                    total_pnl = 0
+                    for pos in positions_to_close:
+                        pos_entry_price = float(pos['entry_price'])
+                        pos_close_quantity = float(pos['close_quantity'])
+                        # Calculate P&L for this portion
+                        pos_pnl = (float(sell_price) - pos_entry_price) * pos_close_quantity
+                        total_pnl += pos_pnl
                     
-                    if notif_data.get('notification_type') in ['position_close_pending', 'position_close_completed']:
-                        positions_to_close = notif_data.get('positions_to_close', [])
-                        
-                        if positions_to_close:
-                            total_pnl = 0
-                            for pos in positions_to_close:
-                                pos_entry_price = float(pos['entry_price'])
-                                pos_close_quantity = float(pos['close_quantity'])
-                                # Calculate P&L for this portion
-                                pos_pnl = (float(sell_price) - pos_entry_price) * pos_close_quantity
-                                total_pnl += pos_pnl
-                            
-                            # Update the SELL trade with P&L
-                            cursor.execute("""
-                                UPDATE trades 
-                                SET pnl = %s,
-                                    exit_price = %s
-                                WHERE id = %s
-                            """, (total_pnl, sell_price, trade_id))
-                            
-                            recalculated_count += 1
-                            print(f"Recalculated P&L for trade {trade_id}: ${total_pnl:.2f}")
+                    # Update the SELL trade with P&L
+                    cursor.execute("""
+                        UPDATE trades 
+                        SET pnl = %s,
+                            exit_price = %s
+                        WHERE id = %s
+                    """, (total_pnl, sell_price, trade_id))
+                    
+                    recalculated_count += 1
+                    print(f"Recalculated P&L for trade {trade_id}: ${total_pnl:.2f}")
         
         conn.commit()
         
@@ -3642,8 +3719,8 @@ async def sync_dashboard(current_user: User = Depends(get_current_user)):
         imported_count = 0
         updated_count = 0
         
-        # Fetch all open positions from Alpaca
-        positions = await broker_client.get_positions()
+        # Open positions from the positions mirror (fetched from Alpaca only when stale)
+        positions = await load_positions(cursor, account.id, broker_client)
         position_map = {pos['symbol']: pos for pos in positions}
         
         for order in all_orders:
@@ -3686,60 +3763,41 @@ async def sync_dashboard(current_user: User = Depends(get_current_user)):
                 # Special handling for SELL orders that are filled
                 if action == 'SELL' and our_status == 'open' and alpaca_status == 'filled':
                     # Check if this is a position close
-                    cursor.execute("""
-                        SELECT data FROM trade_notifications 
-                        WHERE trade_id = %s
-                    """, (trade_id,))
-                    notifications = cursor.fetchall()
+                    pending = get_pending_intent(cursor, trade_id, POSITION_CLOSE)
                     
-                    for notification in notifications:
-                        if notification[0]:
-                            notif_data = notification[0] if isinstance(notification[0], dict) else json.loads(notification[0])
+                    if pending:
+                        intent_id, intent_data = pending
+                        positions_to_close = intent_data.get('positions_to_close', [])
+                        sell_price = float(order.get('filled_avg_price', 0))
+                        
+                        total_pnl = 0
+                        for pos in positions_to_close:
+                            pos_entry_price = pos['entry_price']
+                            pos_close_quantity = pos['close_quantity']
+                            pos_pnl = (sell_price - pos_entry_price) * pos_close_quantity
+                            total_pnl += pos_pnl
                             
-                            if notif_data.get('notification_type') == 'position_close_pending':
-                                positions_to_close = notif_data.get('positions_to_close', [])
-                                sell_price = float(order.get('filled_avg_price', 0))
-                                
-                                total_pnl = 0
-                                for pos in positions_to_close:
-                                    pos_entry_price = pos['entry_price']
-                                    pos_close_quantity = pos['close_quantity']
-                                    pos_pnl = (sell_price - pos_entry_price) * pos_close_quantity
-                                    total_pnl += pos_pnl
-                                    
-                                    if pos['remaining_quantity'] > 0:
-                                        cursor.execute("""
-                                            UPDATE trades 
-                                            SET quantity = %s
-                                            WHERE id = %s
-                                        """, (pos['remaining_quantity'], pos['id']))
-                                    else:
-                                        cursor.execute("""
-                                            UPDATE trades 
-                                            SET status = 'closed',
-                                                exit_price = %s,
-                                                pnl = %s,
-                                                closed_at = %s,
-                                                close_reason = 'Position closed'
-                                            WHERE id = %s
-                                        """, (sell_price, pos_pnl, order.get('filled_at'), pos['id']))
-                                
-                                pnl = total_pnl
-                                our_status = 'closed'
-                                
-                                notif_data['notification_type'] = 'position_close_completed'
+                            if pos['remaining_quantity'] > 0:
                                 cursor.execute("""
-                                    UPDATE trade_notifications 
-                                    SET data = %s
-                                    WHERE trade_id = %s AND id = (
-                                        SELECT id FROM trade_notifications 
-                                        WHERE trade_id = %s 
-                                        ORDER BY created_at DESC 
-                                        LIMIT 1
-                                    )
-                                """, (json.dumps(notif_data), trade_id, trade_id))
-                                
-                                break
+                                    UPDATE trades 
+                                    SET quantity = %s
+                                    WHERE id = %s
+                                """, (pos['remaining_quantity'], pos['id']))
+                            else:
+                                cursor.execute("""
+                                    UPDATE trades 
+                                    SET status = 'closed',
+                                        exit_price = %s,
+                                        pnl = %s,
+                                        closed_at = %s,
+                                        close_reason = 'Position closed'
+                                    WHERE id = %s
+                                """, (sell_price, pos_pnl, order.get('filled_at'), pos['id']))
+                        
+                        pnl = total_pnl
+                        our_status = 'closed'
+                        
+                        complete_intent(cursor, intent_id)
                 
                 # Always try to get the latest price for open trades and calculate floating P&L
                 if our_status == 'open':
@@ -3887,94 +3945,22 @@ async def sync_dashboard(current_user: User = Depends(get_current_user)):
         conn.commit()
         
         # Step 2: Calculate P&L and win rate from Alpaca data
-        # Filter only filled orders and organize by symbol
-        orders_by_symbol = {}
-        for order in all_orders:
-            if order['status'] == 'filled':
-                symbol = order['symbol']
-                if symbol not in orders_by_symbol:
-                    orders_by_symbol[symbol] = {'buys': [], 'sells': []}
-                
-                order_data = {
-                    'id': order['id'],
-                    'qty': float(order['filled_qty']),
-                    'price': float(order['filled_avg_price']),
-                    'time': order['filled_at'],
-                    'side': order['side'].upper()
-                }
-                
-                if order['side'].upper() == 'BUY':
-                    orders_by_symbol[symbol]['buys'].append(order_data)
-                else:
-                    orders_by_symbol[symbol]['sells'].append(order_data)
-        
-        # Calculate P&L for each symbol using FIFO
-        total_realized_pnl = 0
-        symbol_pnls = {}
-        winning_trades = 0
-        losing_trades = 0
-        total_closed_trades = 0
-        
-        for symbol, orders in orders_by_symbol.items():
-            # Sort by time (oldest first for FIFO)
-            buys = sorted(orders['buys'], key=lambda x: x['time'])
-            sells = sorted(orders['sells'], key=lambda x: x['time'])
-            
-            # FIFO matching
-            buy_queue = []
-            realized_pnl = 0
-            
-            for buy in buys:
-                buy_queue.append({
-                    'qty': buy['qty'],
-                    'price': buy['price'],
-                    'remaining': buy['qty']
-                })
-            
-            for sell in sells:
-                sell_qty = sell['qty']
-                sell_price = sell['price']
-                sell_id = sell['id']
-                sell_pnl = 0
-                matched = False
-                
-                # Match against buy queue (FIFO)
-                while sell_qty > 0 and buy_queue:
-                    buy_order = buy_queue[0]
-                    match_qty = min(buy_order['remaining'], sell_qty)
-                    pnl = (sell_price - buy_order['price']) * match_qty
-                    sell_pnl += pnl
-                    realized_pnl += pnl
-                    buy_order['remaining'] -= match_qty
-                    sell_qty -= match_qty
-                    matched = True
-                    # Track win/loss per match
-                    total_closed_trades += 1
-                    if pnl > 0:
-                        winning_trades += 1
-                    elif pnl < 0:
-                        losing_trades += 1
-                    if buy_order['remaining'] == 0:
-                        buy_queue.pop(0)
-                
-                # Update database with calculated P&L for this SELL trade
-                if matched:
-                    cursor.execute("""
-                        UPDATE trades 
-                        SET pnl = %s
-                        WHERE broker_order_id = %s AND action = 'SELL'
-                    """, (
-                        sell_pnl,
-                        sell_id
-                    ))
-            
-            symbol_pnls[symbol] = realized_pnl
-            total_realized_pnl += realized_pnl
-        
-        # Calculate win rate
-        win_rate = 0
-        if total_closed_trades > 0:
-            win_rate = (winning_trades / total_closed_trades) * 100
+        # FIFO matching is pure CPU work over the whole order history - run it in the process pool
+        pnl_results = await run_in_pool('cpu', fifo_realized_pnl, all_orders)
+        total_realized_pnl = pnl_results['total_realized_pnl']
+        symbol_pnls = pnl_results['symbol_pnls']
+        winning_trades = pnl_results['winning_trades']
+        losing_trades = pnl_results['losing_trades']
+        total_closed_trades = pnl_results['total_closed_trades']
+        win_rate = pnl_results['win_rate']
+        
+        # Update database with calculated P&L for each matched SELL trade
+        if pnl_results['sell_pnls']:
+            cursor.executemany("""
+                UPDATE trades 
+                SET pnl = %s
+                WHERE broker_order_id = %s AND action = 'SELL'
+            """, [(sell_pnl, sell_id) for sell_id, sell_pnl in pnl_results['sell_pnls']])
         
         # Save realized P&L and win rate to the account
         cursor.execute("""
@@ -4170,6 +4156,12 @@ async def process_trade_levels(trade_id: int, signal_dict: dict, filled_quantity
                         print(f"  - Stop Loss: ${stop_loss_price} (all remaining shares)")
             except (ValueError, TypeError) as e:
                 print(f"Error processing stop loss price '{stop_loss_price}': {e}")
+        
+        # Hand the levels to the broker as native OCO/stop/limit orders
+        if BROKER_NATIVE_LEVELS and await submit_broker_levels(cursor, trade_id):
+            print(f"  - Levels for trade {trade_id} are working at the broker")
+        
+        mark_trade_stage(cursor, trade_id, 'levels_armed_at')
             
     except Exception as e:
         print(f"Error processing trade levels for trade {trade_id}: {e}")
@@ -4261,6 +4253,11 @@ async def get_script_manager_status():
             from script_manager import script_manager
             status = script_manager.get_status()
             api_usage = script_manager.get_api_usage_summary()
+            change_events = script_manager.get_change_events_status()
+            from process_modules.level_scheduler import level_scheduler
+            level_schedule = level_scheduler.get_stats()
+            from process_modules.account_fanout import get_account_metrics
+            account_fanout = get_account_metrics()
         except ImportError as import_error:
             print(f"Script manager not available: {import_error}")
             # Return a placeholder response when script manager is not available
@@ -4275,6 +4272,7 @@ async def get_script_manager_status():
                 "total_processes": 0,
                 "running_processes": 0,
                 "error_processes": 0,
+                "background_error": startup_timer.background_error,
                 "status": "Script Manager not available - using legacy system"
             }
         
@@ -4295,7 +4293,9 @@ async def get_script_manager_status():
                     "error_count": process_status.metrics.error_count,
                     "avg_duration": process_status.metrics.avg_duration,
                     "api_calls_last_minute": process_status.metrics.api_calls_last_minute,
-                    "last_error_message": process_status.metrics.last_error_message
+                    "last_error_message": process_status.metrics.last_error_message,
+                    "event_wakeups": process_status.metrics.event_wakeups,
+                    "duration": PROCESS_CYCLE_SECONDS.summary(process_name, "success")
                 },
                 "resource_usage": process_status.resource_usage
             }
@@ -4303,6 +4303,22 @@ async def get_script_manager_status():
         return {
             "processes": status_dict,
             "api_usage": api_usage,
+            "change_events": change_events,
+            "leadership": script_manager.get_leadership_status(),
+            "level_schedule": level_schedule,
+            "account_fanout": account_fanout,
+            "latency": {
+                "routes": HTTP_REQUEST_SECONDS.summaries(2),
+                "db_queries_per_request": HTTP_REQUEST_DB_QUERIES.summaries(2),
+                "broker_calls": BROKER_CALL_SECONDS.summaries(1),
+                "db_queries_total": DB_QUERIES.values().get("db_queries_total", 0)
+            },
+            "event_loop": loop_watchdog.summary(),
+            "executors": executors_summary(),
+            "startup": startup_timer.summary(),
+            "background_error": startup_timer.background_error,
+            "assets": asset_cache.summary(),
+            "signal_parser": signal_parser.summary(),
             "total_processes": len(status_dict),
             "running_processes": len([s for s in status_dict.values() if s["status"] == "running"]),
             "error_processes": len([s for s in status_dict.values() if s["status"] == "error"])
@@ -4350,7 +4366,7 @@ async def get_monitoring_levels(current_user: User = Depends(get_current_user)):
         cursor.execute("""
             SELECT 
                 sl.id, sl.trade_id, sl.price, sl.status, 
-                t.symbol, t.action, t.quantity
+                t.symbol, t.action, t.remaining_quantity
             FROM stop_loss_levels sl
             JOIN trades t ON sl.trade_id = t.id
             WHERE t.user_id = %s AND sl.status = 'active'
@@ -4361,14 +4377,7 @@ async def get_monitoring_levels(current_user: User = Depends(get_current_user)):
         stop_loss_monitoring = []
         
         for level in sl_levels:
-            # Calculate remaining shares (total shares minus executed take profit levels)
-            cursor.execute("""
-                SELECT COALESCE(SUM(shares_quantity), 0) as executed_shares
-                FROM take_profit_levels 
-                WHERE trade_id = %s AND status = 'executed'
-            """, (level[1],))
-            executed_tp_shares = cursor.fetchone()[0]
-            remaining_shares = float(level[6]) - float(executed_tp_shares)
+            remaining_shares = float(level[6])
             
             stop_loss_monitoring.append({
                 "id": level[0],
@@ -4424,9 +4433,11 @@ async def sell_all_remaining_shares(
     try:
         cursor = conn.cursor()
         
-        # Get the original trade
+        # Get the original trade with the shares still tied up in pending TP levels
         cursor.execute("""
-            SELECT t.*, a.id as account_id, a.api_key, a.api_secret, a.account_type, a.broker
+            SELECT t.*, a.id as account_id, a.api_key, a.api_secret, a.account_type, a.broker,
+                   (SELECT COALESCE(SUM(shares_quantity), 0) FROM take_profit_levels
+                    WHERE trade_id = t.id AND status = 'pending') as pending_tp_shares
             FROM trades t
             JOIN accounts a ON t.account_id = a.id
             WHERE t.id = %s AND t.user_id = %s
@@ -4442,24 +4453,12 @@ async def sell_all_remaining_shares(
         
         print(f"🎯 SELL ALL: Trade {trade_id} ({trade['symbol']})")
         
-        # Calculate remaining shares 
-        cursor.execute("""
-            SELECT COALESCE(SUM(shares_quantity), 0) as executed_shares
-            FROM take_profit_levels 
-            WHERE trade_id = %s AND status = 'executed'
-        """, (trade_id,))
-        executed_tp_shares = cursor.fetchone()[0] or 0
-        
-        # Check pending levels that might be tying up shares at broker
-        cursor.execute("""
-            SELECT COALESCE(SUM(shares_quantity), 0) as pending_shares
-            FROM take_profit_levels 
-            WHERE trade_id = %s AND status = 'pending'
-        """, (trade_id,))
-        pending_tp_shares = cursor.fetchone()[0] or 0
+        # Remaining shares are maintained on the trade as levels execute
+        executed_tp_shares = float(trade['executed_quantity'])
+        pending_tp_shares = trade['pending_tp_shares'] or 0
         
         total_shares = float(trade['quantity'])
-        remaining_shares = total_shares - float(executed_tp_shares)
+        remaining_shares = float(trade['remaining_quantity'])
         
         print(f"   Shares: {remaining_shares} available ({total_shares} total - {executed_tp_shares} executed)")
         if pending_tp_shares > 0:
@@ -4482,6 +4481,23 @@ async def sell_all_remaining_shares(
         if not broker_client:
             raise HTTPException(status_code=400, detail="Unable to connect to broker")
         
+        # Broker-native exit orders hold the shares - cancel them (after applying any fills)
+        _, still_working = await cancel_broker_levels(cursor, broker_client, trade['account_id'], trade_id)
+        if still_working:
+            # An exit order could not be confirmed cancelled and may still sell shares
+            conn.commit()
+            raise HTTPException(
+                status_code=409,
+                detail="Exit orders are still working at the broker - try again in a few seconds"
+            )
+        
+        # Fills that raced the cancel are booked by now - sell only what is really left
+        cursor.execute("SELECT remaining_quantity FROM trades WHERE id = %s", (trade_id,))
+        remaining_shares = float(cursor.fetchone()[0])
+        if remaining_shares <= 0:
+            conn.commit()
+            raise HTTPException(status_code=400, detail="No remaining shares to sell")
+        
         # Get current market price
         market_data = await broker_client.get_market_data(trade['symbol'])
         current_price = market_data.get('last', 0)
@@ -4807,9 +4823,6 @@ async def cleanup_orphaned_levels(current_user: User = Depends(get_current_user)
         conn.close()
 
 # Database Compare APIs
-from services.database_compare_service import DatabaseCompareService
-
-db_compare_service = DatabaseCompareService()
 
 @app.get("/api/database-connections")
 async def get_database_connections(current_user: User = Depends(get_current_user)):
@@ -4847,7 +4860,7 @@ async def create_database_connection(
         cursor = conn.cursor()
         
         # Encrypt the password
-        encrypted_password = db_compare_service.encrypt_password(connection.password)
+        encrypted_password = get_db_compare_service().encrypt_password(connection.password)
         
         cursor.execute("""
             INSERT INTO database_connections 
@@ -4919,7 +4932,7 @@ async def update_database_connection(
             update_fields.append("username = %s")
             values.append(connection_update.username)
         if connection_update.password is not None:
-            encrypted_password = db_compare_service.encrypt_password(connection_update.password)
+            encrypted_password = get_db_compare_service().encrypt_password(connection_update.password)
             update_fields.append("password_encrypted = %s")
             values.append(encrypted_password)
         if connection_update.connection_type is not None:
@@ -5022,10 +5035,10 @@ async def test_database_connection(
             raise HTTPException(status_code=404, detail="Connection not found")
         
         host, port, db_name, username, encrypted_password = result
-        password = db_compare_service.decrypt_password(encrypted_password)
+        password = get_db_compare_service().decrypt_password(encrypted_password)
         
         # Test the connection
-        test_result = db_compare_service.test_connection(host, port, db_name, username, password)
+        test_result = get_db_compare_service().test_connection(host, port, db_name, username, password)
         
         # Update test result in database
         cursor.execute("""
@@ -5068,11 +5081,11 @@ async def compare_database_schemas(
             raise HTTPException(status_code=404, detail="Connection not found")
         
         host, port, db_name, username, encrypted_password = result
-        password = db_compare_service.decrypt_password(encrypted_password)
+        password = get_db_compare_service().decrypt_password(encrypted_password)
         
         # Get local schema using actual DB config
         from db import DB_CONFIG
-        local_schema = db_compare_service.get_database_schema(
+        local_schema = get_db_compare_service().get_database_schema(
             DB_CONFIG['host'], 
             int(DB_CONFIG['port']), 
             DB_CONFIG['database'], 
@@ -5081,10 +5094,10 @@ async def compare_database_schemas(
         )
         
         # Get remote schema
-        remote_schema = db_compare_service.get_database_schema(host, port, db_name, username, password)
+        remote_schema = get_db_compare_service().get_database_schema(host, port, db_name, username, password)
         
         # Compare schemas
-        differences, migrations = db_compare_service.compare_schemas(local_schema, remote_schema)
+        differences, migrations = get_db_compare_service().compare_schemas(local_schema, remote_schema)
         
         # Store comparison result
         cursor.execute("""
@@ -5206,7 +5219,7 @@ async def apply_migrations(
         migrations_json, host, port, db_name, username, encrypted_password = result
         # migrations_json is already parsed by PostgreSQL JSON type, no need for json.loads()
         migrations = migrations_json if isinstance(migrations_json, list) else json.loads(migrations_json)
-        password = db_compare_service.decrypt_password(encrypted_password)
+        password = get_db_compare_service().decrypt_password(encrypted_password)
         
         # Connect to remote database
         remote_conn = psycopg2.connect(
@@ -5259,6 +5272,8 @@ async def apply_migrations(
     finally:
         conn.close()
 
+startup_timer.mark('app_setup')
+
 if __name__ == "__main__":
     # Get port from environment variable (for Render) or default to 8000
     port = int(os.getenv("PORT", 8000))
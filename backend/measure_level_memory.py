@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Measure resident memory per monitored level
+
+Builds the same levels in each in-memory representation and reports the
+bytes allocated per level (tracemalloc, so only Python-level allocations):
+
+- dict: the previous monitor/main.py level dict with per-level account tuple
+- LevelRecord: slotted record from level_records.py
+- LevelBook: NumPy columns from process_modules/level_book.py
+
+No database or broker needed:
+
+    python measure_level_memory.py [--sizes 10000,100000] [--symbols 500]
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from benchmark_level_triggers import make_levels
+from level_records import LevelRecord
+from process_modules.level_book import LevelBook
+
+CREDENTIALS = ('PKEXAMPLEKEY0000000', 'example-secret-0000000000000000000000000', 'paper')
+
+
+def as_dicts(rows):
+    return [{
+        'type': kind,
+        'id': level_id,
+        'trade_id': trade_id,
+        'level_number': level_number,
+        'price': float(trigger),
+        'shares': float(quantity),
+        'symbol': symbol,
+        'action': action,
+        'user_id': trade_id % 50,
+        'account_data': (trade_id % 20,) + CREDENTIALS
+    } for kind, level_id, trade_id, trigger, quantity, level_number, symbol, action in rows]
+
+
+def as_records(rows):
+    return [LevelRecord(kind, level_id, trade_id, level_number, float(trigger), float(quantity),
+                        symbol, action, trade_id % 50, trade_id % 20)
+            for kind, level_id, trade_id, trigger, quantity, level_number, symbol, action in rows]
+
+
+def bytes_allocated(build, rows) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(rows)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--symbols', type=int, default=500)
+    args = parser.parse_args()
+
+    representations = (('dict', as_dicts), ('LevelRecord', as_records), ('LevelBook', LevelBook))
+    print(f"{'levels':>8} " + " ".join(f"{name + ' B/level':>20}" for name, _ in representations))
+    for size in (int(s) for s in args.sizes.split(',')):
+        rows, _ = make_levels(size, args.symbols)
+        per_level = [bytes_allocated(build, rows) / size for _, build in representations]
+        print(f"{size:>8} " + " ".join(f"{value:>20.1f}" for value in per_level))
+
+
+if __name__ == "__main__":
+    main()
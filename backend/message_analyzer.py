@@ -5,9 +5,10 @@ Analyzes messages to extract trading signals
 import os
 import json
 from typing import Dict, List, Optional, Any
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from startup_timing import lazy_import
+
 load_dotenv()
 
 class MessageAnalyzer:
@@ -15,6 +16,8 @@ class MessageAnalyzer:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
+        # The openai package takes ~0.4s to import - only pay for it when the analyzer is first used
+        OpenAI = lazy_import('openai').OpenAI
         self.client = OpenAI(api_key=api_key)
         
     def analyze_message(self, message: str) -> Dict[str, Any]:
@@ -238,5 +241,13 @@ Message to analyze:
             
         return db_signals
 
-# Create a singleton instance
-message_analyzer = MessageAnalyzer() if os.getenv("OPENAI_API_KEY") else None 
\ No newline at end of file
+_message_analyzer: Optional[MessageAnalyzer] = None
+
+
+def get_message_analyzer() -> Optional[MessageAnalyzer]:
+    """Shared instance, created on first use; None when OPENAI_API_KEY is not set"""
+    global _message_analyzer
+    if _message_analyzer is None and os.getenv("OPENAI_API_KEY"):
+        _message_analyzer = MessageAnalyzer()
+    return _message_analyzer
+ 
\ No newline at end of file
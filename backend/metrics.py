@@ -0,0 +1,286 @@
+"""
+In-process metrics registry
+
+Latency histograms and counters for API requests (per route template), Script
+Manager cycles, broker calls, database queries and worker pools. Rendered in the Prometheus
+text format on /metrics and summarised in /api/script-manager/status.
+
+Every process keeps its own registry - with several uvicorn workers each one
+reports only the requests it served.
+"""
+
+import bisect
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Series:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Fixed-bucket histogram with one series per label combination"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        # bisect_left puts a value equal to a bound in that bound's bucket (le semantics)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = _Series(len(self.buckets) + 1)
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+
+    def _merged(self, prefix: Tuple[str, ...]) -> Optional[_Series]:
+        """All series whose labels start with prefix, added together"""
+        merged = None
+        with self._lock:
+            for labels, series in self._series.items():
+                if labels[:len(prefix)] != prefix:
+                    continue
+                if merged is None:
+                    merged = _Series(len(series.counts))
+                merged.counts = [a + b for a, b in zip(merged.counts, series.counts)]
+                merged.sum += series.sum
+                merged.count += series.count
+        return merged
+
+    def _quantile(self, series: _Series, q: float) -> float:
+        """Linear interpolation inside the bucket holding the q-th observation (like histogram_quantile)"""
+        rank = q * series.count
+        cumulative = 0
+        for index, count in enumerate(series.counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return float(self.buckets[-1])  # +Inf bucket: best we can say is "above the last bound"
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return 0.0
+
+    def summary(self, *prefix: str) -> Optional[Dict[str, float]]:
+        """count / avg / p50 / p95 / p99 over every series matching the label prefix"""
+        series = self._merged(prefix)
+        if series is None or not series.count:
+            return None
+        return {
+            "count": series.count,
+            "avg": round(series.sum / series.count, 6),
+            "p50": round(self._quantile(series, 0.50), 6),
+            "p95": round(self._quantile(series, 0.95), 6),
+            "p99": round(self._quantile(series, 0.99), 6),
+        }
+
+    def summaries(self, depth: int) -> Dict[str, Dict[str, float]]:
+        """summary() per distinct value of the first `depth` labels, keyed 'a b'"""
+        with self._lock:
+            prefixes = sorted({labels[:depth] for labels in self._series})
+        return {' '.join(prefix): self.summary(*prefix) for prefix in prefixes}
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items())
+            for labels, series in items:
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), series.counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{_format_number(bound)}"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(series.sum)}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {series.count}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one value per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self) -> Dict[str, float]:
+        with self._lock:
+            return {' '.join(labels) or self.name: value for labels, value in sorted(self._values.items())}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}'
+                    for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, one per label combination"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def get(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'API request latency by route template', ('method', 'route'))
+HTTP_REQUESTS = registry.counter(
+    'http_requests_total', 'API requests by route template and status code', ('method', 'route', 'status'))
+HTTP_REQUEST_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'Database statements executed while serving one API request',
+    ('method', 'route'), COUNT_BUCKETS)
+PROCESS_CYCLE_SECONDS = registry.histogram(
+    'script_manager_cycle_duration_seconds', 'Script Manager process run duration', ('process', 'outcome'))
+BROKER_CALL_SECONDS = registry.histogram(
+    'broker_call_duration_seconds', 'AlpacaClient call latency by method', ('method', 'outcome'))
+DB_QUERIES = registry.counter('db_queries_total', 'Database statements executed')
+DB_QUERY_SECONDS = registry.histogram(
+    'db_query_duration_seconds', 'Database statement latency by calling endpoint or process', ('caller',))
+EVENT_LOOP_LAG_SECONDS = registry.histogram(
+    'event_loop_lag_seconds', 'Delay of the loop watchdog heartbeat beyond its scheduled wake-up', (), LAG_BUCKETS)
+EVENT_LOOP_STALLS = registry.counter(
+    'event_loop_stalls_total', 'Heartbeats delayed past EVENT_LOOP_LAG_THRESHOLD_MS')
+EXECUTOR_QUEUED = registry.gauge(
+    'executor_queued_tasks', 'Tasks submitted to a worker pool and waiting for a free worker', ('pool',))
+EXECUTOR_RUNNING = registry.gauge(
+    'executor_running_tasks', 'Tasks currently running in a worker pool', ('pool',))
+EXECUTOR_TASK_SECONDS = registry.histogram(
+    'executor_task_duration_seconds', 'Worker pool task time spent queued (wait) and running (run)',
+    ('pool', 'phase'))
+EXECUTOR_TASKS = registry.counter(
+    'executor_tasks_total', 'Worker pool tasks by outcome', ('pool', 'outcome'))
+STARTUP_PHASE_SECONDS = registry.gauge(
+    'startup_phase_duration_seconds', 'Time spent in each API startup phase', ('phase',))
+SIGNAL_SYMBOL_CANDIDATES = registry.counter(
+    'signal_symbol_candidates_total', 'Symbol candidates seen by the regex signal parser by outcome', ('outcome',))
+
+
+class QueryContext:
+    """Who is issuing database statements right now, and how many so far.
+
+    caller is fixed for processes ("process:trade_sync"); API requests pass their
+    ASGI scope instead, because the route is only known once routing has run.
+    """
+
+    __slots__ = ('caller', 'scope', 'count')
+
+    def __init__(self, caller: Optional[str] = None, scope: Optional[dict] = None):
+        self.caller = caller
+        self.scope = scope
+        self.count = 0
+
+    def name(self) -> str:
+        if self.caller is None and self.scope is not None:
+            route = self.scope.get('route')
+            if route is None:
+                return 'unmatched'
+            self.caller = f"{self.scope.get('method')} {route.path}"
+        return self.caller or 'unattributed'
+
+
+_query_context: contextvars.ContextVar[Optional[QueryContext]] = contextvars.ContextVar('query_context', default=None)
+
+
+def record_db_query(duration: float) -> str:
+    """Called by the instrumented cursor for every execute()/executemany(); returns the caller"""
+    context = _query_context.get()
+    caller = context.name() if context is not None else 'unattributed'
+    if context is not None:
+        context.count += 1
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe(duration, caller)
+    return caller
+
+
+@contextmanager
+def query_context(caller: Optional[str] = None, scope: Optional[dict] = None):
+    """Attribute statements in this context (and tasks/threads copied from it) to caller; yields the QueryContext"""
+    context = QueryContext(caller, scope)
+    token = _query_context.set(context)
+    try:
+        yield context
+    finally:
+        _query_context.reset(token)
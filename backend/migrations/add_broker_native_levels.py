@@ -0,0 +1,40 @@
+"""
+Migration for broker-native take profit / stop loss orders
+
+Adds the 'working' level status, execution_mode and stop_leg_order_id
+(see broker_levels.py). Safe to run again.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from level_claims import ensure_level_claim_columns
+from broker_levels import ensure_broker_level_columns
+
+def migrate():
+    """Add broker-native level status and columns"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print("🔄 Updating level status constraints...")
+        ensure_level_claim_columns(cursor)
+
+        print("🔄 Adding broker-native level columns...")
+        ensure_broker_level_columns(cursor)
+
+        conn.commit()
+        print("✅ Broker-native levels migration completed successfully!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration failed: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,34 @@
+"""
+Migration to add NOTIFY triggers used by the Script Manager to wake processes
+on trades / take_profit_levels / stop_loss_levels / signals changes
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from change_listener import install_notify_triggers, WATCHED_TABLES
+
+def migrate():
+    """Install the table change notify triggers"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print(f"🔄 Installing change notify triggers on {', '.join(WATCHED_TABLES)}...")
+        install_notify_triggers(cursor)
+
+        conn.commit()
+        print("✅ Change notify triggers installed!")
+
+    except Exception as e:
+        print(f"❌ Error installing change notify triggers: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,114 @@
+"""
+Migration to add indexes for the level monitor / trade sync hot paths
+
+Indexes are built CONCURRENTLY so trades and level tables stay writable while
+the migration runs. A concurrent build that fails leaves an INVALID index
+behind; those are dropped and rebuilt on the next run.
+
+Run check_query_plans.py afterwards to confirm the hot queries use them.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+# (index name, table, CREATE INDEX body after "ON")
+HOT_PATH_INDEXES = [
+    (
+        "idx_take_profit_levels_pending_trade",
+        "take_profit_levels",
+        "take_profit_levels(trade_id) WHERE status = 'pending'"
+    ),
+    (
+        "idx_stop_loss_levels_active_trade",
+        "stop_loss_levels",
+        "stop_loss_levels(trade_id) WHERE status = 'active'"
+    ),
+    (
+        "idx_trades_account_status",
+        "trades",
+        "trades(account_id, status)"
+    ),
+]
+
+BROKER_ORDER_INDEX = "idx_trades_broker_order_id"
+
+def index_state(cursor, index_name):
+    """Return None if the index is missing, otherwise whether it is valid"""
+    cursor.execute("""
+        SELECT i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+    """, (index_name,))
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+def build_index(cursor, index_name, definition, unique=False):
+    """Create an index concurrently, replacing an invalid leftover if present"""
+    state = index_state(cursor, index_name)
+
+    if state is True:
+        print(f"✅ {index_name} already exists")
+        return
+
+    if state is False:
+        print(f"🔄 Dropping invalid index {index_name} from an interrupted build...")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+    print(f"🔄 Building {index_name}...")
+    cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {definition}")
+    print(f"✅ {index_name} created")
+
+def run_migration():
+    """Create the hot path indexes"""
+    conn = get_db_connection()
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+
+    try:
+        cursor = conn.cursor()
+
+        for index_name, _table, definition in HOT_PATH_INDEXES:
+            build_index(cursor, index_name, definition)
+
+        # Refuse to build the unique index over existing duplicates
+        cursor.execute("""
+            SELECT broker_order_id, array_agg(id ORDER BY id)
+            FROM trades
+            WHERE broker_order_id IS NOT NULL
+            GROUP BY broker_order_id
+            HAVING COUNT(*) > 1
+        """)
+        duplicates = cursor.fetchall()
+
+        if duplicates:
+            print(f"❌ {len(duplicates)} broker_order_id values are shared by several trades:")
+            for broker_order_id, trade_ids in duplicates[:20]:
+                print(f"   {broker_order_id}: trades {trade_ids}")
+            print(f"❌ Skipping unique {BROKER_ORDER_INDEX} - resolve the duplicates and re-run")
+            return False
+
+        build_index(
+            cursor, BROKER_ORDER_INDEX,
+            "trades(broker_order_id) WHERE broker_order_id IS NOT NULL",
+            unique=True
+        )
+
+        # Refresh planner statistics so the new indexes are costed correctly
+        for table in ("take_profit_levels", "stop_loss_levels", "trades"):
+            cursor.execute(f"ANALYZE {table}")
+
+        print("✅ Hot path indexes ready")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error creating hot path indexes: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(0 if run_migration() else 1)
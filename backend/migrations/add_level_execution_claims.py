@@ -0,0 +1,36 @@
+"""
+Migration to support claimed (row-locked, idempotent) level execution
+
+Adds the 'executing' status plus claimed_at / claimed_by / execution_attempts
+to take_profit_levels and stop_loss_levels (see level_claims.py).
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from level_claims import ensure_level_claim_columns
+
+def migrate():
+    """Add level claim status and columns"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print("🔄 Adding 'executing' status and claim columns to level tables...")
+        ensure_level_claim_columns(cursor)
+
+        conn.commit()
+        print("✅ Level execution claims migration completed successfully!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration failed: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,39 @@
+"""
+Migration to maintain executed_quantity / remaining_quantity on trades
+
+Installs the triggers from trade_quantities.py and backfills both columns from
+the levels already executed.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from trade_quantities import install_trade_quantity_tracking, backfill_trade_quantities
+
+def migrate():
+    """Add maintained quantity columns to trades and backfill them"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print("🔄 Installing executed/remaining quantity columns and triggers...")
+        install_trade_quantity_tracking(cursor)
+
+        print("🔄 Backfilling quantities from executed levels...")
+        updated = backfill_trade_quantities(cursor)
+
+        conn.commit()
+        print(f"✅ Trade quantities maintained ({updated} trades backfilled)")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration failed: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
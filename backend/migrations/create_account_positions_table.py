@@ -0,0 +1,37 @@
+"""
+Migration to add the per-account positions mirror
+
+Creates account_positions, account_positions_sync and position_fills. The
+mirror fills on the position_sync process's next reconcile; until then the
+positions endpoints fetch from the broker as before.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from positions_mirror import create_account_positions_table
+
+def migrate():
+    """Create the positions mirror tables and their indexes"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print("🔄 Creating account_positions tables...")
+        create_account_positions_table(cursor)
+
+        conn.commit()
+        print("✅ account_positions tables ready")
+
+    except Exception as e:
+        print(f"❌ Error creating account_positions tables: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,36 @@
+"""
+Migration to add the assets table (daily broker asset snapshot)
+
+The Asset Refresh process fills it on its first run; until then asset
+lookups fall back to one get_asset() call per symbol.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from asset_cache import create_assets_table
+
+def migrate():
+    """Create the assets table"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print("🔄 Creating assets table...")
+        create_assets_table(cursor)
+
+        conn.commit()
+        print("✅ assets table ready")
+
+    except Exception as e:
+        print(f"❌ Error creating assets table: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
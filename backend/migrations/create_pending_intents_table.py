@@ -0,0 +1,79 @@
+"""
+Migration to move pending trade intents out of trade_notifications
+
+custom_levels_pending / position_close_pending rows (and completed position
+closes, which recalculate_pnl still reads) are copied into
+trade_pending_intents and removed from the notification feed.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from pending_intents import create_pending_intents_table
+
+def migrate():
+    """Create trade_pending_intents and migrate existing intent rows"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print("🔄 Creating trade_pending_intents table...")
+        create_pending_intents_table(cursor)
+
+        print("🔄 Migrating intents from trade_notifications...")
+        cursor.execute("""
+            INSERT INTO trade_pending_intents (
+                trade_id, user_id, intent_type, status, data, created_at, completed_at
+            )
+            SELECT tn.trade_id,
+                   tn.user_id,
+                   CASE WHEN tn.data->>'notification_type' = 'custom_levels_pending'
+                        THEN 'custom_levels' ELSE 'position_close' END,
+                   CASE WHEN tn.data->>'notification_type' = 'position_close_completed'
+                        THEN 'completed' ELSE 'pending' END,
+                   tn.data - 'notification_type',
+                   tn.created_at,
+                   CASE WHEN tn.data->>'notification_type' = 'position_close_completed'
+                        THEN tn.created_at END
+            FROM trade_notifications tn
+            JOIN trades t ON t.id = tn.trade_id
+            WHERE tn.data->>'notification_type' IN (
+                'custom_levels_pending', 'position_close_pending', 'position_close_completed'
+            )
+        """)
+        migrated = cursor.rowcount
+
+        # Custom levels for trades that already have levels were consumed
+        cursor.execute("""
+            UPDATE trade_pending_intents pi
+            SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+            WHERE pi.intent_type = 'custom_levels'
+            AND pi.status = 'pending'
+            AND (
+                EXISTS (SELECT 1 FROM take_profit_levels tp WHERE tp.trade_id = pi.trade_id)
+                OR EXISTS (SELECT 1 FROM stop_loss_levels sl WHERE sl.trade_id = pi.trade_id)
+            )
+        """)
+
+        cursor.execute("""
+            DELETE FROM trade_notifications
+            WHERE data->>'notification_type' IN (
+                'custom_levels_pending', 'position_close_pending', 'position_close_completed'
+            )
+        """)
+
+        conn.commit()
+        print(f"✅ Migrated {migrated} pending intents")
+
+    except Exception as e:
+        print(f"❌ Error migrating pending intents: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
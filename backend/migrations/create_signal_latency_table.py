@@ -0,0 +1,36 @@
+"""
+Migration to add signal_latency (per-stage signal-to-fill timestamps)
+
+Only signals received after this runs are traced - the older tables do not
+hold webhook receipt, analysis or broker acknowledgement times.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from signal_latency import create_signal_latency_table
+
+def migrate():
+    """Create signal_latency and its indexes"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        print("🔄 Creating signal_latency table...")
+        create_signal_latency_table(cursor)
+
+        conn.commit()
+        print("✅ signal_latency table ready")
+
+    except Exception as e:
+        print(f"❌ Error creating signal_latency table: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,76 @@
+"""
+Migration to convert webhook_logs into a daily range-partitioned table
+
+Existing rows inside the retention window are copied into the new partitions,
+the rest are discarded with the old table.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from webhook_logs import (
+    create_webhook_logs_table, ensure_partitions, get_webhook_logs_kind, WEBHOOK_LOG_RETENTION_DAYS
+)
+
+def migrate():
+    """Replace webhook_logs with a partitioned table"""
+    conn = get_db_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        kind = get_webhook_logs_kind(cursor)
+
+        if kind == 'p':
+            print("✅ webhook_logs is already partitioned")
+            ensure_partitions(cursor)
+            conn.commit()
+            return
+
+        if kind:
+            print("🔄 Renaming existing webhook_logs to webhook_logs_legacy...")
+            cursor.execute("ALTER TABLE webhook_logs RENAME TO webhook_logs_legacy")
+            cursor.execute("ALTER INDEX IF EXISTS idx_webhook_logs_created_at RENAME TO idx_webhook_logs_legacy_created_at")
+            cursor.execute("ALTER INDEX IF EXISTS idx_webhook_logs_processed RENAME TO idx_webhook_logs_legacy_processed")
+            cursor.execute("ALTER SEQUENCE IF EXISTS webhook_logs_id_seq RENAME TO webhook_logs_legacy_id_seq")
+
+        print("🔄 Creating partitioned webhook_logs table...")
+        create_webhook_logs_table(cursor)
+
+        start = datetime.utcnow().date() - timedelta(days=WEBHOOK_LOG_RETENTION_DAYS)
+        ensure_partitions(cursor, start=start, days_ahead=WEBHOOK_LOG_RETENTION_DAYS + 3)
+
+        if kind:
+            print(f"🔄 Copying last {WEBHOOK_LOG_RETENTION_DAYS} days of webhook logs...")
+            cursor.execute("""
+                INSERT INTO webhook_logs (
+                    instance_id, event_type, payload, payload_hash, payload_size,
+                    processed, created_at
+                )
+                SELECT instance_id, event_type, payload,
+                       encode(sha256(convert_to(payload::text, 'UTF8')), 'hex'),
+                       octet_length(payload::text),
+                       COALESCE(processed, FALSE),
+                       COALESCE(created_at, CURRENT_TIMESTAMP)
+                FROM webhook_logs_legacy
+                WHERE created_at >= %s OR created_at IS NULL
+            """, (start,))
+            print(f"✅ Copied {cursor.rowcount} rows")
+
+            cursor.execute("DROP TABLE webhook_logs_legacy")
+
+        conn.commit()
+        print("✅ webhook_logs partitioning complete!")
+
+    except Exception as e:
+        print(f"❌ Error partitioning webhook_logs: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
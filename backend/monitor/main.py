@@ -29,6 +29,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db import get_db_connection
 from alpaca_client import AlpacaClient
+from level_claims import claim_level, release_level, submit_level_order
+from level_records import LevelRecord, PriceCache
 
 # Configure logging
 logging.basicConfig(
@@ -43,8 +45,8 @@ class TradeLevelMonitor:
     def __init__(self, check_interval: float = 1.0):
         self.check_interval = check_interval
         self.active_symbols = set()
-        self.price_cache = {}
-        self.last_price_update = {}
+        self.price_cache = PriceCache(max_age=5)
+        self.accounts: Dict[int, Tuple] = {}  # account id -> (id, api_key, api_secret, account_type)
         self.broker_clients = {}  # Cache of broker clients
         logger.info(f"TradeLevelMonitor initialized with {check_interval}s interval")
     
@@ -67,7 +69,7 @@ class TradeLevelMonitor:
         
         return self.broker_clients.get(account_id)
     
-    async def get_active_levels(self) -> List[Dict]:
+    async def get_active_levels(self) -> List[LevelRecord]:
         """Get all active take profit and stop loss levels from database"""
         conn = get_db_connection()
         try:
@@ -94,59 +96,37 @@ class TradeLevelMonitor:
             cursor.execute("""
                 SELECT 
                     sl.id, sl.trade_id, sl.price, sl.status, t.symbol, t.action, 
-                    t.user_id, t.quantity as total_shares,
+                    t.user_id, t.remaining_quantity,
                     a.id as account_id, a.api_key, a.api_secret, a.account_type
                 FROM stop_loss_levels sl
                 JOIN trades t ON sl.trade_id = t.id
                 JOIN accounts a ON t.account_id = a.id
                 WHERE sl.status = 'active'
                 AND t.status = 'open'
+                AND t.remaining_quantity > 0
                 AND a.is_active = TRUE
             """)
             
             sl_levels = cursor.fetchall()
             
-            # Convert to list of dicts for easier handling
+            # Slotted records; credentials are kept once per account, not per level
             levels = []
             
             # Process take profit levels
             for tp in tp_levels:
-                levels.append({
-                    'type': 'take_profit',
-                    'id': tp[0],
-                    'trade_id': tp[1],
-                    'level_number': tp[2] if len(tp) > 2 else None,
-                    'price': float(tp[3]),
-                    'shares': float(tp[5]),
-                    'symbol': tp[7],
-                    'action': tp[8],
-                    'user_id': tp[9],
-                    'account_data': (tp[10], tp[11], tp[12], tp[13])
-                })
+                self.accounts[tp[10]] = (tp[10], tp[11], tp[12], tp[13])
+                levels.append(LevelRecord(
+                    'take_profit', tp[0], tp[1], tp[2], float(tp[3]), float(tp[5]),
+                    tp[7], tp[8], tp[9], tp[10]
+                ))
             
-            # Process stop loss levels
+            # Process stop loss levels (sized by the maintained remaining_quantity)
             for sl in sl_levels:
-                # Calculate remaining shares (total - executed take profits)
-                cursor.execute("""
-                    SELECT COALESCE(SUM(shares_quantity), 0) 
-                    FROM take_profit_levels 
-                    WHERE trade_id = %s AND status = 'executed'
-                """, (sl[1],))
-                executed_tp_shares = cursor.fetchone()[0] or 0
-                remaining_shares = float(sl[7]) - float(executed_tp_shares)
-                
-                if remaining_shares > 0:
-                    levels.append({
-                        'type': 'stop_loss',
-                        'id': sl[0],
-                        'trade_id': sl[1],
-                        'price': float(sl[2]),
-                        'shares': remaining_shares,
-                        'symbol': sl[4],
-                        'action': sl[5],
-                        'user_id': sl[6],
-                        'account_data': (sl[8], sl[9], sl[10], sl[11])
-                    })
+                self.accounts[sl[8]] = (sl[8], sl[9], sl[10], sl[11])
+                levels.append(LevelRecord(
+                    'stop_loss', sl[0], sl[1], None, float(sl[2]), float(sl[7]),
+                    sl[4], sl[5], sl[6], sl[8]
+                ))
             
             logger.info(f"Found {len(levels)} active levels to monitor")
             return levels
@@ -162,17 +142,15 @@ class TradeLevelMonitor:
         try:
             # Use cached price if recent (within 5 seconds)
             now = time.time()
-            if (symbol in self.price_cache and 
-                symbol in self.last_price_update and 
-                now - self.last_price_update[symbol] < 5):
-                return self.price_cache[symbol]
+            cached = self.price_cache.get(symbol, now)
+            if cached is not None:
+                return cached
             
             # Get latest price from broker
             price_data = await client.get_latest_price(symbol)
             if price_data and 'price' in price_data:
                 price = float(price_data['price'])
-                self.price_cache[symbol] = price
-                self.last_price_update[symbol] = now
+                self.price_cache.put(symbol, price, now)
                 return price
             
         except Exception as e:
@@ -180,11 +158,11 @@ class TradeLevelMonitor:
         
         return None
     
-    def should_execute_level(self, level: Dict, current_price: float) -> bool:
+    def should_execute_level(self, level: LevelRecord, current_price: float) -> bool:
         """Check if a level should be executed based on current price"""
-        target_price = level['price']
-        level_type = level['type']
-        action = level['action']
+        target_price = level.price
+        level_type = level.type
+        action = level.action
         
         if level_type == 'take_profit':
             # Take profit: sell when price reaches or exceeds target (for long positions)
@@ -204,93 +182,85 @@ class TradeLevelMonitor:
         
         return False
     
-    async def execute_level(self, level: Dict, current_price: float) -> bool:
+    async def execute_level(self, level: LevelRecord, current_price: float) -> bool:
         """Execute a take profit or stop loss level"""
+        level_type = level.type
+        level_id = level.id
+        
+        conn = get_db_connection()
         try:
-            symbol = level['symbol']
-            shares = level['shares']
-            level_type = level['type']
-            level_id = level['id']
-            trade_id = level['trade_id']
-            original_action = level['action']
+            cursor = conn.cursor()
+            symbol = level.symbol
+            shares = level.shares
+            original_action = level.action
             
             # Get broker client
-            client = self.get_broker_client(level['account_data'])
+            client = self.get_broker_client(self.accounts[level.account_id])
             if not client:
                 logger.error(f"No broker client available for level {level_id}")
                 return False
             
+            # Claim the level so no other executor sends an order for it
+            client_order_id = claim_level(cursor, level_type, level_id)
+            if not client_order_id:
+                logger.info(f"⏭️ {level_type} level {level_id} already claimed or executed, skipping")
+                return False
+            
             # Determine execution action (opposite of original trade)
             execution_action = 'SELL' if original_action.upper() == 'BUY' else 'BUY'
             
             logger.info(f"🎯 Executing {level_type} level {level_id}: {execution_action} {shares} {symbol} at ${current_price}")
             
             # Place market order for immediate execution
-            order_result = await client.place_order(
-                symbol=symbol,
-                qty=shares,
-                side=execution_action.lower(),
-                type='market',
-                time_in_force='day'
-            )
-            
-            if order_result and 'id' in order_result:
-                broker_order_id = order_result['id']
-                
-                # Update database with execution
-                await self.mark_level_executed(
-                    level_type, level_id, current_price, shares, broker_order_id
-                )
-                
-                # Log successful execution
-                logger.info(f"✅ {level_type.title()} executed: {symbol} {shares} shares at ${current_price} (Order: {broker_order_id})")
-                
-                # TODO: Send notification to user
-                return True
-            else:
-                logger.error(f"❌ Failed to execute {level_type} level {level_id}: Invalid order result")
+            try:
+                broker_order_id = await submit_level_order(client, client_order_id, symbol, execution_action, shares)
+            except Exception as e:
+                logger.error(f"❌ Failed to execute {level_type} level {level_id}: {e}")
+                release_level(cursor, level_type, level_id)
                 return False
-                
-        except Exception as e:
-            logger.error(f"❌ Error executing {level_type} level {level_id}: {e}")
-            return False
-    
-    async def mark_level_executed(self, level_type: str, level_id: int, price: float, shares: float, broker_order_id: str):
-        """Mark a level as executed in the database"""
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            
-            if level_type == 'take_profit':
-                cursor.execute("""
-                    UPDATE take_profit_levels 
-                    SET status = 'executed',
-                        executed_at = %s,
-                        executed_price = %s,
-                        broker_order_id = %s
-                    WHERE id = %s
-                """, (datetime.utcnow(), price, broker_order_id, level_id))
-            
-            elif level_type == 'stop_loss':
-                cursor.execute("""
-                    UPDATE stop_loss_levels 
-                    SET status = 'executed',
-                        executed_at = %s,
-                        executed_price = %s,
-                        executed_shares = %s,
-                        broker_order_id = %s
-                    WHERE id = %s
-                """, (datetime.utcnow(), price, shares, broker_order_id, level_id))
             
+            # Update database with execution
+            self.mark_level_executed(cursor, level_type, level_id, current_price, shares, broker_order_id)
             conn.commit()
-            logger.info(f"✅ Database updated: {level_type} level {level_id} marked as executed")
             
+            # Log successful execution
+            logger.info(f"✅ {level_type.title()} executed: {symbol} {shares} shares at ${current_price} (Order: {broker_order_id})")
+            
+            # TODO: Send notification to user
+            return True
+                
         except Exception as e:
-            logger.error(f"Error updating database for executed level {level_id}: {e}")
+            logger.error(f"❌ Error executing {level_type} level {level_id}: {e}")
             conn.rollback()
+            return False
         finally:
             conn.close()
     
+    def mark_level_executed(self, cursor, level_type: str, level_id: int, price: float, shares: float, broker_order_id: str):
+        """Mark a claimed level as executed"""
+        if level_type == 'take_profit':
+            cursor.execute("""
+                UPDATE take_profit_levels 
+                SET status = 'executed',
+                    executed_at = %s,
+                    executed_price = %s,
+                    broker_order_id = %s
+                WHERE id = %s AND status = 'executing'
+            """, (datetime.utcnow(), price, broker_order_id, level_id))
+        
+        elif level_type == 'stop_loss':
+            cursor.execute("""
+                UPDATE stop_loss_levels 
+                SET status = 'executed',
+                    executed_at = %s,
+                    executed_price = %s,
+                    executed_shares = %s,
+                    broker_order_id = %s
+                WHERE id = %s AND status = 'executing'
+            """, (datetime.utcnow(), price, shares, broker_order_id, level_id))
+        
+        logger.info(f"✅ Database updated: {level_type} level {level_id} marked as executed")
+    
     async def run_monitoring_cycle(self):
         """Run one monitoring cycle"""
         try:
@@ -304,7 +274,7 @@ class TradeLevelMonitor:
             # Group levels by account to reuse broker clients
             levels_by_account = {}
             for level in levels:
-                account_id = level['account_data'][0]
+                account_id = level.account_id
                 if account_id not in levels_by_account:
                     levels_by_account[account_id] = []
                 levels_by_account[account_id].append(level)
@@ -313,13 +283,12 @@ class TradeLevelMonitor:
             for account_id, account_levels in levels_by_account.items():
                 try:
                     # Get broker client for this account
-                    first_level = account_levels[0]
-                    client = self.get_broker_client(first_level['account_data'])
+                    client = self.get_broker_client(self.accounts[account_id])
                     if not client:
                         continue
                     
                     # Group by symbol to minimize API calls
-                    symbols = set(level['symbol'] for level in account_levels)
+                    symbols = set(level.symbol for level in account_levels)
                     
                     for symbol in symbols:
                         # Get current price
@@ -328,7 +297,7 @@ class TradeLevelMonitor:
                             continue
                         
                         # Check levels for this symbol
-                        symbol_levels = [l for l in account_levels if l['symbol'] == symbol]
+                        symbol_levels = [l for l in account_levels if l.symbol == symbol]
                         
                         for level in symbol_levels:
                             if self.should_execute_level(level, current_price):
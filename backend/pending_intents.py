@@ -0,0 +1,84 @@
+"""
+Pending trade intents
+
+Work that has to happen when an order fills (custom TP/SL levels to create,
+positions to close) is stored in trade_pending_intents rather than in the
+trade_notifications feed. Lookups go through a partial index on pending rows,
+so the fill path does not scan the notification log.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+CUSTOM_LEVELS = 'custom_levels'
+POSITION_CLOSE = 'position_close'
+
+
+def create_pending_intents_table(cursor):
+    """Create trade_pending_intents and its indexes"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trade_pending_intents (
+            id SERIAL PRIMARY KEY,
+            trade_id INTEGER NOT NULL REFERENCES trades(id) ON DELETE CASCADE,
+            user_id INTEGER,
+            intent_type VARCHAR(30) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            data JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trade_pending_intents_pending
+        ON trade_pending_intents(trade_id, intent_type)
+        WHERE status = 'pending'
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trade_pending_intents_trade_id
+        ON trade_pending_intents(trade_id)
+    """)
+
+
+def add_pending_intent(cursor, user_id: int, trade_id: int, intent_type: str, data: Dict[str, Any]) -> int:
+    """Store an intent to be applied when trade_id fills"""
+    cursor.execute("""
+        INSERT INTO trade_pending_intents (user_id, trade_id, intent_type, data, created_at)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id
+    """, (user_id, trade_id, intent_type, json.dumps(data), datetime.utcnow()))
+    return cursor.fetchone()[0]
+
+
+def get_pending_intent(cursor, trade_id: int, intent_type: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """Newest pending intent of the given type for a trade as (id, data), or None"""
+    cursor.execute("""
+        SELECT id, data FROM trade_pending_intents
+        WHERE trade_id = %s AND intent_type = %s AND status = 'pending'
+        ORDER BY created_at DESC LIMIT 1
+    """, (trade_id, intent_type))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    data = row[1] if isinstance(row[1], dict) else json.loads(row[1])
+    return row[0], data
+
+
+def get_intents(cursor, trade_id: int, intent_type: str) -> List[Dict[str, Any]]:
+    """All intents of the given type for a trade regardless of status, newest first"""
+    cursor.execute("""
+        SELECT data FROM trade_pending_intents
+        WHERE trade_id = %s AND intent_type = %s
+        ORDER BY created_at DESC
+    """, (trade_id, intent_type))
+    return [row[0] if isinstance(row[0], dict) else json.loads(row[0]) for row in cursor.fetchall()]
+
+
+def complete_intent(cursor, intent_id: int):
+    """Mark an intent as applied so it drops out of the pending index"""
+    cursor.execute("""
+        UPDATE trade_pending_intents
+        SET status = 'completed', completed_at = %s
+        WHERE id = %s
+    """, (datetime.utcnow(), intent_id))
@@ -0,0 +1,102 @@
+"""
+FIFO realized P&L from broker order history
+
+Pure functions with no database or broker access, so the matching can run in
+the 'cpu' worker process pool (executors.run_in_pool) instead of on the event
+loop. Keep this module free of heavy imports - every pool worker imports it.
+"""
+
+from collections import deque
+from typing import Any, Dict, List
+
+
+def group_filled_orders(orders: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Filled orders per symbol, split into buys and sells"""
+    orders_by_symbol = {}
+    for order in orders:
+        if order['status'] != 'filled':
+            continue
+        symbol = order['symbol']
+        if symbol not in orders_by_symbol:
+            orders_by_symbol[symbol] = {'buys': [], 'sells': []}
+
+        order_data = {
+            'id': order['id'],
+            'qty': float(order['filled_qty']),
+            'price': float(order['filled_avg_price']),
+            'time': order['filled_at'],
+            'side': order['side'].upper()
+        }
+
+        if order_data['side'] == 'BUY':
+            orders_by_symbol[symbol]['buys'].append(order_data)
+        else:
+            orders_by_symbol[symbol]['sells'].append(order_data)
+    return orders_by_symbol
+
+
+def fifo_realized_pnl(orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Match sells against earlier buys (FIFO) per symbol.
+
+    Returns the realized P&L per symbol and in total, the P&L of every matched
+    sell (sell_pnls: [(broker order id, pnl)]) and win/loss counts per match.
+    """
+    total_realized_pnl = 0
+    symbol_pnls = {}
+    sell_pnls = []
+    winning_trades = 0
+    losing_trades = 0
+    total_closed_trades = 0
+
+    for symbol, symbol_orders in group_filled_orders(orders).items():
+        # Sort by time (oldest first for FIFO)
+        buys = sorted(symbol_orders['buys'], key=lambda x: x['time'])
+        sells = sorted(symbol_orders['sells'], key=lambda x: x['time'])
+
+        buy_queue = deque({'price': buy['price'], 'remaining': buy['qty']} for buy in buys)
+        realized_pnl = 0
+
+        for sell in sells:
+            sell_qty = sell['qty']
+            sell_price = sell['price']
+            sell_pnl = 0
+            matched = False
+
+            # Match against buy queue (FIFO)
+            while sell_qty > 0 and buy_queue:
+                buy_order = buy_queue[0]
+                match_qty = min(buy_order['remaining'], sell_qty)
+                pnl = (sell_price - buy_order['price']) * match_qty
+                sell_pnl += pnl
+                realized_pnl += pnl
+                buy_order['remaining'] -= match_qty
+                sell_qty -= match_qty
+                matched = True
+                # Track win/loss per match
+                total_closed_trades += 1
+                if pnl > 0:
+                    winning_trades += 1
+                elif pnl < 0:
+                    losing_trades += 1
+                if buy_order['remaining'] == 0:
+                    buy_queue.popleft()
+
+            if matched:
+                sell_pnls.append((sell['id'], sell_pnl))
+
+        symbol_pnls[symbol] = realized_pnl
+        total_realized_pnl += realized_pnl
+
+    win_rate = 0
+    if total_closed_trades > 0:
+        win_rate = (winning_trades / total_closed_trades) * 100
+
+    return {
+        "total_realized_pnl": total_realized_pnl,
+        "symbol_pnls": symbol_pnls,
+        "sell_pnls": sell_pnls,
+        "winning_trades": winning_trades,
+        "losing_trades": losing_trades,
+        "total_closed_trades": total_closed_trades,
+        "win_rate": win_rate
+    }
@@ -0,0 +1,327 @@
+"""
+Per-account positions mirror
+
+account_positions holds what each account owns, so the positions, analytics
+and dashboard endpoints do not wait for a live get_positions() round trip:
+
+    fills        apply_fill() as the broker reports entry and level orders filled
+                 (idempotent per broker order - the REST sync and the trade stream
+                 both report fills)
+    price ticks  update_position_prices() from the price_update process
+    reconcile    replace_account_positions() with the broker snapshot taken by
+                 the position_sync process every minute, which corrects anything
+                 the fill paths missed (manual trades, broker-side stops)
+
+A snapshot already contains every fill before it was taken, so apply_fill()
+skips fills at or before the account's snapshot_at - the broker clock read
+right before the positions request, so both sides of the comparison use the
+broker's time. Only the filled quantity
+is recorded for those, so a later report of the same order applies just the
+shares filled after the snapshot.
+
+Quantities are signed (negative for shorts) like Alpaca's. load_positions()
+serves the mirror while its last reconcile is younger than
+POSITIONS_MIRROR_MAX_AGE_SECONDS and falls back to the broker otherwise.
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MIRROR_MAX_AGE_SECONDS = float(os.getenv('POSITIONS_MIRROR_MAX_AGE_SECONDS', '300'))
+FILL_RETENTION_DAYS = 7
+QTY_EPSILON = 1e-9
+
+# Until migrations/create_account_positions_table.py has run, the mirror is skipped instead of
+# failing the fill transaction it runs in. A missing table is re-checked every 5 minutes.
+TABLE_RECHECK_SECONDS = 300
+_table_ready = False
+_table_checked_at = 0.0
+
+
+def create_account_positions_table(cursor):
+    """Create account_positions, account_positions_sync and position_fills"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS account_positions (
+            account_id INTEGER NOT NULL,
+            symbol VARCHAR(20) NOT NULL,
+            qty NUMERIC NOT NULL,
+            avg_entry_price NUMERIC NOT NULL,
+            current_price NUMERIC,
+            source VARCHAR(10) NOT NULL,
+            price_updated_at TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (account_id, symbol)
+        )
+    """)
+
+    # Last broker reconcile per account - a mirror without one is never served
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS account_positions_sync (
+            account_id INTEGER PRIMARY KEY,
+            synced_at TIMESTAMP NOT NULL
+        )
+    """)
+    # Broker clock read right before the snapshot was requested - fills up to here are already in it.
+    # NULL when the clock could not be read; fills are then applied as they are reported.
+    cursor.execute("""
+        ALTER TABLE account_positions_sync ADD COLUMN IF NOT EXISTS snapshot_at TIMESTAMPTZ
+    """)
+
+    # Quantity of each broker order already applied to the mirror
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS position_fills (
+            order_id VARCHAR(64) PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            symbol VARCHAR(20) NOT NULL,
+            filled_qty NUMERIC NOT NULL DEFAULT 0,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_position_fills_account_applied
+        ON position_fills(account_id, applied_at)
+    """)
+
+
+def _value(row, key: str):
+    return row[key] if isinstance(row, dict) else row[0]
+
+
+def _mirror_enabled(cursor) -> bool:
+    global _table_ready, _table_checked_at
+    if _table_ready:
+        return True
+    if _table_checked_at and time.monotonic() - _table_checked_at < TABLE_RECHECK_SECONDS:
+        return False
+    cursor.execute("SELECT to_regclass('account_positions') IS NOT NULL AS ready")
+    _table_ready = bool(_value(cursor.fetchone(), 'ready'))
+    _table_checked_at = time.monotonic()
+    return _table_ready
+
+
+def _signed_qty(position: Dict[str, Any]) -> float:
+    qty = abs(float(position['qty']))
+    return -qty if str(position.get('side', 'long')).lower() == 'short' else qty
+
+
+def _utc(value) -> Optional[datetime]:
+    """Broker timestamp (datetime or ISO string) as an aware UTC datetime"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def snapshot_time(broker_client) -> Optional[datetime]:
+    """The broker's clock - call right before get_positions() and pass the result to
+    replace_account_positions(). Fill times are broker times, so the server clock is not used."""
+    clock = await broker_client.get_market_clock()
+    return _utc(clock.get('timestamp')) if clock else None
+
+
+def replace_account_positions(cursor, account_id: int, positions: List[Dict[str, Any]],
+                              snapshot_at: Optional[datetime]):
+    """Reconcile the mirror with a broker snapshot (AlpacaClient.get_positions() output)
+    requested at snapshot_at"""
+    if not _mirror_enabled(cursor):
+        return
+    rows = [
+        (account_id, pos['symbol'], _signed_qty(pos), float(pos['avg_entry_price']),
+         pos.get('current_price'), pos.get('current_price'))
+        for pos in positions
+    ]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO account_positions (
+                account_id, symbol, qty, avg_entry_price, current_price, source, price_updated_at, updated_at
+            )
+            VALUES (%s, %s, %s, %s, %s, 'broker', CASE WHEN %s IS NULL THEN NULL ELSE NOW() END, NOW())
+            ON CONFLICT (account_id, symbol) DO UPDATE
+            SET qty = EXCLUDED.qty,
+                avg_entry_price = EXCLUDED.avg_entry_price,
+                current_price = COALESCE(EXCLUDED.current_price, account_positions.current_price),
+                source = 'broker',
+                price_updated_at = COALESCE(EXCLUDED.price_updated_at, account_positions.price_updated_at),
+                updated_at = NOW()
+        """, rows)
+
+    cursor.execute("""
+        DELETE FROM account_positions
+        WHERE account_id = %s AND NOT (symbol = ANY(%s))
+    """, (account_id, [pos['symbol'] for pos in positions]))
+    cursor.execute("""
+        INSERT INTO account_positions_sync (account_id, synced_at, snapshot_at)
+        VALUES (%s, NOW(), %s)
+        ON CONFLICT (account_id) DO UPDATE SET synced_at = NOW(), snapshot_at = EXCLUDED.snapshot_at
+    """, (account_id, snapshot_at))
+    cursor.execute("""
+        DELETE FROM position_fills
+        WHERE account_id = %s AND applied_at < NOW() - make_interval(days => %s)
+    """, (account_id, FILL_RETENTION_DAYS))
+
+
+def _in_snapshot(cursor, account_id: int, filled_at) -> bool:
+    """Whether the account's last broker snapshot was requested at or after filled_at"""
+    filled_at = _utc(filled_at)
+    if filled_at is None:
+        return False
+    cursor.execute("""
+        SELECT snapshot_at >= %s AS covered FROM account_positions_sync WHERE account_id = %s
+    """, (filled_at, account_id))
+    row = cursor.fetchone()
+    return row is not None and bool(_value(row, 'covered'))
+
+
+def apply_fill(cursor, account_id: int, order_id: Any, symbol: str, side: str,
+               filled_qty: float, price: float, filled_at=None):
+    """Apply an order's cumulative filled quantity to the mirror; repeated reports of the same fill are no-ops.
+
+    filled_at is the broker time of the order's latest fill (filled_at, or updated_at while
+    partially filled). Fills the last reconcile snapshot already contains are only recorded.
+    """
+    if not order_id or not filled_qty or not price or not _mirror_enabled(cursor):
+        return
+    order_id = str(order_id)
+    cursor.execute("""
+        INSERT INTO position_fills (order_id, account_id, symbol)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (order_id) DO NOTHING
+    """, (order_id, account_id, symbol))
+    cursor.execute("SELECT filled_qty FROM position_fills WHERE order_id = %s FOR UPDATE", (order_id,))
+    delta = float(filled_qty) - float(_value(cursor.fetchone(), 'filled_qty'))
+    if delta <= QTY_EPSILON:
+        return
+    cursor.execute("""
+        UPDATE position_fills SET filled_qty = %s, applied_at = NOW() WHERE order_id = %s
+    """, (float(filled_qty), order_id))
+    if _in_snapshot(cursor, account_id, filled_at):
+        return
+
+    signed = delta if side.lower() == 'buy' else -delta
+    cursor.execute("""
+        SELECT qty, avg_entry_price FROM account_positions
+        WHERE account_id = %s AND symbol = %s
+        FOR UPDATE
+    """, (account_id, symbol))
+    row = cursor.fetchone()
+    if isinstance(row, dict):
+        row = (row['qty'], row['avg_entry_price'])
+    old_qty, avg_price = (float(row[0]), float(row[1])) if row else (0.0, 0.0)
+    new_qty = old_qty + signed
+
+    if abs(new_qty) < QTY_EPSILON:
+        cursor.execute("DELETE FROM account_positions WHERE account_id = %s AND symbol = %s", (account_id, symbol))
+        return
+    if abs(old_qty) < QTY_EPSILON or (old_qty > 0) != (new_qty > 0):
+        avg_price = float(price)  # Opened, or flipped from long to short (or back)
+    elif (old_qty > 0) == (signed > 0):
+        avg_price = (abs(old_qty) * avg_price + delta * float(price)) / abs(new_qty)
+    # Reducing a position keeps its average entry price
+
+    cursor.execute("""
+        INSERT INTO account_positions (
+            account_id, symbol, qty, avg_entry_price, current_price, source, price_updated_at, updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, 'fill', NOW(), NOW())
+        ON CONFLICT (account_id, symbol) DO UPDATE
+        SET qty = EXCLUDED.qty,
+            avg_entry_price = EXCLUDED.avg_entry_price,
+            current_price = EXCLUDED.current_price,
+            source = 'fill',
+            price_updated_at = NOW(),
+            updated_at = NOW()
+    """, (account_id, symbol, new_qty, avg_price, float(price)))
+
+
+def get_position_symbols(cursor, account_id: int) -> List[str]:
+    if not _mirror_enabled(cursor):
+        return []
+    cursor.execute("SELECT symbol FROM account_positions WHERE account_id = %s", (account_id,))
+    return [_value(row, 'symbol') for row in cursor.fetchall()]
+
+
+def update_position_prices(cursor, account_id: int, prices: Dict[str, float]):
+    """Record the latest prices for the account's mirrored positions"""
+    if not prices or not _mirror_enabled(cursor):
+        return
+    cursor.executemany("""
+        UPDATE account_positions
+        SET current_price = %s, price_updated_at = NOW()
+        WHERE account_id = %s AND symbol = %s
+    """, [(price, account_id, symbol) for symbol, price in prices.items() if price])
+
+
+def get_account_positions(cursor, account_id: int) -> List[Dict[str, Any]]:
+    """Mirrored positions in the shape AlpacaClient.get_positions() returns"""
+    cursor.execute("""
+        SELECT symbol, qty, avg_entry_price, current_price, source, price_updated_at
+        FROM account_positions
+        WHERE account_id = %s
+        ORDER BY symbol
+    """, (account_id,))
+    columns = [desc[0] for desc in cursor.description]
+    positions = []
+    for row in cursor.fetchall():
+        row = row if isinstance(row, dict) else dict(zip(columns, row))
+        qty = float(row['qty'])
+        avg_entry_price = float(row['avg_entry_price'])
+        current_price = float(row['current_price']) if row['current_price'] is not None else avg_entry_price
+        cost_basis = qty * avg_entry_price
+        market_value = qty * current_price
+        unrealized_pl = market_value - cost_basis
+        positions.append({
+            "symbol": row['symbol'],
+            "qty": qty,
+            "avg_entry_price": avg_entry_price,
+            "market_value": market_value,
+            "cost_basis": cost_basis,
+            "unrealized_pl": unrealized_pl,
+            "unrealized_plpc": unrealized_pl / abs(cost_basis) if cost_basis else 0.0,
+            "current_price": current_price,
+            "side": "short" if qty < 0 else "long",
+            "source": row['source'],
+            "price_updated_at": row['price_updated_at'].isoformat() if row['price_updated_at'] else None
+        })
+    return positions
+
+
+def _synced_recently(cursor, account_id: int) -> Optional[bool]:
+    """True if reconciled within the max age, False if stale, None if never reconciled"""
+    cursor.execute("""
+        SELECT synced_at > NOW() - make_interval(secs => %s) AS fresh
+        FROM account_positions_sync
+        WHERE account_id = %s
+    """, (MIRROR_MAX_AGE_SECONDS, account_id))
+    row = cursor.fetchone()
+    return None if row is None else bool(_value(row, 'fresh'))
+
+
+async def load_positions(cursor, account_id: int, broker_client) -> List[Dict[str, Any]]:
+    """Positions for an API endpoint: the mirror while fresh, otherwise a broker fetch that refreshes it.
+
+    The caller commits - a refreshed mirror is simply fetched again next time if it does not.
+    """
+    if not _mirror_enabled(cursor):
+        return await broker_client.get_positions()
+
+    fresh = _synced_recently(cursor, account_id)
+    if fresh:
+        return get_account_positions(cursor, account_id)
+
+    try:
+        snapshot_at = await snapshot_time(broker_client)
+        positions = await broker_client.get_positions(raise_errors=True)
+    except Exception as e:
+        if fresh is None:
+            raise
+        logger.warning(f"[POSITIONS] Broker unavailable for account {account_id}, serving stale mirror: {e}")
+        return get_account_positions(cursor, account_id)
+
+    replace_account_positions(cursor, account_id, positions, snapshot_at)
+    return get_account_positions(cursor, account_id)
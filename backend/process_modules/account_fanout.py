@@ -0,0 +1,178 @@
+"""
+Per-account fan-out for process cycles
+
+AlpacaClient's async methods wrap the synchronous alpaca-py SDK, so awaiting
+them one account after another serializes every broker round trip, and
+asyncio.gather alone would not help. Each account's work therefore runs in its own
+worker thread (with its own event loop, DB connection and cursor) behind a
+bounded semaphore:
+
+- one slow or failing account no longer delays the others
+- every process has its own thread pool, so a slow process (trade sync,
+  asset refresh) cannot hold the threads the level monitor needs
+- a per-account deadline bounds how long the cycle waits, counted from when
+  the work gets a thread; a straggler keeps running in the background on its
+  own connection and the account is skipped by later cycles until it finishes
+- work still queued for a thread after the deadline is cancelled, so it never
+  runs late on stale data
+- per-account durations and queue waits are recorded for status reporting
+
+Environment:
+- ACCOUNT_FANOUT_CONCURRENCY: accounts processed at once (default 8)
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_CONCURRENCY = int(os.getenv('ACCOUNT_FANOUT_CONCURRENCY', '8'))
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+_in_flight: Dict[str, set] = {}
+_in_flight_lock = threading.Lock()
+
+# process name -> account id -> last run stats
+account_metrics: Dict[str, Dict[int, Dict[str, Any]]] = {}
+
+
+@dataclass
+class AccountResult:
+    account_id: int
+    duration: float
+    queue_wait: float = 0.0
+    result: Any = None
+    error: Optional[str] = None
+    timed_out: bool = False
+    skipped: bool = False
+
+
+def _executor_for(process_name: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(process_name)
+        if executor is None:
+            executor = _executors[process_name] = ThreadPoolExecutor(
+                max_workers=ACCOUNT_CONCURRENCY, thread_name_prefix=f'fanout-{process_name}')
+        return executor
+
+
+def _release(process_name: str, account_id: Any):
+    with _in_flight_lock:
+        _in_flight.get(process_name, set()).discard(account_id)
+
+
+def _run_account(process_name: str, work: Callable[..., Awaitable[Any]], account: Sequence,
+                 on_start: Callable[[], None]) -> Any:
+    """Thread body: own connection, own cursor, own event loop; commit on success"""
+    on_start()
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        result = asyncio.run(work(cursor, account))
+        conn.commit()
+        return result
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+        _release(process_name, account[0])
+
+
+def _record(process_name: str, outcome: AccountResult):
+    account_metrics.setdefault(process_name, {})[outcome.account_id] = {
+        "duration": round(outcome.duration, 3),
+        "queue_wait": round(outcome.queue_wait, 3),
+        "last_run": datetime.now().isoformat(),
+        "timed_out": outcome.timed_out,
+        "skipped": outcome.skipped,
+        "error": outcome.error
+    }
+
+
+async def fan_out_accounts(process_name: str, accounts: Sequence[Sequence],
+                           work: Callable[..., Awaitable[Any]],
+                           deadline_seconds: float) -> List[AccountResult]:
+    """Run work(cursor, account_row) for every account concurrently.
+
+    account_row[0] must be the account id. Returns one AccountResult per account.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _executor_for(process_name)
+    semaphore = asyncio.BoundedSemaphore(ACCOUNT_CONCURRENCY)
+    in_flight = _in_flight.setdefault(process_name, set())
+
+    async def run_one(account) -> AccountResult:
+        account_id = account[0]
+
+        with _in_flight_lock:
+            if account_id in in_flight:
+                outcome = AccountResult(account_id, 0.0, skipped=True,
+                                        error="previous run still in progress")
+                _record(process_name, outcome)
+                return outcome
+            in_flight.add(account_id)
+
+        async with semaphore:
+            queued_at = time.monotonic()
+            started = asyncio.Event()
+            # Copy the context so the worker thread's statements stay attributed to this process
+            submitted = executor.submit(contextvars.copy_context().run, _run_account, process_name, work,
+                                        account, lambda: loop.call_soon_threadsafe(started.set))
+            future = asyncio.wrap_future(submitted)
+
+            # Stragglers from earlier cycles can still hold this process's threads
+            try:
+                await asyncio.wait_for(started.wait(), timeout=deadline_seconds)
+            except asyncio.TimeoutError:
+                if submitted.cancel():
+                    _release(process_name, account_id)
+                    outcome = AccountResult(account_id, 0.0, queue_wait=time.monotonic() - queued_at,
+                                            timed_out=True,
+                                            error=f"no free thread within {deadline_seconds}s, cancelled")
+                    logger.warning(f"[FANOUT] {process_name} account {account_id} waited {deadline_seconds}s "
+                                   f"for a thread, cancelled")
+                    _record(process_name, outcome)
+                    return outcome
+                # It got a thread just now - give it its full deadline
+
+            start = time.monotonic()
+            queue_wait = start - queued_at
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), timeout=deadline_seconds)
+                outcome = AccountResult(account_id, time.monotonic() - start, queue_wait, result=result)
+            except asyncio.TimeoutError:
+                outcome = AccountResult(account_id, time.monotonic() - start, queue_wait, timed_out=True,
+                                        error=f"deadline {deadline_seconds}s exceeded")
+                logger.warning(f"[FANOUT] {process_name} account {account_id} exceeded {deadline_seconds}s deadline")
+                future.add_done_callback(lambda f: f.exception())  # Don't leave the straggler's error unretrieved
+            except Exception as e:
+                outcome = AccountResult(account_id, time.monotonic() - start, queue_wait, error=str(e))
+                logger.error(f"[FANOUT] {process_name} account {account_id} failed: {e}")
+
+        _record(process_name, outcome)
+        return outcome
+
+    return await asyncio.gather(*(run_one(account) for account in accounts))
+
+
+def get_account_metrics() -> Dict[str, Dict[int, Dict[str, Any]]]:
+    """Last per-account run stats for every fanned-out process"""
+    return account_metrics
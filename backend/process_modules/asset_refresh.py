@@ -0,0 +1,85 @@
+"""
+Asset Refresh Process Module
+Reloads the assets table from the broker's asset list once a day.
+"""
+
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from alpaca_client import AlpacaClient
+from asset_cache import asset_cache, needs_refresh, replace_assets
+from process_modules.account_fanout import fan_out_accounts
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_DEADLINE_SECONDS = 90.0  # The full asset list is ~10 MB of JSON
+
+async def refresh_assets_process():
+    """Refresh the asset snapshot when it is older than ASSET_REFRESH_HOURS, then reload the in-memory cache"""
+    
+    api_calls_made = 0
+    conn = None
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        if not needs_refresh(cursor):
+            conn.commit()
+            await asset_cache.ensure_loaded()
+            return 0
+        
+        # The asset list is the same for every account - any active one will do
+        cursor.execute("""
+            SELECT id, api_key, api_secret, account_type
+            FROM accounts 
+            WHERE is_active = TRUE AND broker = 'alpaca'
+            ORDER BY id
+            LIMIT 1
+        """)
+        accounts = cursor.fetchall()
+        conn.commit()
+        
+        if not accounts:
+            return 0
+        
+        # Runs in a fan-out worker thread so parsing the list does not block the event loop
+        results = await fan_out_accounts(
+            "asset_refresh", accounts, refresh_account_assets, ACCOUNT_DEADLINE_SECONDS
+        )
+        api_calls_made += len(results)
+        
+        if any(r.result for r in results):
+            await asset_cache.ensure_loaded(force=True)
+        
+    except Exception as e:
+        logger.error(f"Error in asset refresh process: {e}")
+        if conn:
+            conn.rollback()
+    
+    finally:
+        if conn:
+            conn.close()
+    
+    return api_calls_made
+
+async def refresh_account_assets(cursor, account) -> int:
+    """Store the broker's asset list and return the number of assets"""
+    account_id, api_key, api_secret, account_type = account
+    
+    client = AlpacaClient(
+        api_key=api_key,
+        secret_key=api_secret,
+        paper=(account_type == 'paper')
+    )
+    
+    assets = await client.get_assets()
+    stored = replace_assets(cursor, assets)
+    
+    logger.info(f"[ASSETS] Refreshed {stored} assets from account {account_id}")
+    return stored
+
+refresh_assets_process._api_calls = 1
@@ -0,0 +1,94 @@
+"""
+Vectorized trigger evaluation for the level monitor
+
+Active take profit / stop loss levels are held in contiguous NumPy arrays
+(trigger price, direction sign, symbol index, level type) and evaluated
+against the current price vector in one comparison per tick:
+
+    hit = sign * (price[symbol_index] - trigger) >= 0
+
+sign is +1 for levels that trigger at or above their price (long take
+profit, short stop loss) and -1 for levels that trigger at or below it (long
+stop loss, short take profit). Symbols without a current price never trigger.
+
+Building the arrays costs more than one loop pass, so the level monitor keeps
+each account's book resident and only rebuilds it when the fetched level rows
+change.
+
+benchmark_level_triggers.py compares this with the per-row Python loop.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+TAKE_PROFIT = 0
+STOP_LOSS = 1
+
+LEVEL_KINDS = {'take_profit': TAKE_PROFIT, 'stop_loss': STOP_LOSS}
+
+
+class LevelBook:
+    """Column-oriented store of active levels.
+
+    Rows are (kind, level_id, trade_id, trigger_price, quantity, level_number, symbol, action)
+    with kind 'take_profit' or 'stop_loss'.
+    """
+
+    __slots__ = ('symbols', 'symbol_index', 'kind', 'level_id', 'trade_id', 'trigger',
+                 'sign', 'symbol_idx', 'quantity', 'level_number', '_triggers_by_symbol')
+
+    def __init__(self, rows: Sequence[Tuple]):
+        count = len(rows)
+        kinds, level_ids, trade_ids, triggers, quantities, level_numbers, symbols, actions = (
+            zip(*rows) if count else ((),) * 8
+        )
+
+        self.kind = np.fromiter((LEVEL_KINDS[kind] for kind in kinds), dtype=np.int8, count=count)
+        self.level_id = np.fromiter(level_ids, dtype=np.int64, count=count)
+        self.trade_id = np.fromiter(trade_ids, dtype=np.int64, count=count)
+        self.trigger = np.fromiter(triggers, dtype=np.float64, count=count)
+        self.quantity = np.fromiter((q or 0 for q in quantities), dtype=np.float64, count=count)
+        self.level_number = np.fromiter((n or 0 for n in level_numbers), dtype=np.int32, count=count)
+
+        # +1 for long take profits / short stop losses, -1 for the opposite
+        is_long = np.fromiter((action.upper() == 'BUY' for action in actions), dtype=bool, count=count)
+        self.sign = np.where((self.kind == TAKE_PROFIT) == is_long, 1, -1).astype(np.int8)
+
+        self.symbol_index: Dict[str, int] = {}
+        self.symbol_idx = np.fromiter(
+            (self.symbol_index.setdefault(symbol, len(self.symbol_index)) for symbol in symbols),
+            dtype=np.int32, count=count
+        )
+        self.symbols: List[str] = list(self.symbol_index)
+        self._triggers_by_symbol = None
+
+    def __len__(self) -> int:
+        return len(self.level_id)
+
+    def price_vector(self, prices: Dict[str, float]) -> np.ndarray:
+        """Current price per symbol index (NaN where unknown)"""
+        vector = np.full(len(self.symbols), np.nan)
+        for symbol, price in prices.items():
+            index = self.symbol_index.get(symbol)
+            if index is not None:
+                vector[index] = price
+        return vector
+
+    def triggered(self, prices: Dict[str, float]) -> np.ndarray:
+        """Row indices of every level whose trigger is crossed at these prices"""
+        if not len(self):
+            return np.empty(0, dtype=np.intp)
+        price = self.price_vector(prices)[self.symbol_idx]
+        with np.errstate(invalid='ignore'):
+            hit = self.sign * (price - self.trigger) >= 0  # NaN compares False
+        return np.flatnonzero(hit)
+
+    def triggers_by_symbol(self) -> Dict[str, List[float]]:
+        """Trigger prices grouped by symbol (for the proximity scheduler)"""
+        if self._triggers_by_symbol is None:
+            grouped: Dict[str, List[float]] = {symbol: [] for symbol in self.symbols}
+            for index, trigger in zip(self.symbol_idx.tolist(), self.trigger.tolist()):
+                grouped[self.symbols[index]].append(trigger)
+            self._triggers_by_symbol = grouped
+        return self._triggers_by_symbol
@@ -7,7 +7,8 @@ This is the high-priority, fast-execution process for profit/loss management.
 
 import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+import numpy as np
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 from decimal import Decimal
 
@@ -17,19 +18,40 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db import get_db_connection
 from alpaca_client import AlpacaClient
+from process_modules.level_scheduler import level_scheduler
+from process_modules.level_book import LevelBook, TAKE_PROFIT
+from process_modules.account_fanout import fan_out_accounts
+from level_claims import (
+    claim_level, release_level, stale_claims, submit_level_order,
+    level_client_order_id, DEAD_ORDER_STATUSES
+)
 
 logger = logging.getLogger(__name__)
 
-async def monitor_levels_process() -> int:
+# How long one cycle waits for a single account before moving on
+ACCOUNT_DEADLINE_SECONDS = float(os.getenv('LEVEL_MONITOR_ACCOUNT_DEADLINE_SECONDS', '5'))
+
+# account id -> (level rows, LevelBook built from them); rebuilt only when the rows change
+_level_books: Dict[int, Tuple[list, LevelBook]] = {}
+
+async def monitor_levels_process(account_ids: Optional[List[int]] = None) -> int:
     """
     Monitor and execute take profit/stop loss levels.
-    This process runs frequently (every 5 seconds) for fast execution.
+    account_ids restricts the cycle to a shard of accounts (see level_monitor_worker.py).
+    This process ticks frequently; level_scheduler decides which symbols are
+    actually polled based on their distance to the nearest trigger.
     Returns the number of API calls made.
     """
     
     api_calls_made = 0
     conn = None
     
+    if level_scheduler.known_closed():
+        return 0
+    
+    if account_ids is not None and not account_ids:
+        return 0  # This shard currently owns no accounts
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -40,6 +62,7 @@ async def monitor_levels_process() -> int:
             FROM accounts a
             WHERE a.is_active = TRUE 
             AND a.broker = 'alpaca'
+            AND (%(account_ids)s::int[] IS NULL OR a.id = ANY(%(account_ids)s::int[]))
             AND (
                 EXISTS (
                     SELECT 1 FROM take_profit_levels tp 
@@ -52,7 +75,7 @@ async def monitor_levels_process() -> int:
                     WHERE t.account_id = a.id AND sl.status = 'active' AND t.status = 'filled'
                 )
             )
-        """)
+        """, {'account_ids': account_ids})
         
         active_accounts = cursor.fetchall()
         
@@ -61,24 +84,17 @@ async def monitor_levels_process() -> int:
             
         logger.debug(f"Monitoring levels for {len(active_accounts)} accounts")
         
-        for account in active_accounts:
-            try:
-                account_id, api_key, api_secret, account_type = account
-                
-                # Get broker client
-                client = AlpacaClient(
-                    api_key=api_key,
-                    secret_key=api_secret,
-                    paper=(account_type == 'paper')
-                )
-                
-                # Monitor and execute levels for this account
-                calls_made = await process_account_levels(cursor, client, account_id)
-                api_calls_made += calls_made
-                
-            except Exception as e:
-                logger.error(f"Error monitoring levels for account {account_id}: {e}")
-                continue
+        # Pause polling entirely outside market hours
+        _, api_key, api_secret, account_type = active_accounts[0]
+        clock_client = AlpacaClient(api_key=api_key, secret_key=api_secret, paper=(account_type == 'paper'))
+        if not await level_scheduler.is_market_open(clock_client):
+            return 0
+        
+        # Each account runs concurrently on its own connection
+        results = await fan_out_accounts(
+            "level_monitor", active_accounts, monitor_account, ACCOUNT_DEADLINE_SECONDS
+        )
+        api_calls_made += sum(r.result or 0 for r in results)
         
         conn.commit()
         
@@ -100,160 +116,170 @@ async def monitor_levels_process() -> int:
     
     return api_calls_made if 'api_calls_made' in locals() else 0
 
+async def monitor_account(cursor, account) -> int:
+    """Monitor and execute levels for one account (runs inside the account fan-out)"""
+    account_id, api_key, api_secret, account_type = account
+    
+    # Get broker client
+    client = AlpacaClient(
+        api_key=api_key,
+        secret_key=api_secret,
+        paper=(account_type == 'paper')
+    )
+    
+    return await process_account_levels(cursor, client, account_id)
+
 async def process_account_levels(cursor, client: AlpacaClient, account_id: int) -> int:
     """Process levels for a specific account and return API calls made"""
     
     api_calls_made = 0
     
-    # Get all symbols with active levels for batch price fetching
+    # Resolve levels left 'executing' by an executor that died mid-order
+    api_calls_made += await recover_stale_levels(cursor, client, account_id)
+    
+    # Load all active levels once; the book evaluates them as arrays
     cursor.execute("""
-        SELECT DISTINCT t.symbol
-        FROM trades t
-        LEFT JOIN take_profit_levels tp ON t.id = tp.trade_id
-        LEFT JOIN stop_loss_levels sl ON t.id = sl.trade_id
+        SELECT 'take_profit', tp.id, tp.trade_id, tp.price, tp.shares_quantity, tp.level_number,
+               t.symbol, t.action
+        FROM take_profit_levels tp
+        JOIN trades t ON tp.trade_id = t.id
         WHERE t.account_id = %s 
         AND t.status IN ('filled', 'closed')
-        AND (
-            (tp.status = 'pending' AND tp.id IS NOT NULL)
-            OR (sl.status = 'active' AND sl.id IS NOT NULL)
-        )
-    """, (account_id,))
+        AND tp.status = 'pending'
+        UNION ALL
+        SELECT 'stop_loss', sl.id, sl.trade_id, sl.price, t.remaining_quantity, NULL,
+               t.symbol, t.action
+        FROM stop_loss_levels sl
+        JOIN trades t ON sl.trade_id = t.id
+        WHERE t.account_id = %s 
+        AND t.status IN ('filled', 'closed')
+        AND sl.status = 'active'
+        AND t.remaining_quantity > 0
+    """, (account_id, account_id))
     
-    symbols_result = cursor.fetchall()
-    symbols = [row[0] for row in symbols_result] if symbols_result else []
+    rows = cursor.fetchall()
+    cached = _level_books.get(account_id)
+    if cached and cached[0] == rows:
+        book = cached[1]
+    else:
+        book = LevelBook(rows)
+        _level_books[account_id] = (rows, book)
+    triggers_by_symbol = book.triggers_by_symbol()
+    
+    # Only poll symbols whose proximity schedule says they are due
+    symbols = level_scheduler.due_symbols(account_id, triggers_by_symbol)
     
     if not symbols:
         return 0
     
     try:
-        # Batch get current prices for all symbols
+        # Batch get current prices for due symbols
         current_prices = await client.get_current_prices(symbols)
         api_calls_made += 1
         
-        # Process take profit levels
-        tp_api_calls = await process_take_profit_levels(cursor, client, account_id, current_prices)
-        api_calls_made += tp_api_calls
-        
-        # Process stop loss levels  
-        sl_api_calls = await process_stop_loss_levels(cursor, client, account_id, current_prices)
-        api_calls_made += sl_api_calls
+        for symbol, price in current_prices.items():
+            level_scheduler.record_price(symbol, price)
+            level_scheduler.schedule(account_id, symbol, price, triggers_by_symbol[symbol])
         
-        # API calls for any executions will be tracked in the execution functions
+        # Execute every level crossed at these prices
+        api_calls_made += await process_triggered_levels(cursor, client, book, current_prices)
         
     except Exception as e:
         logger.error(f"Error processing levels for account {account_id}: {e}")
     
     return api_calls_made
 
-async def process_take_profit_levels(cursor, client: AlpacaClient, account_id: int, current_prices: Dict[str, float]) -> int:
-    """Process take profit levels for execution and return API calls made"""
+async def process_triggered_levels(cursor, client: AlpacaClient, book: LevelBook,
+                                   current_prices: Dict[str, float]) -> int:
+    """Execute triggered levels (take profits by level number, then stop losses) and return API calls made"""
     
     api_calls_made = 0
+    triggered = book.triggered(current_prices)
+    if not len(triggered):
+        return 0
     
-    # Get pending take profit levels
-    cursor.execute("""
-        SELECT tp.id, tp.trade_id, tp.level_number, tp.price, tp.shares_quantity, 
-               t.symbol, t.side, t.quantity as total_quantity
-        FROM take_profit_levels tp
-        JOIN trades t ON tp.trade_id = t.id
-        WHERE t.account_id = %s 
-        AND t.status IN ('filled', 'closed')
-        AND tp.status = 'pending'
-        ORDER BY tp.level_number
-    """, (account_id,))
-    
-    levels = cursor.fetchall()
+    # Same order as before: take profits first (lowest level first), then stop losses
+    order = np.lexsort((book.level_number[triggered], book.kind[triggered]))
     
-    for level in levels:
+    for index in triggered[order].tolist():
+        level_id = int(book.level_id[index])
+        trade_id = int(book.trade_id[index])
+        symbol = book.symbols[book.symbol_idx[index]]
+        current_price = current_prices[symbol]
+        trigger_price = float(book.trigger[index])
+        
         try:
-            level_id, trade_id, level_number, target_price, quantity, symbol, side, total_quantity = level
-            
-            if symbol not in current_prices:
-                continue
-                
-            current_price = current_prices[symbol]
-            
-            # Check if level should be executed
-            should_execute = False
-            if side.upper() == 'BUY':
-                # Long position - take profit when price goes up
-                should_execute = current_price >= target_price
-            else:
-                # Short position - take profit when price goes down
-                should_execute = current_price <= target_price
-            
-            if should_execute:
-                # Execute the level
+            if book.kind[index] == TAKE_PROFIT:
+                level_number = int(book.level_number[index])
                 success = await execute_take_profit_level(
-                    cursor, client, level_id, trade_id, symbol, quantity, current_price, level_number
+                    cursor, client, level_id, trade_id, symbol, float(book.quantity[index]), current_price, level_number
                 )
-                
                 if success:
                     api_calls_made += 1  # Count the place_order API call
                     logger.info(f"🎯 Take profit executed: {symbol} Level {level_number} at ${current_price}")
-                
-        except Exception as e:
-            logger.error(f"Error processing take profit level {level_id}: {e}")
-            continue
-
-    return api_calls_made
-
-async def process_stop_loss_levels(cursor, client: AlpacaClient, account_id: int, current_prices: Dict[str, float]) -> int:
-    """Process stop loss levels for execution and return API calls made"""
-    
-    api_calls_made = 0
-    
-    # Get active stop loss levels
-    cursor.execute("""
-        SELECT sl.id, sl.trade_id, sl.price, t.quantity,
-               t.symbol, t.action, t.quantity as total_quantity
-        FROM stop_loss_levels sl
-        JOIN trades t ON sl.trade_id = t.id
-        WHERE t.account_id = %s 
-        AND t.status IN ('filled', 'closed')
-        AND sl.status = 'active'
-    """, (account_id,))
-    
-    levels = cursor.fetchall()
-    
-    for level in levels:
-        try:
-            level_id, trade_id, stop_price, quantity, symbol, action, total_quantity = level
-            
-            if symbol not in current_prices:
-                continue
-                
-            current_price = current_prices[symbol]
-            
-            # Check if stop loss should be executed
-            should_execute = False
-            if action.upper() == 'BUY':
-                # Long position - stop loss when price goes down
-                should_execute = current_price <= stop_price
             else:
-                # Short position - stop loss when price goes up
-                should_execute = current_price >= stop_price
-            
-            if should_execute:
-                # Execute the stop loss
                 success = await execute_stop_loss_level(
-                    cursor, client, level_id, trade_id, symbol, quantity, current_price
+                    cursor, client, level_id, trade_id, symbol, float(book.quantity[index]), current_price
                 )
-                
                 if success:
                     api_calls_made += 1  # Count the place_order API call
-                    logger.info(f"🛑 Stop loss executed: {symbol} at ${current_price} (target: ${stop_price})")
-                
+                    logger.info(f"🛑 Stop loss executed: {symbol} at ${current_price} (target: ${trigger_price})")
+        
         except Exception as e:
-            logger.error(f"Error processing stop loss level {level_id}: {e}")
+            logger.error(f"Error processing level {level_id}: {e}")
             continue
+    
+    return api_calls_made
 
+async def recover_stale_levels(cursor, client: AlpacaClient, account_id: int) -> int:
+    """Finish or release levels whose executor died between claim and finalize"""
+    
+    api_calls_made = 0
+    
+    for level_type, level_id in stale_claims(cursor, account_id):
+        table = 'take_profit_levels' if level_type == 'take_profit' else 'stop_loss_levels'
+        cursor.execute(f"""
+            SELECT l.trade_id, l.price, l.execution_attempts, t.symbol
+            FROM {table} l JOIN trades t ON l.trade_id = t.id
+            WHERE l.id = %s
+        """, (level_id,))
+        row = cursor.fetchone()
+        if not row:
+            continue
+        trade_id, trigger_price, attempt, symbol = row
+        
+        existing = await client.get_order_by_client_order_id(
+            level_client_order_id(level_type, level_id, attempt)
+        )
+        api_calls_made += 1
+        
+        if not existing or existing['status'] in DEAD_ORDER_STATUSES:
+            # The order never reached the broker - let the level trigger again normally
+            release_level(cursor, level_type, level_id)
+            logger.warning(f"Released abandoned {level_type} level {level_id} (no live broker order)")
+            continue
+        
+        # The order went through - finish the bookkeeping (resubmission resolves to the same order)
+        fill_price = existing['filled_avg_price'] or float(trigger_price)
+        if level_type == 'take_profit':
+            cursor.execute("SELECT shares_quantity, level_number FROM take_profit_levels WHERE id = %s", (level_id,))
+            quantity, level_number = cursor.fetchone()
+            await execute_take_profit_level(cursor, client, level_id, trade_id, symbol, quantity, fill_price, level_number)
+        else:
+            await execute_stop_loss_level(cursor, client, level_id, trade_id, symbol, None, fill_price)
+        logger.warning(f"Recovered abandoned {level_type} level {level_id} (order {existing['id']})")
+    
     return api_calls_made
 
 async def execute_take_profit_level(cursor, client: AlpacaClient, level_id: int, trade_id: int, 
                                   symbol: str, quantity: float, current_price: float, level_number: int) -> bool:
     """Execute a take profit level"""
     
+    # Claim the level so no other executor sends an order for it
+    client_order_id = claim_level(cursor, 'take_profit', level_id)
+    if not client_order_id:
+        return False
+    
     try:
         # Get trade details
         cursor.execute("""
@@ -262,6 +288,7 @@ async def execute_take_profit_level(cursor, client: AlpacaClient, level_id: int,
         
         trade_result = cursor.fetchone()
         if not trade_result:
+            release_level(cursor, 'take_profit', level_id)
             return False
             
         action, account_id, user_id = trade_result
@@ -270,58 +297,59 @@ async def execute_take_profit_level(cursor, client: AlpacaClient, level_id: int,
         order_side = 'sell' if action.upper() == 'BUY' else 'buy'
         
         # Place market order
-        order_result = await client.place_order(
-            symbol=symbol,
-            action=order_side,  # Fixed: was 'side', should be 'action'
-            quantity=quantity,  # Fixed: was 'qty', should be 'quantity'
-            order_type='market',  # Fixed: was 'type', should be 'order_type'
-            time_in_force='day'
-        )
-        
-        if order_result and 'id' in order_result:
-            # Update level status
-            cursor.execute("""
-                UPDATE take_profit_levels 
-                SET status = 'executed',
-                    executed_at = NOW(),
-                    executed_price = %s,
-                    broker_order_id = %s
-                WHERE id = %s
-            """, (current_price, order_result['id'], level_id))
-            
-            # Create notification
-            import json
-            notification_data = {
-                'level_number': level_number,
-                'executed_price': float(current_price),
-                'quantity': float(quantity),
-                'symbol': symbol,
-                'broker_order_id': order_result['id']
-            }
-            cursor.execute("""
-                INSERT INTO trade_notifications (user_id, trade_id, notification_type, data, created_at)
-                VALUES (%s, %s, 'take_profit_executed', %s, NOW())
-            """, (user_id, trade_id, json.dumps(notification_data)))
-            
-            return True
-            
+        broker_order_id = await submit_level_order(client, client_order_id, symbol, order_side, float(quantity))
     except Exception as e:
         logger.error(f"Error executing take profit level {level_id}: {e}")
-        
-    return False
+        cursor.connection.rollback()
+        release_level(cursor, 'take_profit', level_id)
+        return False
+    
+    # Finalize the claim
+    cursor.execute("""
+        UPDATE take_profit_levels 
+        SET status = 'executed',
+            executed_at = NOW(),
+            executed_price = %s,
+            broker_order_id = %s
+        WHERE id = %s AND status = 'executing'
+    """, (current_price, broker_order_id, level_id))
+    
+    # Create notification
+    import json
+    notification_data = {
+        'level_number': level_number,
+        'executed_price': float(current_price),
+        'quantity': float(quantity),
+        'symbol': symbol,
+        'broker_order_id': broker_order_id
+    }
+    cursor.execute("""
+        INSERT INTO trade_notifications (user_id, trade_id, notification_type, data, created_at)
+        VALUES (%s, %s, 'take_profit_executed', %s, NOW())
+    """, (user_id, trade_id, json.dumps(notification_data)))
+    
+    # Each execution is its own unit of work
+    cursor.connection.commit()
+    return True
 
 async def execute_stop_loss_level(cursor, client: AlpacaClient, level_id: int, trade_id: int, 
                                 symbol: str, quantity: float, current_price: float) -> bool:
-    """Execute a stop loss level - sell ALL shares in the position"""
+    """Execute a stop loss level - sell ALL remaining shares in the position"""
+    
+    # Claim the level so no other executor sends an order for it
+    client_order_id = claim_level(cursor, 'stop_loss', level_id)
+    if not client_order_id:
+        return False
     
     try:
-        # Get full trade details including total quantity
+        # Get trade details including the shares still held
         cursor.execute("""
-            SELECT action, account_id, quantity, user_id, entry_price FROM trades WHERE id = %s
+            SELECT action, account_id, remaining_quantity, user_id, entry_price FROM trades WHERE id = %s
         """, (trade_id,))
         
         trade_result = cursor.fetchone()
         if not trade_result:
+            release_level(cursor, 'stop_loss', level_id)
             return False
             
         action, account_id, total_quantity, user_id, entry_price = trade_result
@@ -329,94 +357,90 @@ async def execute_stop_loss_level(cursor, client: AlpacaClient, level_id: int, t
         # Determine order side (opposite of original trade)
         order_side = 'sell' if action.upper() == 'BUY' else 'buy'
         
-        # Place market order for ALL shares (not just level quantity)
-        order_result = await client.place_order(
-            symbol=symbol,
-            action=order_side,  # Fixed: was 'side', should be 'action'
-            quantity=total_quantity,  # Fixed: was 'qty', should be 'quantity'
-            order_type='market',  # Fixed: was 'type', should be 'order_type'
-            time_in_force='day'
-        )
-        
-        if order_result and 'id' in order_result:
-            # Update stop loss level status
-            cursor.execute("""
-                UPDATE stop_loss_levels 
-                SET status = 'executed',
-                    executed_at = NOW(),
-                    executed_price = %s,
-                    broker_order_id = %s
-                WHERE id = %s
-            """, (current_price, order_result['id'], level_id))
-            
-            # Create a new SELL trade record linked to the original BUY trade
-            import uuid
-            link_group_uuid = str(uuid.uuid4())
-            
-            # First update the original trade with the link_group_id
-            cursor.execute("""
-                UPDATE trades SET link_group_id = %s WHERE id = %s
-            """, (link_group_uuid, trade_id))
-            
-            # Then create the new linked trade
-            cursor.execute("""
-                INSERT INTO trades (
-                    user_id, account_id, symbol, action, quantity, 
-                    entry_price, status, broker_order_id, 
-                    opened_at, link_group_id, close_reason
-                ) VALUES (
-                    %s, %s, %s, %s, %s, 
-                    %s, 'filled', %s, 
-                    NOW(), %s, 'stop_loss'
-                )
-                RETURNING id
-            """, (
-                user_id, account_id, symbol, order_side.upper(), total_quantity,
-                current_price, order_result['id'], 
-                link_group_uuid  # Same UUID for linking
-            ))
-            
-            new_trade_id = cursor.fetchone()[0]
-            
-            # Update original trade status
-            cursor.execute("""
-                UPDATE trades 
-                SET status = 'closed',
-                    close_reason = 'stop_loss',
-                    exit_price = %s,
-                    closed_at = NOW()
-                WHERE id = %s
-            """, (current_price, trade_id))
-            
-            # Cancel pending take profit levels for this trade
-            cursor.execute("""
-                UPDATE take_profit_levels 
-                SET status = 'cancelled',
-                    executed_at = NOW()
-                WHERE trade_id = %s AND status = 'pending'
-            """, (trade_id,))
-
-            # Create notification
-            import json
-            notification_data = {
-                'executed_price': float(current_price),
-                'total_quantity': float(total_quantity),
-                'symbol': symbol,
-                'broker_order_id': order_result['id'],
-                'sell_trade_created': True,
-                'sell_trade_id': new_trade_id
-            }
-            cursor.execute("""
-                INSERT INTO trade_notifications (user_id, trade_id, notification_type, data, created_at)
-                VALUES (%s, %s, 'stop_loss_executed', %s, NOW())
-            """, (user_id, trade_id, json.dumps(notification_data)))
-            
-            return True
-            
+        # Place market order for ALL remaining shares (not just level quantity)
+        broker_order_id = await submit_level_order(client, client_order_id, symbol, order_side, float(total_quantity))
     except Exception as e:
         logger.error(f"Error executing stop loss level {level_id}: {e}")
-        
-    return False
+        cursor.connection.rollback()
+        release_level(cursor, 'stop_loss', level_id)
+        return False
+    
+    # Finalize the claim
+    cursor.execute("""
+        UPDATE stop_loss_levels 
+        SET status = 'executed',
+            executed_at = NOW(),
+            executed_price = %s,
+            executed_shares = %s,
+            broker_order_id = %s
+        WHERE id = %s AND status = 'executing'
+    """, (current_price, total_quantity, broker_order_id, level_id))
+    
+    # Create a new SELL trade record linked to the original BUY trade
+    import uuid
+    link_group_uuid = str(uuid.uuid4())
+    
+    # First update the original trade with the link_group_id
+    cursor.execute("""
+        UPDATE trades SET link_group_id = %s WHERE id = %s
+    """, (link_group_uuid, trade_id))
+    
+    # Then create the new linked trade
+    cursor.execute("""
+        INSERT INTO trades (
+            user_id, account_id, symbol, action, quantity, 
+            entry_price, status, broker_order_id, 
+            opened_at, link_group_id, close_reason
+        ) VALUES (
+            %s, %s, %s, %s, %s, 
+            %s, 'filled', %s, 
+            NOW(), %s, 'stop_loss'
+        )
+        RETURNING id
+    """, (
+        user_id, account_id, symbol, order_side.upper(), total_quantity,
+        current_price, broker_order_id, 
+        link_group_uuid  # Same UUID for linking
+    ))
+    
+    new_trade_id = cursor.fetchone()[0]
+    
+    # Update original trade status
+    cursor.execute("""
+        UPDATE trades 
+        SET status = 'closed',
+            close_reason = 'stop_loss',
+            exit_price = %s,
+            closed_at = NOW()
+        WHERE id = %s
+    """, (current_price, trade_id))
+    
+    # Cancel pending take profit levels for this trade
+    cursor.execute("""
+        UPDATE take_profit_levels 
+        SET status = 'cancelled',
+            executed_at = NOW()
+        WHERE trade_id = %s AND status = 'pending'
+    """, (trade_id,))
+
+    # Create notification
+    import json
+    notification_data = {
+        'executed_price': float(current_price),
+        'total_quantity': float(total_quantity),
+        'symbol': symbol,
+        'broker_order_id': broker_order_id,
+        'sell_trade_created': True,
+        'sell_trade_id': new_trade_id
+    }
+    cursor.execute("""
+        INSERT INTO trade_notifications (user_id, trade_id, notification_type, data, created_at)
+        VALUES (%s, %s, 'stop_loss_executed', %s, NOW())
+    """, (user_id, trade_id, json.dumps(notification_data)))
+    
+    # Each execution is its own unit of work
+    cursor.connection.commit()
+    return True
 
 # Mark API calls for the main function
 monitor_levels_process._api_calls = 3  # More realistic: 1-2 accounts × 1 API call each + buffer 
\ No newline at end of file
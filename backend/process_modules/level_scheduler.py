@@ -0,0 +1,194 @@
+"""
+Proximity-aware scheduling for the level monitor
+
+Instead of polling every symbol at the same rate, each (account, symbol) pair is
+re-checked after an interval derived from how far price is from the nearest
+pending TP/SL trigger, measured in units of recent volatility. Under a random
+walk, price needs roughly (distance / sigma)^2 seconds to cover a distance, so
+the next check is scheduled well inside that time:
+
+    interval = clamp((distance / (SAFETY_SIGMAS * sigma_per_sqrt_second))^2, MIN, MAX)
+
+Symbols close to a trigger get checked every cycle, distant ones every few tens
+of seconds. Polling stops entirely while the market is closed.
+
+Accounts are monitored concurrently from fan-out threads, so state changes go
+through a lock.
+
+Environment:
+- LEVEL_MONITOR_MIN_INTERVAL: fastest re-check in seconds (default 0.5)
+- LEVEL_MONITOR_MAX_INTERVAL: slowest re-check in seconds (default 30)
+- LEVEL_MONITOR_SAFETY_SIGMAS: volatility multiples of headroom (default 4)
+- LEVEL_MONITOR_MARKET_HOURS_ONLY: pause outside regular hours (default true)
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIN_INTERVAL = float(os.getenv('LEVEL_MONITOR_MIN_INTERVAL', '0.5'))
+MAX_INTERVAL = float(os.getenv('LEVEL_MONITOR_MAX_INTERVAL', '30'))
+SAFETY_SIGMAS = float(os.getenv('LEVEL_MONITOR_SAFETY_SIGMAS', '4'))
+MARKET_HOURS_ONLY = os.getenv('LEVEL_MONITOR_MARKET_HOURS_ONLY', 'true').lower() == 'true'
+
+# ~2% daily move over a 6.5h session, used until a symbol has its own samples
+DEFAULT_SIGMA = 0.02 / math.sqrt(6.5 * 3600)
+MIN_SIGMA = DEFAULT_SIGMA / 4
+EWMA_ALPHA = 0.1
+CLOCK_TTL_SECONDS = 300
+
+
+@dataclass(slots=True)
+class SymbolVolatility:
+    last_price: float
+    last_sample: float
+    variance_per_second: float = DEFAULT_SIGMA ** 2
+    samples: int = 0
+
+
+class ProximityScheduler:
+    """Tracks per-symbol volatility and per-(account, symbol) next check times"""
+
+    def __init__(self):
+        self.volatility: Dict[str, SymbolVolatility] = {}
+        self.next_check: Dict[Tuple[int, str], float] = {}
+        self.last_interval: Dict[Tuple[int, str], float] = {}
+        self.scheduled_triggers: Dict[Tuple[int, str], Tuple[float, ...]] = {}
+        self.market_open: Optional[bool] = None
+        self.clock_checked_until = 0.0
+        self._lock = threading.Lock()
+
+    def due_symbols(self, account_id: int, triggers_by_symbol: Dict[str, List[float]],
+                    now: Optional[float] = None) -> List[str]:
+        """Symbols for this account that need a price check now.
+
+        A symbol is due when its next check time has passed, it is new, or its
+        set of trigger prices changed since it was scheduled (new/edited levels
+        are armed immediately).
+        """
+        now = now if now is not None else time.monotonic()
+
+        with self._lock:
+            # Forget pairs whose levels are gone
+            for key in [key for key in self.next_check if key[0] == account_id and key[1] not in triggers_by_symbol]:
+                self.next_check.pop(key, None)
+                self.last_interval.pop(key, None)
+                self.scheduled_triggers.pop(key, None)
+
+            due = []
+            for symbol, triggers in triggers_by_symbol.items():
+                key = (account_id, symbol)
+                if (self.next_check.get(key, 0) <= now
+                        or self.scheduled_triggers.get(key) != tuple(sorted(triggers))):
+                    due.append(symbol)
+            return due
+
+    def sigma(self, symbol: str) -> float:
+        """Recent volatility in log-return per sqrt(second)"""
+        state = self.volatility.get(symbol)
+        if not state:
+            return DEFAULT_SIGMA
+        return max(math.sqrt(state.variance_per_second), MIN_SIGMA)
+
+    def record_price(self, symbol: str, price: float, now: Optional[float] = None):
+        """Update the symbol's EWMA volatility with a new price sample"""
+        now = now if now is not None else time.monotonic()
+        if price <= 0:
+            return
+
+        with self._lock:
+            state = self.volatility.get(symbol)
+            if state is None:
+                self.volatility[symbol] = SymbolVolatility(last_price=price, last_sample=now)
+                return
+
+            elapsed = now - state.last_sample
+            if elapsed <= 0:
+                return
+
+            log_return = math.log(price / state.last_price)
+            sample_variance = log_return * log_return / elapsed
+            state.variance_per_second = EWMA_ALPHA * sample_variance + (1 - EWMA_ALPHA) * state.variance_per_second
+            state.last_price = price
+            state.last_sample = now
+            state.samples += 1
+
+    def schedule(self, account_id: int, symbol: str, price: float, trigger_prices: Iterable[float],
+                 now: Optional[float] = None) -> float:
+        """Set the next check for (account, symbol) from the nearest trigger. Returns the interval."""
+        now = now if now is not None else time.monotonic()
+        trigger_prices = list(trigger_prices)
+        interval = self.interval_for(symbol, price, trigger_prices)
+        with self._lock:
+            self.next_check[(account_id, symbol)] = now + interval
+            self.last_interval[(account_id, symbol)] = interval
+            self.scheduled_triggers[(account_id, symbol)] = tuple(sorted(trigger_prices))
+        return interval
+
+    def interval_for(self, symbol: str, price: float, trigger_prices: Iterable[float]) -> float:
+        triggers = [float(p) for p in trigger_prices if p and float(p) > 0]
+        if price <= 0 or not triggers:
+            return MIN_INTERVAL
+
+        distance = min(abs(math.log(trigger / price)) for trigger in triggers)
+        horizon = (distance / (SAFETY_SIGMAS * self.sigma(symbol))) ** 2
+        return min(max(horizon, MIN_INTERVAL), MAX_INTERVAL)
+
+    def known_closed(self) -> bool:
+        """True while a cached clock reading says the market is closed (no DB or API work needed)"""
+        return self.market_open is False and time.monotonic() < self.clock_checked_until
+
+    async def is_market_open(self, client) -> bool:
+        """Cached market clock check; always open when MARKET_HOURS_ONLY is off"""
+        if not MARKET_HOURS_ONLY:
+            return True
+
+        now = time.monotonic()
+        if self.market_open is not None and now < self.clock_checked_until:
+            return self.market_open
+
+        clock = await client.get_market_clock()
+        if not clock:
+            # Don't stop monitoring because the clock endpoint failed
+            self.market_open = True
+            self.clock_checked_until = now + 60
+            return True
+
+        self.market_open = clock['is_open']
+        ttl = CLOCK_TTL_SECONDS
+        boundary = clock['next_close'] if self.market_open else clock['next_open']
+        if boundary:
+            seconds_to_boundary = (boundary - datetime.now(timezone.utc)).total_seconds()
+            ttl = max(1.0, min(ttl, seconds_to_boundary))
+        self.clock_checked_until = now + ttl
+
+        if not self.market_open:
+            logger.debug(f"Market closed, level polling paused for {ttl:.0f}s")
+        return self.market_open
+
+    def get_stats(self) -> Dict[str, object]:
+        """Current schedule for status reporting"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "market_open": self.market_open,
+                "tracked": len(self.next_check),
+                "schedule": {
+                    f"{account_id}:{symbol}": {
+                        "interval_seconds": round(self.last_interval.get((account_id, symbol), 0), 2),
+                        "next_check_in": round(max(0.0, next_at - now), 2),
+                        "sigma": self.sigma(symbol)
+                    }
+                    for (account_id, symbol), next_at in self.next_check.items()
+                }
+            }
+
+
+level_scheduler = ProximityScheduler()
@@ -0,0 +1,146 @@
+"""
+Level monitor sharding
+
+Several level monitor workers split the accounts between them:
+- every worker keeps a heartbeat row in level_monitor_workers; rows older than
+  the lease TTL are treated as dead and removed
+- accounts are mapped to live workers with a consistent hash ring, so a worker
+  joining or leaving only moves the accounts adjacent to it on the ring
+- before monitoring an account a worker takes a lease row in
+  level_monitor_account_leases; a lease still held by another live worker is
+  never stolen, so two workers cannot execute the same account's levels while
+  they briefly disagree about membership
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+from typing import Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL_SECONDS = int(os.getenv('LEVEL_MONITOR_LEASE_TTL_SECONDS', '15'))
+VIRTUAL_NODES = int(os.getenv('LEVEL_MONITOR_VIRTUAL_NODES', '64'))
+
+
+def create_shard_tables(cursor):
+    """Create worker heartbeat and account lease tables"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS level_monitor_workers (
+            worker_id VARCHAR(255) PRIMARY KEY,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            heartbeat_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            account_count INTEGER DEFAULT 0,
+            last_cycle_ms INTEGER
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS level_monitor_account_leases (
+            account_id INTEGER PRIMARY KEY REFERENCES accounts(id) ON DELETE CASCADE,
+            worker_id VARCHAR(255) NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_level_monitor_account_leases_worker
+        ON level_monitor_account_leases(worker_id)
+    """)
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: Iterable[str], virtual_nodes: int = VIRTUAL_NODES):
+        self.ring: List[int] = []
+        self.owners: Dict[int, str] = {}
+        for node in sorted(nodes):
+            for replica in range(virtual_nodes):
+                point = _hash(f"{node}#{replica}")
+                self.ring.append(point)
+                self.owners[point] = node
+        self.ring.sort()
+
+    def owner(self, key: str) -> str:
+        if not self.ring:
+            raise ValueError("Hash ring has no nodes")
+        index = bisect.bisect(self.ring, _hash(key)) % len(self.ring)
+        return self.owners[self.ring[index]]
+
+
+class ShardCoordinator:
+    """Membership, ownership and leases for one level monitor worker"""
+
+    def __init__(self, worker_id: str = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.live_workers: List[str] = []
+
+    def heartbeat(self, cursor, account_count: int = 0, last_cycle_ms: int = None) -> List[str]:
+        """Refresh this worker's row, expire dead workers and return the live membership"""
+        cursor.execute("""
+            INSERT INTO level_monitor_workers (worker_id, heartbeat_at, account_count, last_cycle_ms)
+            VALUES (%s, NOW(), %s, %s)
+            ON CONFLICT (worker_id) DO UPDATE
+            SET heartbeat_at = NOW(),
+                account_count = EXCLUDED.account_count,
+                last_cycle_ms = EXCLUDED.last_cycle_ms
+        """, (self.worker_id, account_count, last_cycle_ms))
+
+        cursor.execute("""
+            DELETE FROM level_monitor_workers
+            WHERE heartbeat_at < NOW() - make_interval(secs => %s)
+            RETURNING worker_id
+        """, (LEASE_TTL_SECONDS,))
+        dead = [row[0] for row in cursor.fetchall()]
+        if dead:
+            logger.warning(f"[SHARDS] Expired dead workers: {', '.join(dead)}")
+            cursor.execute("""
+                DELETE FROM level_monitor_account_leases WHERE worker_id = ANY(%s)
+            """, (dead,))
+
+        cursor.execute("SELECT worker_id FROM level_monitor_workers ORDER BY worker_id")
+        live = [row[0] for row in cursor.fetchall()]
+
+        if live != self.live_workers:
+            logger.info(f"[SHARDS] Membership changed: {len(live)} workers {live}")
+        self.live_workers = live
+        return live
+
+    def owned_accounts(self, account_ids: Iterable[int]) -> Set[int]:
+        """Accounts this worker owns on the current ring"""
+        if self.worker_id not in self.live_workers:
+            return set()
+        ring = HashRing(self.live_workers)
+        return {account_id for account_id in account_ids if ring.owner(str(account_id)) == self.worker_id}
+
+    def claim_leases(self, cursor, account_ids: Set[int]) -> Set[int]:
+        """Take or renew leases for owned accounts; release everything else. Returns leased accounts."""
+        cursor.execute("""
+            DELETE FROM level_monitor_account_leases
+            WHERE worker_id = %s AND NOT (account_id = ANY(%s))
+        """, (self.worker_id, list(account_ids)))
+
+        if not account_ids:
+            return set()
+
+        cursor.execute("""
+            INSERT INTO level_monitor_account_leases (account_id, worker_id, expires_at)
+            SELECT unnest(%s::int[]), %s, NOW() + make_interval(secs => %s)
+            ON CONFLICT (account_id) DO UPDATE
+            SET worker_id = EXCLUDED.worker_id,
+                expires_at = EXCLUDED.expires_at
+            WHERE level_monitor_account_leases.worker_id = EXCLUDED.worker_id
+               OR level_monitor_account_leases.expires_at < NOW()
+            RETURNING account_id
+        """, (list(account_ids), self.worker_id, LEASE_TTL_SECONDS))
+        return {row[0] for row in cursor.fetchall()}
+
+    def leave(self, cursor):
+        """Remove this worker so the others pick up its accounts immediately"""
+        cursor.execute("DELETE FROM level_monitor_account_leases WHERE worker_id = %s", (self.worker_id,))
+        cursor.execute("DELETE FROM level_monitor_workers WHERE worker_id = %s", (self.worker_id,))
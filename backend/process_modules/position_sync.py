@@ -1,6 +1,6 @@
 """
 Position Sync Process Module
-Synchronizes positions with broker.
+Reconciles the positions mirror (account_positions) with the broker.
 """
 
 import logging
@@ -10,9 +10,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db import get_db_connection
 from alpaca_client import AlpacaClient
+from process_modules.account_fanout import fan_out_accounts
+from positions_mirror import replace_account_positions, snapshot_time
 
 logger = logging.getLogger(__name__)
 
+ACCOUNT_DEADLINE_SECONDS = float(os.getenv('POSITION_SYNC_ACCOUNT_DEADLINE_SECONDS', '20'))
+
 async def sync_positions_process():
     """Sync positions with broker"""
     
@@ -32,25 +36,11 @@ async def sync_positions_process():
         
         accounts = cursor.fetchall()
         
-        for account in accounts:
-            try:
-                account_id, api_key, api_secret, account_type = account
-                
-                client = AlpacaClient(
-                    api_key=api_key,
-                    secret_key=api_secret,
-                    paper=(account_type == 'paper')
-                )
-                
-                # Get positions from broker
-                positions = await client.get_positions()
-                api_calls_made += 1
-                
-                logger.debug(f"Synced {len(positions)} positions for account {account_id}")
-                
-            except Exception as e:
-                logger.error(f"Error syncing positions for account {account_id}: {e}")
-                continue
+        # Each account runs concurrently on its own connection
+        results = await fan_out_accounts(
+            "position_sync", accounts, sync_account_positions, ACCOUNT_DEADLINE_SECONDS
+        )
+        api_calls_made += sum(r.result or 0 for r in results)
         
         conn.commit()
         
@@ -66,4 +56,23 @@ async def sync_positions_process():
         if conn:
             conn.close()
 
+async def sync_account_positions(cursor, account) -> int:
+    """Reconcile one account's positions mirror with the broker and return API calls made"""
+    account_id, api_key, api_secret, account_type = account
+    
+    client = AlpacaClient(
+        api_key=api_key,
+        secret_key=api_secret,
+        paper=(account_type == 'paper')
+    )
+    
+    # Broker clock first: fills up to this time are in the snapshot below
+    snapshot_at = await snapshot_time(client)
+    # Get positions from broker - raise on failure so an outage does not empty the mirror
+    positions = await client.get_positions(raise_errors=True)
+    replace_account_positions(cursor, account_id, positions, snapshot_at)
+    
+    logger.debug(f"Synced {len(positions)} positions for account {account_id}")
+    return 2
+
 sync_positions_process._api_calls = 2 
\ No newline at end of file
@@ -11,9 +11,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db import get_db_connection
 from alpaca_client import AlpacaClient
+from process_modules.account_fanout import fan_out_accounts
+from positions_mirror import get_position_symbols, update_position_prices
 
 logger = logging.getLogger(__name__)
 
+ACCOUNT_DEADLINE_SECONDS = float(os.getenv('PRICE_UPDATE_ACCOUNT_DEADLINE_SECONDS', '15'))
+
 async def update_prices_process():
     """Batch update current prices for all open positions"""
     
@@ -36,42 +40,11 @@ async def update_prices_process():
         
         accounts = cursor.fetchall()
         
-        for account in accounts:
-            try:
-                account_id, api_key, api_secret, account_type = account
-                
-                client = AlpacaClient(
-                    api_key=api_key,
-                    secret_key=api_secret,
-                    paper=(account_type == 'paper')
-                )
-                
-                # Get symbols needing price updates
-                cursor.execute("""
-                    SELECT DISTINCT symbol FROM trades 
-                    WHERE account_id = %s 
-                    AND status IN ('filled', 'open')
-                    AND current_price IS NULL
-                """, (account_id,))
-                
-                symbols = [row[0] for row in cursor.fetchall()]
-                
-                if symbols:
-                    # Batch get prices
-                    prices = await client.get_current_prices(symbols)
-                    api_calls_made += 1
-                    
-                    # Update trades
-                    for symbol, price in prices.items():
-                        cursor.execute("""
-                            UPDATE trades 
-                            SET current_price = %s
-                            WHERE account_id = %s AND symbol = %s AND status IN ('filled', 'open')
-                        """, (price, account_id, symbol))
-                
-            except Exception as e:
-                logger.error(f"Error updating prices for account {account_id}: {e}")
-                continue
+        # Each account runs concurrently on its own connection
+        results = await fan_out_accounts(
+            "price_update", accounts, update_account_prices, ACCOUNT_DEADLINE_SECONDS
+        )
+        api_calls_made += sum(r.result or 0 for r in results)
         
         conn.commit()
         
@@ -87,4 +60,45 @@ async def update_prices_process():
         if conn:
             conn.close()
 
+async def update_account_prices(cursor, account) -> int:
+    """Update prices for one account's open trades and mirrored positions and return API calls made"""
+    account_id, api_key, api_secret, account_type = account
+    
+    client = AlpacaClient(
+        api_key=api_key,
+        secret_key=api_secret,
+        paper=(account_type == 'paper')
+    )
+    
+    # Get symbols needing price updates
+    cursor.execute("""
+        SELECT DISTINCT symbol FROM trades 
+        WHERE account_id = %s 
+        AND status IN ('filled', 'open')
+        AND current_price IS NULL
+    """, (account_id,))
+    
+    symbols = [row[0] for row in cursor.fetchall()]
+    position_symbols = get_position_symbols(cursor, account_id)
+    
+    if not symbols and not position_symbols:
+        return 0
+    
+    # Batch get prices (one call covers both)
+    prices = await client.get_current_prices(sorted(set(symbols) | set(position_symbols)))
+    
+    # Update trades
+    for symbol in symbols:
+        if symbol not in prices:
+            continue
+        cursor.execute("""
+            UPDATE trades 
+            SET current_price = %s
+            WHERE account_id = %s AND symbol = %s AND status IN ('filled', 'open')
+        """, (prices[symbol], account_id, symbol))
+    
+    update_position_prices(cursor, account_id, {symbol: prices[symbol] for symbol in position_symbols if symbol in prices})
+    
+    return 1
+
 update_prices_process._api_calls = 3 
\ No newline at end of file
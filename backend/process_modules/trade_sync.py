@@ -16,9 +16,16 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db import get_db_connection
 from alpaca_client import AlpacaClient
+from pending_intents import get_pending_intent, complete_intent, CUSTOM_LEVELS
+from signal_latency import mark_trade_stage
+from positions_mirror import apply_fill
+from process_modules.account_fanout import fan_out_accounts
+from broker_levels import reconcile_broker_levels
 
 logger = logging.getLogger(__name__)
 
+ACCOUNT_DEADLINE_SECONDS = float(os.getenv('TRADE_SYNC_ACCOUNT_DEADLINE_SECONDS', '20'))
+
 async def sync_trades_process():
     """
     Consolidated trade sync process that handles:
@@ -48,28 +55,11 @@ async def sync_trades_process():
         accounts = cursor.fetchall()
         logger.debug(f"Found {len(accounts)} active accounts to sync")
         
-        for account in accounts:
-            try:
-                account_id, api_key, api_secret, account_type = account
-                
-                # Get broker client
-                client = AlpacaClient(
-                    api_key=api_key,
-                    secret_key=api_secret,
-                    paper=(account_type == 'paper')
-                )
-                
-                # Sync pending trades
-                await sync_pending_trades(cursor, client, account_id)
-                api_calls_made += 3  # Estimated API calls for pending trades
-                
-                # Update current prices for open positions
-                await update_position_prices(cursor, client, account_id)
-                api_calls_made += 2  # Estimated API calls for price updates
-                
-            except Exception as e:
-                logger.error(f"Error syncing account {account_id}: {e}")
-                continue
+        # Each account runs concurrently on its own connection
+        results = await fan_out_accounts(
+            "trade_sync", accounts, sync_account_trades, ACCOUNT_DEADLINE_SECONDS
+        )
+        api_calls_made += sum(r.result or 0 for r in results)
         
         conn.commit()
         
@@ -86,12 +76,34 @@ async def sync_trades_process():
         if conn:
             conn.close()
 
+async def sync_account_trades(cursor, account) -> int:
+    """Sync one account's trades and return estimated API calls made"""
+    account_id, api_key, api_secret, account_type = account
+    
+    # Get broker client
+    client = AlpacaClient(
+        api_key=api_key,
+        secret_key=api_secret,
+        paper=(account_type == 'paper')
+    )
+    
+    # Sync pending trades
+    await sync_pending_trades(cursor, client, account_id)
+    
+    # Update current prices for open positions
+    await update_position_prices(cursor, client, account_id)
+    
+    # Apply fills of broker-native TP/SL orders
+    reconcile_calls = await reconcile_broker_levels(cursor, client, account_id)
+    
+    return 5 + reconcile_calls  # Estimated: 3 for pending trades + 2 for price updates
+
 async def sync_pending_trades(cursor, client: AlpacaClient, account_id: int):
     """Sync pending trades for a specific account"""
     
     # Get pending trades
     cursor.execute("""
-        SELECT id, broker_order_id, symbol, status
+        SELECT id, broker_order_id, symbol, status, action
         FROM trades 
         WHERE account_id = %s 
         AND status = 'pending'
@@ -102,7 +114,7 @@ async def sync_pending_trades(cursor, client: AlpacaClient, account_id: int):
     
     for trade in pending_trades:
         try:
-            trade_id, broker_order_id, symbol, current_status = trade
+            trade_id, broker_order_id, symbol, current_status, action = trade
             
             # Get order status from broker
             order_status = await client.get_order_status(broker_order_id)
@@ -128,6 +140,9 @@ async def sync_pending_trades(cursor, client: AlpacaClient, account_id: int):
                     trade_id
                 ))
                 
+                mark_trade_stage(cursor, trade_id, 'filled_at')
+                apply_fill(cursor, account_id, broker_order_id, symbol, action, filled_qty, fill_price,
+                           order_status.get('filled_at'))
                 logger.info(f"✅ Trade {symbol} filled at ${fill_price} - {filled_qty} shares")
                 
                 # Process take profit and stop loss levels
@@ -229,23 +244,16 @@ async def process_trade_levels_if_needed(cursor, trade_id: int, fill_price: floa
             signal_dict = dict(zip([desc[0] for desc in cursor.description], signal_data))
             
             # Check for custom levels
-            cursor.execute("""
-                SELECT data FROM trade_notifications 
-                WHERE trade_id = %s AND data->>'notification_type' = 'custom_levels_pending'
-                ORDER BY created_at DESC LIMIT 1
-            """, (trade_id,))
-            
-            custom_levels_row = cursor.fetchone()
-            custom_levels = None
-            
-            if custom_levels_row:
-                notification_data = custom_levels_row[0]
-                custom_levels = notification_data.get('custom_levels')
+            pending = get_pending_intent(cursor, trade_id, CUSTOM_LEVELS)
+            custom_levels = pending[1].get('custom_levels') if pending else None
             
             # Import and call the existing process_trade_levels function
             from main import process_trade_levels
             await process_trade_levels(trade_id, signal_dict, filled_qty, fill_price, cursor, custom_levels)
             
+            if pending:
+                complete_intent(cursor, pending[0])
+            
             logger.info(f"✅ Processed levels for trade {trade_id}")
             
     except Exception as e:
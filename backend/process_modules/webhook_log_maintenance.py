@@ -0,0 +1,44 @@
+"""
+Webhook Log Maintenance Process Module
+Pre-creates upcoming webhook_logs partitions and drops the expired ones.
+"""
+
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from webhook_logs import ensure_partitions, drop_expired_partitions
+
+logger = logging.getLogger(__name__)
+
+async def maintain_webhook_logs_process():
+    """Rotate webhook_logs partitions according to the retention setting"""
+
+    conn = None
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        created = ensure_partitions(cursor)
+        dropped = drop_expired_partitions(cursor)
+
+        conn.commit()
+
+        if created:
+            logger.info(f"[WEBHOOK_LOGS] Created partitions: {', '.join(created)}")
+        if dropped:
+            logger.info(f"[WEBHOOK_LOGS] Dropped expired partitions: {', '.join(dropped)}")
+
+    except Exception as e:
+        logger.error(f"Error in webhook log maintenance process: {e}")
+        if conn:
+            conn.rollback()
+
+    finally:
+        if conn:
+            conn.close()
+
+maintain_webhook_logs_process._api_calls = 0
@@ -0,0 +1,190 @@
+"""
+Per-statement database statistics and slow-query log
+
+Every statement run through a get_db_connection() cursor is reduced to a
+fingerprint (literals, IN lists and multi-row VALUES collapsed, whitespace
+normalised) and counted with its total/max time and rows, broken down by the
+calling endpoint or process (metrics.query_context).
+
+Statements slower than DB_SLOW_QUERY_MS are logged with their parameters
+redacted to type names. GET /api/debug/db/statements lists the top
+fingerprints so the inline SQL that dominates database load can be found.
+"""
+
+import os
+import re
+import logging
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from metrics import record_db_query
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '250'))
+MAX_FINGERPRINTS = int(os.getenv('DB_STATEMENT_STATS_MAX', '500'))
+OVERFLOW_FINGERPRINT = '<other statements>'
+
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.$])-?\d+(?:\.\d+)?\b')
+_NAMED_PARAM = re.compile(r'%\([^)]*\)s')
+_PLACEHOLDER = r'(?:\?|%s|NULL|DEFAULT|TRUE|FALSE)'
+_TUPLE = rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)'
+_IN_LIST = re.compile(rf'\bIN\s*{_TUPLE}', re.I)
+_VALUES_ROWS = re.compile(rf'({_TUPLE})(?:\s*,\s*{_TUPLE})+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(query: str) -> str:
+    """Normalised statement text with literals replaced by ?"""
+    text = _COMMENT.sub(' ', query)
+    text = _STRING.sub('?', text)
+    text = _NAMED_PARAM.sub('%s', text)
+    text = _NUMBER.sub('?', text)
+    text = _IN_LIST.sub('IN (...)', text)
+    text = _VALUES_ROWS.sub(r'\1, ...', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _redact(value: Any) -> str:
+    if value is None:
+        return 'None'
+    if isinstance(value, (list, tuple)):
+        return f'<{type(value).__name__}[{len(value)}]>'
+    return f'<{type(value).__name__}>'
+
+
+def redact_params(params: Any) -> str:
+    """Parameter types only - values may hold credentials, keys or message text"""
+    if params is None:
+        return '()'
+    if isinstance(params, str):
+        return params
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {_redact(value)}' for key, value in params.items()) + '}'
+    if isinstance(params, (list, tuple)):
+        return '(' + ', '.join(_redact(value) for value in params) + ')'
+    return _redact(params)
+
+
+class StatementStats:
+    __slots__ = ('fingerprint', 'calls', 'errors', 'total_time', 'max_time', 'rows', 'callers')
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.callers: Dict[str, List[float]] = {}  # caller -> [calls, total_time]
+
+    def to_dict(self) -> Dict[str, Any]:
+        callers = sorted(self.callers.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "statement": self.fingerprint,
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.total_time * 1000, 3),
+            "mean_ms": round(self.total_time * 1000 / self.calls, 3) if self.calls else 0,
+            "max_ms": round(self.max_time * 1000, 3),
+            "rows": self.rows,
+            "callers": {caller: {"calls": int(calls), "total_ms": round(total * 1000, 3)}
+                        for caller, (calls, total) in callers}
+        }
+
+
+class QueryStats:
+    """Fingerprint -> StatementStats, bounded to MAX_FINGERPRINTS entries"""
+
+    ORDERINGS = {
+        'total': lambda stats: stats.total_time,
+        'calls': lambda stats: stats.calls,
+        'mean': lambda stats: stats.total_time / stats.calls if stats.calls else 0,
+        'max': lambda stats: stats.max_time,
+    }
+
+    def __init__(self, max_fingerprints: int = MAX_FINGERPRINTS, slow_query_ms: float = SLOW_QUERY_MS):
+        self.max_fingerprints = max_fingerprints
+        self.slow_query_ms = slow_query_ms
+        self.statements: Dict[str, StatementStats] = {}
+        self.slow_queries = 0
+        self.since = datetime.now()
+        self._lock = threading.Lock()
+
+    def record(self, query: str, params: Any, duration: float, rows: int, caller: str, failed: bool = False):
+        key = fingerprint(query)
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                if len(self.statements) >= self.max_fingerprints:
+                    key = OVERFLOW_FINGERPRINT
+                    stats = self.statements.get(key)
+                if stats is None:
+                    stats = self.statements[key] = StatementStats(key)
+            stats.calls += 1
+            stats.total_time += duration
+            if duration > stats.max_time:
+                stats.max_time = duration
+            if failed:
+                stats.errors += 1
+            elif rows > 0:
+                stats.rows += rows
+            per_caller = stats.callers.get(caller)
+            if per_caller is None:
+                stats.callers[caller] = [1, duration]
+            else:
+                per_caller[0] += 1
+                per_caller[1] += duration
+            slow = duration * 1000 >= self.slow_query_ms
+            if slow:
+                self.slow_queries += 1
+
+        if slow:
+            logger.warning(f"[SLOW_QUERY] {duration * 1000:.0f}ms {caller}: {key} params={redact_params(params)}")
+
+    def top(self, limit: int = 20, order_by: str = 'total') -> List[Dict[str, Any]]:
+        sort_key = self.ORDERINGS.get(order_by, self.ORDERINGS['total'])
+        with self._lock:
+            ranked = sorted(self.statements.values(), key=sort_key, reverse=True)[:limit]
+            return [stats.to_dict() for stats in ranked]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "since": self.since.isoformat(),
+                "fingerprints": len(self.statements),
+                "executed": sum(stats.calls for stats in self.statements.values()),
+                "total_ms": round(sum(stats.total_time for stats in self.statements.values()) * 1000, 3),
+                "slow_queries": self.slow_queries,
+                "slow_query_ms": self.slow_query_ms
+            }
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.slow_queries = 0
+            self.since = datetime.now()
+
+
+statement_stats = QueryStats()
+
+
+def record_statement(cursor, query: Any, params: Any, duration: float, failed: bool = False, many: bool = False):
+    """Called by the instrumented cursor after every execute()/executemany()"""
+    caller = record_db_query(duration)
+    try:
+        if many:
+            params = '<executemany>'  # Not worth listing every parameter set in a log line
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        elif not isinstance(query, str):
+            query = query.as_string(cursor)  # psycopg2.sql.Composable
+        statement_stats.record(query, params, duration, cursor.rowcount, caller, failed)
+    except Exception as e:
+        # Statistics must never break the statement that was just executed
+        logger.debug(f"[QUERY_STATS] Could not record statement: {e}")
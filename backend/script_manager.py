@@ -11,6 +11,14 @@ Features:
 - Conflict detection and prevention
 - Unified logging and reporting
 - Resource usage monitoring
+- Single leader across workers/instances (Postgres advisory lock)
+
+Modes (SCRIPT_MANAGER_MODE):
+- embedded (default): every API worker runs a Script Manager, but only the one
+  holding the leader lock runs processes; the others take over if it dies
+- standalone: same election, meant for `python script_manager.py` as its own service
+- off: never run background processes in this process (API-only workers next
+  to a standalone scheduler)
 """
 
 import os
@@ -20,7 +28,7 @@ import logging
 import time
 import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import threading
@@ -32,6 +40,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from db import get_db_connection
 from alpaca_client import AlpacaClient
+from change_listener import ChangeListener
+from leader_election import LeaderLock
+from metrics import PROCESS_CYCLE_SECONDS, query_context
+from loop_watchdog import loop_watchdog, WATCHDOG_ENABLED
 
 # Configure logging
 logging.basicConfig(
@@ -44,6 +56,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+SCRIPT_MANAGER_MODE = os.getenv('SCRIPT_MANAGER_MODE', 'embedded').lower()
+LEADER_ELECTION_ENABLED = os.getenv('SCRIPT_MANAGER_LEADER_ELECTION', 'true').lower() == 'true'
+LEADER_RETRY_SECONDS = float(os.getenv('SCRIPT_MANAGER_LEADER_RETRY_SECONDS', '10'))
+LEADER_CHECK_SECONDS = float(os.getenv('SCRIPT_MANAGER_LEADER_CHECK_SECONDS', '5'))
+# Level monitoring is done by level_monitor_worker.py shards instead
+LEVEL_MONITOR_SHARDING = os.getenv('LEVEL_MONITOR_SHARDING', 'false').lower() == 'true'
+
 class ProcessType(Enum):
     TRADE_SYNC = "trade_sync"
     PRICE_UPDATE = "price_update"
@@ -51,6 +70,8 @@ class ProcessType(Enum):
     NOTIFICATION_CHECK = "notification_check"
     POSITION_SYNC = "position_sync"
     DASHBOARD_SYNC = "dashboard_sync"
+    WEBHOOK_LOG_MAINTENANCE = "webhook_log_maintenance"
+    ASSET_REFRESH = "asset_refresh"
 
 @dataclass
 class ProcessConfig:
@@ -62,6 +83,9 @@ class ProcessConfig:
     priority: int = 1  # 1=highest, 5=lowest
     timeout_seconds: int = 30
     retry_count: int = 3
+    wake_on: Tuple[str, ...] = ()  # Tables whose changes trigger an immediate run
+    event_interval_seconds: Optional[float] = None  # Fallback interval while change events are live
+    debounce_seconds: float = 0.5  # Coalesce bursts of changes into one run
 
 @dataclass
 class ProcessMetrics:
@@ -71,9 +95,11 @@ class ProcessMetrics:
     total_runs: int = 0
     success_count: int = 0
     error_count: int = 0
-    avg_duration: float = 0.0
+    avg_duration: float = 0.0  # Mean of successful runs
+    total_duration: float = 0.0
     api_calls_last_minute: int = 0
     last_error_message: Optional[str] = None
+    event_wakeups: int = 0
 
 @dataclass
 class ScriptStatus:
@@ -93,6 +119,20 @@ class ScriptManager:
         self.lock = threading.Lock()
         self.shutdown_event = asyncio.Event()
         
+        # Wake processes on database changes (LISTEN/NOTIFY) instead of pure polling
+        self.wake_events: Dict[str, asyncio.Event] = {}
+        self.change_listener: Optional[ChangeListener] = None
+        self.listener_task: Optional[asyncio.Task] = None
+        self.status_task: Optional[asyncio.Task] = None
+        
+        # Leader election so only one instance runs the processes
+        self.mode = SCRIPT_MANAGER_MODE
+        self.leader_lock: Optional[LeaderLock] = LeaderLock() if LEADER_ELECTION_ENABLED else None
+        self.is_leader = False
+        self.leadership_task: Optional[asyncio.Task] = None
+        if os.getenv('SCRIPT_MANAGER_CHANGE_EVENTS', 'true').lower() == 'true':
+            self.change_listener = ChangeListener()
+        
         # Initialize default processes
         self._initialize_default_processes()
         
@@ -107,28 +147,35 @@ class ScriptManager:
                 type=ProcessType.TRADE_SYNC,
                 interval_seconds=30.0,  # Consolidate to 30 seconds
                 max_api_calls_per_minute=60,
-                priority=1
+                priority=1,
+                wake_on=("trades",)  # New pending orders are checked right away
             ),
             "level_monitor": ProcessConfig(
                 name="Level Monitor",
                 type=ProcessType.LEVEL_MONITOR,
-                interval_seconds=1.0,  # 1 second for critical execution - 60 calls/min max
-                max_api_calls_per_minute=60,  # 1 API call per cycle × 60 cycles = 60 calls/min
-                priority=1
+                enabled=not LEVEL_MONITOR_SHARDING,
+                interval_seconds=0.5,  # Fast tick; level_scheduler decides which symbols are actually polled
+                max_api_calls_per_minute=120,  # Only symbols near a trigger are polled every tick
+                priority=1,
+                wake_on=("take_profit_levels", "stop_loss_levels", "trades"),  # Arm new levels instantly
+                debounce_seconds=0.1
             ),
             "price_update": ProcessConfig(
                 name="Price Update",
                 type=ProcessType.PRICE_UPDATE,
                 interval_seconds=10.0,  # Batch price updates
                 max_api_calls_per_minute=30,
-                priority=2
+                priority=2,
+                wake_on=("trades",)
             ),
             "notification_check": ProcessConfig(
                 name="Notification Check",
                 type=ProcessType.NOTIFICATION_CHECK,
                 interval_seconds=5.0,
                 max_api_calls_per_minute=20,
-                priority=3
+                priority=3,
+                wake_on=("trades",),
+                event_interval_seconds=60.0
             ),
             "position_sync": ProcessConfig(
                 name="Position Sync",
@@ -142,7 +189,25 @@ class ScriptManager:
                 type=ProcessType.DASHBOARD_SYNC,
                 interval_seconds=30.0,
                 max_api_calls_per_minute=15,
+                priority=5,
+                wake_on=("trades", "signals"),
+                event_interval_seconds=300.0,
+                debounce_seconds=2.0
+            ),
+            "webhook_log_maintenance": ProcessConfig(
+                name="Webhook Log Maintenance",
+                type=ProcessType.WEBHOOK_LOG_MAINTENANCE,
+                interval_seconds=3600.0,  # Partitions are daily, hourly is plenty
+                max_api_calls_per_minute=5,  # Database only, no broker calls
                 priority=5
+            ),
+            "asset_refresh": ProcessConfig(
+                name="Asset Refresh",
+                type=ProcessType.ASSET_REFRESH,
+                interval_seconds=3600.0,  # Checks hourly, refreshes once the snapshot is ASSET_REFRESH_HOURS old
+                max_api_calls_per_minute=5,
+                priority=5,
+                timeout_seconds=120  # One large list call
             )
         }
 
@@ -196,8 +261,9 @@ class ScriptManager:
             
             logger.debug(f"[RUN] Running {config.name}")
             
-            # Run the function with timeout
-            result = await asyncio.wait_for(func(*args, **kwargs), timeout=config.timeout_seconds)
+            # Run the function with timeout; its statements are attributed to this process
+            with query_context(caller=f"process:{process_name}"):
+                result = await asyncio.wait_for(func(*args, **kwargs), timeout=config.timeout_seconds)
             
             # Update success metrics
             end_time = time.time()
@@ -208,11 +274,10 @@ class ScriptManager:
             metrics.total_runs += 1
             metrics.success_count += 1
             
-            # Update average duration
-            if metrics.avg_duration == 0:
-                metrics.avg_duration = duration
-            else:
-                metrics.avg_duration = (metrics.avg_duration + duration) / 2
+            # Running mean over all successful runs; the distribution is in PROCESS_CYCLE_SECONDS
+            metrics.total_duration += duration
+            metrics.avg_duration = metrics.total_duration / metrics.success_count
+            PROCESS_CYCLE_SECONDS.observe(duration, process_name, "success")
             
             # Track API calls - use actual count if returned, otherwise use estimate
             if hasattr(func, '_api_calls'):
@@ -227,9 +292,11 @@ class ScriptManager:
             
         except asyncio.TimeoutError:
             error_msg = f"Timeout after {config.timeout_seconds}s"
+            PROCESS_CYCLE_SECONDS.observe(time.time() - start_time, process_name, "timeout")
             self._handle_process_error(process_name, error_msg)
             
         except Exception as e:
+            PROCESS_CYCLE_SECONDS.observe(time.time() - start_time, process_name, "error")
             self._handle_process_error(process_name, str(e))
 
     def _handle_process_error(self, process_name: str, error_msg: str):
@@ -260,16 +327,57 @@ class ScriptManager:
             
             # Calculate sleep time to maintain consistent interval
             cycle_duration = time.time() - cycle_start
-            sleep_time = max(0, config.interval_seconds - cycle_duration)
+            sleep_time = max(0, self._current_interval(config) - cycle_duration)
             
             if cycle_duration > config.interval_seconds:
                 logger.warning(f"[TIMING] {config.name} cycle took {cycle_duration:.2f}s (longer than {config.interval_seconds}s interval)")
             
+            if await self._wait_for_next_run(process_name, sleep_time):
+                break  # Shutdown requested
+
+    def _current_interval(self, config: ProcessConfig) -> float:
+        """Interval to use right now - the long fallback only while change events are flowing"""
+        if (config.wake_on and config.event_interval_seconds
+                and self.change_listener and self.change_listener.connected):
+            return config.event_interval_seconds
+        return config.interval_seconds
+
+    async def _wait_for_next_run(self, process_name: str, sleep_time: float) -> bool:
+        """Sleep until the next run is due or a relevant change arrives. Returns True on shutdown."""
+        wake_event = self.wake_events.get(process_name)
+        
+        if wake_event is None:
             try:
                 await asyncio.wait_for(self.shutdown_event.wait(), timeout=sleep_time)
-                break  # Shutdown requested
+                return True
             except asyncio.TimeoutError:
-                continue  # Normal timeout, continue loop
+                return False
+        
+        waiters = [
+            asyncio.create_task(self.shutdown_event.wait()),
+            asyncio.create_task(wake_event.wait())
+        ]
+        try:
+            await asyncio.wait(waiters, timeout=sleep_time, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        
+        if self.shutdown_event.is_set():
+            return True
+        
+        if wake_event.is_set():
+            self.metrics[process_name].event_wakeups += 1
+            # Debounce so a burst of row changes results in a single run
+            try:
+                await asyncio.wait_for(self.shutdown_event.wait(), timeout=self.processes[process_name].debounce_seconds)
+                return True
+            except asyncio.TimeoutError:
+                pass
+            # Cleared before the run so changes made during it trigger another
+            wake_event.clear()
+        
+        return False
 
     def get_status(self) -> Dict[str, ScriptStatus]:
         """Get current status of all processes"""
@@ -292,7 +400,7 @@ class ScriptManager:
             # Calculate next run time
             next_run = None
             if process_status == "running" and metrics.last_run:
-                next_run = metrics.last_run + timedelta(seconds=config.interval_seconds)
+                next_run = metrics.last_run + timedelta(seconds=self._current_interval(config))
             
             # Get resource usage
             resource_usage = self._get_resource_usage()
@@ -320,6 +428,21 @@ class ScriptManager:
         except:
             return {"cpu_percent": 0, "memory_mb": 0, "memory_percent": 0}
 
+    def get_change_events_status(self) -> Dict[str, Any]:
+        """Get LISTEN/NOTIFY wake-up status"""
+        if not self.change_listener:
+            return {"enabled": False}
+        
+        return {
+            "enabled": True,
+            "connected": self.change_listener.connected,
+            "notifications_received": self.change_listener.notifications_received,
+            "subscriptions": {
+                process_name: list(self.processes[process_name].wake_on)
+                for process_name in self.wake_events
+            }
+        }
+
     def get_api_usage_summary(self) -> Dict[str, Any]:
         """Get API usage summary across all processes"""
         total_calls = sum(len(calls) for calls in self.api_call_tracker.values())
@@ -367,6 +490,10 @@ class ScriptManager:
         logger.info(f"[API] Usage: {api_usage['total_calls_last_minute']} calls/minute")
         logger.info(f"[API] Projected: ~{api_usage['estimated_calls_per_hour']} calls/hour")
         
+        # Change listener
+        if self.change_listener:
+            logger.info(f"[LISTENER] Connected: {self.change_listener.connected}, notifications: {self.change_listener.notifications_received}")
+        
         # Resource usage
         resource = self._get_resource_usage()
         logger.info(f"[SYSTEM] CPU: {resource['cpu_percent']:.1f}%, Memory: {resource['memory_mb']:.1f}MB")
@@ -384,6 +511,8 @@ class ScriptManager:
         from process_modules.notification_checker import check_notifications_process
         from process_modules.position_sync import sync_positions_process
         from process_modules.dashboard_sync import sync_dashboard_process
+        from process_modules.webhook_log_maintenance import maintain_webhook_logs_process
+        from process_modules.asset_refresh import refresh_assets_process
         
         # Start process loops
         process_functions = {
@@ -392,9 +521,21 @@ class ScriptManager:
             "price_update": update_prices_process,
             "notification_check": check_notifications_process,
             "position_sync": sync_positions_process,
-            "dashboard_sync": sync_dashboard_process
+            "dashboard_sync": sync_dashboard_process,
+            "webhook_log_maintenance": maintain_webhook_logs_process,
+            "asset_refresh": refresh_assets_process
         }
         
+        # Subscribe processes to the table changes they care about
+        if self.change_listener:
+            self.change_listener.subscribers.clear()
+            self.wake_events = {}
+            for process_name, config in self.processes.items():
+                if config.enabled and config.wake_on:
+                    self.wake_events[process_name] = asyncio.Event()
+                    self.change_listener.subscribe(config.wake_on, self.wake_events[process_name])
+            self.listener_task = asyncio.create_task(self.change_listener.run(self.shutdown_event))
+        
         for process_name, func in process_functions.items():
             if process_name in self.processes and self.processes[process_name].enabled:
                 task = asyncio.create_task(
@@ -403,10 +544,82 @@ class ScriptManager:
                 self.running_tasks[process_name] = task
         
         # Start status reporting
-        asyncio.create_task(self._status_reporter())
+        self.status_task = asyncio.create_task(self._status_reporter())
         
         logger.info(f"[STARTUP] Started {len(self.running_tasks)} processes")
 
+    async def stop_all_processes(self):
+        """Stop process loops without shutting the manager down (leadership lost)"""
+        tasks = list(self.running_tasks.values())
+        for task in (self.listener_task, self.status_task):
+            if task:
+                tasks.append(task)
+        
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        self.running_tasks = {}
+        self.listener_task = None
+        self.status_task = None
+        logger.info("[STOP] All processes stopped")
+
+    async def start(self):
+        """Start according to SCRIPT_MANAGER_MODE, electing a single leader when enabled"""
+        if self.mode == 'off':
+            logger.info("[STARTUP] SCRIPT_MANAGER_MODE=off - background processes run elsewhere")
+            return
+        
+        if not self.leader_lock:
+            await self.start_all_processes()
+            return
+        
+        self.leadership_task = asyncio.create_task(self._leadership_loop())
+
+    async def _leadership_loop(self):
+        """Campaign for the leader lock; run processes only while holding it"""
+        loop = asyncio.get_running_loop()
+        logger.info(f"[LEADER] {self.leader_lock.instance_id} campaigning for leadership ({self.mode} mode)")
+        
+        while not self.shutdown_event.is_set():
+            acquired = await loop.run_in_executor(None, self.leader_lock.try_acquire)
+            
+            if acquired:
+                self.is_leader = True
+                logger.info(f"[LEADER] {self.leader_lock.instance_id} is now leader - starting processes")
+                await self.start_all_processes()
+                
+                # Hold leadership while the lock session stays alive
+                while not self.shutdown_event.is_set():
+                    try:
+                        await asyncio.wait_for(self.shutdown_event.wait(), timeout=LEADER_CHECK_SECONDS)
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+                    if not await loop.run_in_executor(None, self.leader_lock.is_held):
+                        logger.error("[LEADER] Leadership lost - stopping processes")
+                        break
+                
+                self.is_leader = False
+                await self.stop_all_processes()
+                await loop.run_in_executor(None, self.leader_lock.release)
+                continue
+            
+            try:
+                await asyncio.wait_for(self.shutdown_event.wait(), timeout=LEADER_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_leadership_status(self) -> Dict[str, Any]:
+        """Get leader election state for this instance"""
+        return {
+            "mode": self.mode,
+            "leader_election": self.leader_lock is not None,
+            "instance_id": self.leader_lock.instance_id if self.leader_lock else None,
+            "is_leader": self.is_leader if self.leader_lock else bool(self.running_tasks)
+        }
+
     async def _status_reporter(self):
         """Periodic status reporting"""
         while not self.shutdown_event.is_set():
@@ -422,15 +635,26 @@ class ScriptManager:
         
         self.shutdown_event.set()
         
+        # Leadership loop stops its processes and releases the lock itself
+        if self.leadership_task:
+            await asyncio.gather(self.leadership_task, return_exceptions=True)
+        
         # Cancel all running tasks
         for process_name, task in self.running_tasks.items():
             logger.info(f"Stopping {process_name}...")
             task.cancel()
             
+        if self.listener_task:
+            self.listener_task.cancel()
+            await asyncio.gather(self.listener_task, return_exceptions=True)
+            
         # Wait for tasks to complete
         if self.running_tasks:
             await asyncio.gather(*self.running_tasks.values(), return_exceptions=True)
         
+        if self.leader_lock:
+            self.leader_lock.release()
+        
         logger.info("[SHUTDOWN] Script Manager shutdown complete")
 
 # Global manager instance
@@ -439,7 +663,12 @@ script_manager = ScriptManager()
 async def main():
     """Main entry point"""
     try:
-        await script_manager.start_all_processes()
+        # Running this file directly is always the scheduler, even if the shared
+        # environment sets SCRIPT_MANAGER_MODE=off for the API workers
+        script_manager.mode = 'standalone'
+        if WATCHDOG_ENABLED:
+            loop_watchdog.start()
+        await script_manager.start()
         
         # Keep running until interrupted
         while not script_manager.shutdown_event.is_set():
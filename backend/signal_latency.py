@@ -0,0 +1,183 @@
+"""
+Signal-to-fill latency tracing
+
+Every signal created from a WhatsApp message gets a signal_latency row holding
+the time it passed each stage of the pipeline (all UTC):
+
+    message_at          WHAPI message timestamp
+    received_at         webhook request received
+    analyzed_at         AI analysis / regex parsing finished
+    inserted_at         signal row inserted
+    approved_at         auto-approval or manual approval
+    order_submitted_at  entry order sent to the broker
+    broker_accepted_at  broker acknowledged the order
+    filled_at           fill seen by trade sync or the trade stream
+    levels_armed_at     take profit / stop loss levels created (and placed at the broker)
+
+Later stages are keyed by trade_id once the trade exists. A stage keeps the
+first time it was recorded, so the REST and stream paths can both report fills.
+latency_summary() turns the stored timestamps into per-stage distributions per
+source or account (GET /api/latency/signals).
+"""
+
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+STAGES = (
+    'message_at', 'received_at', 'analyzed_at', 'inserted_at', 'approved_at',
+    'order_submitted_at', 'broker_accepted_at', 'filled_at', 'levels_armed_at'
+)
+
+# (name, from stage, to stage) - consecutive stages plus the two end-to-end numbers
+INTERVALS = (
+    ('delivery', 'message_at', 'received_at'),
+    ('analysis', 'received_at', 'analyzed_at'),
+    ('insert', 'analyzed_at', 'inserted_at'),
+    ('approval', 'inserted_at', 'approved_at'),
+    ('submission', 'approved_at', 'order_submitted_at'),
+    ('broker_ack', 'order_submitted_at', 'broker_accepted_at'),
+    ('fill', 'broker_accepted_at', 'filled_at'),
+    ('arming', 'filled_at', 'levels_armed_at'),
+    ('signal_to_fill', 'message_at', 'filled_at'),
+    ('end_to_end', 'message_at', 'levels_armed_at'),
+)
+
+# Until migrations/create_signal_latency_table.py has run, tracing is skipped instead of
+# failing the webhook / fill transaction it runs in. A missing table is re-checked every 5 minutes.
+TABLE_RECHECK_SECONDS = 300
+_table_ready = False
+_table_checked_at = 0.0
+
+GROUPINGS = {
+    'source': ('sl.source_id', 'LEFT JOIN signal_sources g ON g.id = sl.source_id'),
+    'account': ('sl.account_id', 'LEFT JOIN accounts g ON g.id = sl.account_id'),
+}
+
+
+def create_signal_latency_table(cursor):
+    """Create signal_latency and its indexes"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS signal_latency (
+            signal_id INTEGER PRIMARY KEY REFERENCES signals(id) ON DELETE CASCADE,
+            source_id INTEGER,
+            account_id INTEGER,
+            trade_id INTEGER,
+            message_at TIMESTAMP,
+            received_at TIMESTAMP,
+            analyzed_at TIMESTAMP,
+            inserted_at TIMESTAMP,
+            approved_at TIMESTAMP,
+            order_submitted_at TIMESTAMP,
+            broker_accepted_at TIMESTAMP,
+            filled_at TIMESTAMP,
+            levels_armed_at TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_signal_latency_trade_id
+        ON signal_latency(trade_id)
+        WHERE trade_id IS NOT NULL
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_signal_latency_inserted_at
+        ON signal_latency(inserted_at)
+    """)
+
+
+def _tracing_enabled(cursor) -> bool:
+    global _table_ready, _table_checked_at
+    if _table_ready:
+        return True
+    if _table_checked_at and time.monotonic() - _table_checked_at < TABLE_RECHECK_SECONDS:
+        return False
+    cursor.execute("SELECT to_regclass('signal_latency') IS NOT NULL AS ready")
+    row = cursor.fetchone()
+    _table_ready = bool(row['ready'] if isinstance(row, dict) else row[0])
+    _table_checked_at = time.monotonic()
+    return _table_ready
+
+
+def start_trace(cursor, signal_id: int, source_id: int, account_id: Optional[int],
+                message_at: Optional[datetime], received_at: datetime, analyzed_at: datetime,
+                inserted_at: datetime, approved_at: Optional[datetime] = None):
+    """Record the ingestion stages of a newly inserted signal"""
+    if not _tracing_enabled(cursor):
+        return
+    cursor.execute("""
+        INSERT INTO signal_latency (
+            signal_id, source_id, account_id, message_at, received_at,
+            analyzed_at, inserted_at, approved_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (signal_id) DO NOTHING
+    """, (signal_id, source_id, account_id, message_at, received_at, analyzed_at, inserted_at, approved_at))
+
+
+def mark_signal_stage(cursor, signal_id: int, stage: str, at: Optional[datetime] = None,
+                      account_id: Optional[int] = None, trade_id: Optional[int] = None):
+    """Record a stage for a signal (first time wins); optionally attach the account/trade"""
+    if stage not in STAGES:
+        raise ValueError(f"Unknown latency stage: {stage}")
+    if not _tracing_enabled(cursor):
+        return
+    cursor.execute(f"""
+        UPDATE signal_latency
+        SET {stage} = COALESCE({stage}, %s),
+            account_id = COALESCE(%s, account_id),
+            trade_id = COALESCE(%s, trade_id)
+        WHERE signal_id = %s
+    """, (at or datetime.utcnow(), account_id, trade_id, signal_id))
+
+
+def mark_trade_stage(cursor, trade_id: int, stage: str, at: Optional[datetime] = None):
+    """Record a stage for the signal behind a trade (no-op for untraced trades)"""
+    if stage not in STAGES:
+        raise ValueError(f"Unknown latency stage: {stage}")
+    if not _tracing_enabled(cursor):
+        return
+    cursor.execute(f"""
+        UPDATE signal_latency
+        SET {stage} = COALESCE({stage}, %s)
+        WHERE trade_id = %s
+    """, (at or datetime.utcnow(), trade_id))
+
+
+def latency_summary(cursor, user_id: int, group_by: str, since: datetime) -> List[Dict[str, Any]]:
+    """Per-stage latency (seconds) for the user's traced signals since `since`, per source or account"""
+    group_column, group_join = GROUPINGS[group_by]
+    intervals = ',\n'.join(
+        f"('{name}', EXTRACT(EPOCH FROM (sl.{end} - sl.{start}))::float8)" for name, start, end in INTERVALS
+    )
+    cursor.execute(f"""
+        SELECT {group_column} AS group_id,
+               MAX(g.name) AS group_name,
+               d.stage,
+               COUNT(*),
+               AVG(d.seconds),
+               percentile_cont(ARRAY[0.5, 0.95, 0.99]) WITHIN GROUP (ORDER BY d.seconds)
+        FROM signal_latency sl
+        JOIN signals s ON s.id = sl.signal_id
+        {group_join}
+        CROSS JOIN LATERAL (VALUES {intervals}) AS d(stage, seconds)
+        WHERE s.user_id = %s
+        AND sl.inserted_at >= %s
+        AND d.seconds IS NOT NULL
+        GROUP BY {group_column}, d.stage
+    """, (user_id, since))
+
+    order = {name: index for index, (name, _, _) in enumerate(INTERVALS)}
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for group_id, group_name, stage, count, avg, (p50, p95, p99) in cursor.fetchall():
+        group = groups.setdefault(group_id, {f"{group_by}_id": group_id, "name": group_name, "intervals": {}})
+        group["intervals"][stage] = {
+            "count": count,
+            "avg": round(float(avg), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3)
+        }
+    for group in groups.values():
+        group["intervals"] = dict(sorted(group["intervals"].items(), key=lambda item: order[item[0]]))
+    return list(groups.values())
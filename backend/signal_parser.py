@@ -1,10 +1,18 @@
+import os
 import re
+import threading
+from collections import defaultdict
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 import logging
 
+from asset_cache import asset_cache
+from metrics import SIGNAL_SYMBOL_CANDIDATES
+
 logger = logging.getLogger(__name__)
 
+MAX_TRACKED_WORDS = 500  # Distinct rejected words kept for the stats; the rest are counted as '<other>'
+
 class SignalParser:
     """Parse trading signals from WhatsApp messages"""
     
@@ -13,7 +21,7 @@ class SignalParser:
         # Pattern: BUY AAPL @ 150, SL: 145, TP: 160
         'standard': re.compile(
             r'(?P<action>BUY|SELL|LONG|SHORT)\s+'
-            r'(?P<symbol>[A-Z]{1,5})\s*'
+            r'\$?(?P<symbol>[A-Z]{1,5})\s*'
             r'(?:@|at|AT)?\s*'
             r'(?P<price>\d+\.?\d*)?'
             r'(?:.*?SL[:\s]+(?P<stop_loss>\d+\.?\d*))?'
@@ -22,7 +30,7 @@ class SignalParser:
         ),
         # Pattern: AAPL: BUY @ 150
         'symbol_first': re.compile(
-            r'(?P<symbol>[A-Z]{1,5})[:\s]+'
+            r'\$?(?P<symbol>[A-Z]{1,5})[:\s]+'
             r'(?P<action>BUY|SELL|LONG|SHORT)\s*'
             r'(?:@|at|AT)?\s*'
             r'(?P<price>\d+\.?\d*)?',
@@ -31,7 +39,7 @@ class SignalParser:
         # Pattern: Entry: AAPL 150, Stop: 145, Target: 160
         'entry_format': re.compile(
             r'(?:ENTRY[:\s]+)?'
-            r'(?P<symbol>[A-Z]{1,5})\s+'
+            r'\$?(?P<symbol>[A-Z]{1,5})\s+'
             r'(?P<price>\d+\.?\d*)'
             r'(?:.*?STOP[:\s]+(?P<stop_loss>\d+\.?\d*))?'
             r'(?:.*?TARGET[:\s]+(?P<take_profit>\d+\.?\d*))?',
@@ -39,7 +47,7 @@ class SignalParser:
         ),
         # Pattern: 🚀 AAPL BUY 150 🎯 160 ⛔ 145
         'emoji_format': re.compile(
-            r'(?P<symbol>[A-Z]{1,5})\s+'
+            r'\$?(?P<symbol>[A-Z]{1,5})\s+'
             r'(?P<action>BUY|SELL|LONG|SHORT)\s+'
             r'(?P<price>\d+\.?\d*)'
             r'(?:.*?🎯\s*(?P<take_profit>\d+\.?\d*))?'
@@ -59,19 +67,86 @@ class SignalParser:
         'chat', 'hello', 'hi', 'thanks', 'good morning', 'gm',
         'how are', 'congrats', 'welcome', 'joined', 'left'
     ]
+    # Whole words only ('hi' must not match 'hit'); cashtags are tickers, not greetings ($GM)
+    EXCLUDE_PATTERN = re.compile(
+        r'(?<![\w$])(?:' + '|'.join(re.escape(keyword) for keyword in EXCLUDE_KEYWORDS) + r')(?!\w)'
+    )
     
-    # Valid US stock symbols (can be expanded)
-    def is_valid_symbol(self, symbol: str) -> bool:
-        """Check if the symbol is a valid US stock ticker"""
+    # Words the patterns pick up as symbols in chat: signal vocabulary, greetings and
+    # abbreviations. Some are real tickers (GM, NOW, ALL, IT) - write those as cashtags ($GM).
+    COMMON_WORD_BLOCKLIST = frozenset({
+        'BUY', 'SELL', 'LONG', 'SHORT', 'ENTRY', 'ENTER', 'EXIT', 'STOP', 'LOSS', 'SL', 'TP', 'TPS',
+        'TARGET', 'PT', 'ALERT', 'TRADE', 'HOLD', 'ADD', 'TRIM', 'CLOSE', 'OPEN', 'CALL', 'CALLS',
+        'PUT', 'PUTS', 'LIMIT', 'PRICE', 'AT', 'ABOVE', 'BELOW', 'NEAR', 'HIT', 'HITS', 'NEW', 'HIGH',
+        'LOW', 'DAY', 'WEEK', 'GM', 'GN', 'HI', 'HEY', 'YES', 'NO', 'OK', 'NOW', 'THE', 'AND', 'OR',
+        'FOR', 'TO', 'IN', 'ON', 'OF', 'IS', 'IT', 'A', 'I', 'AM', 'PM', 'ALL', 'ARE', 'BE', 'GO',
+        'SO', 'UP', 'OUT', 'BIG', 'NEXT', 'JUST', 'RISK', 'SIZE', 'USD', 'ETF', 'IPO', 'CEO', 'EPS',
+        'ATH', 'EOD', 'DD', 'IMO', 'FYI', 'LOL', 'YOLO', 'FOMO', 'NFA', 'TA', 'RSI', 'EMA', 'SMA',
+        'VWAP', 'MACD', 'AH', 'PRE'
+    }) | frozenset(
+        word.strip().upper() for word in os.getenv('SIGNAL_SYMBOL_BLOCKLIST', '').split(',') if word.strip()
+    )
+    
+    def __init__(self):
+        # Symbol candidate outcomes and the words rejected most often (see summary())
+        self.candidate_counts: Dict[str, int] = defaultdict(int)
+        self.rejected_words: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+    
+    def rejection_reason(self, symbol: str, cashtag: bool = False) -> Optional[str]:
+        """Why symbol is not a tradable US ticker, or None if it is"""
         if not symbol:
-            return False
+            return 'format'
+        symbol = symbol.upper()
         
         # Basic validation: 1-5 uppercase letters
-        if not re.match(r'^[A-Z]{1,5}$', symbol.upper()):
-            return False
+        if not re.match(r'^[A-Z]{1,5}$', symbol):
+            return 'format'
+        
+        if symbol in self.COMMON_WORD_BLOCKLIST and not cashtag:
+            return 'blocklist'
         
-        # Could add additional validation here (e.g., check against a list of known symbols)
-        return True
+        # Resident set of tradable tickers (accepts everything until the asset cache is loaded)
+        if not asset_cache.is_tradable(symbol):
+            return 'not_listed' if asset_cache.get(symbol) is None else 'not_tradable'
+        return None
+    
+    def is_valid_symbol(self, symbol: str, cashtag: bool = False) -> bool:
+        """Check if the symbol is a valid US stock ticker"""
+        return self.rejection_reason(symbol, cashtag) is None
+    
+    def _record_candidate(self, symbol: str, reason: Optional[str]):
+        SIGNAL_SYMBOL_CANDIDATES.inc(reason or 'accepted')
+        with self._stats_lock:
+            self.candidate_counts[reason or 'accepted'] += 1
+            if reason is None:
+                return
+            word = symbol if symbol in self.rejected_words or len(self.rejected_words) < MAX_TRACKED_WORDS else '<other>'
+            counts = self.rejected_words.setdefault(word, defaultdict(int))
+            counts[reason] += 1
+    
+    def summary(self, limit: int = 20) -> Dict[str, Any]:
+        """Candidate outcomes and the most often rejected words"""
+        with self._stats_lock:
+            ranked = sorted(self.rejected_words.items(), key=lambda item: sum(item[1].values()), reverse=True)
+            top_rejected = [
+                {"word": word, "count": sum(reasons.values()), "reasons": dict(reasons)}
+                for word, reasons in ranked[:limit]
+            ]
+            counts = dict(self.candidate_counts)
+        total = sum(counts.values())
+        return {
+            "candidates": total,
+            "outcomes": counts,
+            "rejected_ratio": round((total - counts.get('accepted', 0)) / total, 3) if total else 0.0,
+            "top_rejected": top_rejected,
+            "asset_cache_loaded": asset_cache.loaded
+        }
+    
+    def reset_stats(self):
+        with self._stats_lock:
+            self.candidate_counts.clear()
+            self.rejected_words.clear()
     
     def normalize_action(self, action: str) -> Optional[str]:
         """Normalize action to BUY or SELL"""
@@ -87,7 +162,7 @@ class SignalParser:
         message_lower = message.lower()
         
         # Skip if message contains exclude keywords
-        if any(keyword in message_lower for keyword in self.EXCLUDE_KEYWORDS):
+        if self.EXCLUDE_PATTERN.search(message_lower):
             return False
         
         # Process if message contains signal keywords
@@ -106,15 +181,22 @@ class SignalParser:
         if not self.should_process_message(message):
             return None
         
-        # Try each pattern
+        # Verdict per (symbol, cashtag) so a word matched by several patterns is counted once
+        checked: Dict[tuple, Optional[str]] = {}
+        
+        # Try each pattern, moving on to its next match when the symbol is rejected
         for pattern_name, pattern in self.PATTERNS.items():
-            match = pattern.search(message)
-            if match:
+            for match in pattern.finditer(message):
                 data = match.groupdict()
                 
                 # Extract and validate symbol
                 symbol = data.get('symbol', '').upper()
-                if not self.is_valid_symbol(symbol):
+                cashtag = match.start('symbol') > 0 and message[match.start('symbol') - 1] == '$'
+                key = (symbol, cashtag)
+                if key not in checked:
+                    checked[key] = self.rejection_reason(symbol, cashtag)
+                    self._record_candidate(symbol, checked[key])
+                if checked[key] is not None:
                     continue
                 
                 # Extract and normalize action
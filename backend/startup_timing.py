@@ -0,0 +1,114 @@
+"""
+API startup time breakdown
+
+main.py marks the end of each startup phase (imports, app setup, lifespan)
+and the moment it is ready to serve; the breakdown is printed as
+
+    [STARTUP] Ready in 1.62s (imports 1.21s, app_setup 0.38s, lifespan 0.03s)
+
+and a warning is logged when it exceeds STARTUP_BUDGET_SECONDS. Heavy
+subsystems (Alpaca SDK, OpenAI, cryptography) are imported on first use or by
+the post-ready warm-up through lazy_import(), which records how long each
+took. Everything is listed under "startup" in /api/script-manager/status.
+"""
+
+import os
+import time
+import logging
+import importlib
+import sys
+from datetime import datetime
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+from metrics import STARTUP_PHASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process was started (Linux only) - covers interpreter start-up before main.py"""
+    try:
+        with open('/proc/self/stat') as stat:
+            start_ticks = int(stat.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime:
+            system_uptime = float(uptime.read().split()[0])
+        return max(0.0, system_uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pre_main = _process_age()  # Interpreter, site-packages and uvicorn before main.py was imported
+        self.phases: Dict[str, float] = {}
+        self.lazy_imports: Dict[str, float] = {}
+        self.ready_at: Optional[datetime] = None
+        self.ready_seconds: Optional[float] = None
+        self.background_seconds: Optional[float] = None
+        self.background_error: Optional[str] = None
+        self.budget: Optional[float] = None
+        self._last = self.started
+
+    def mark(self, phase: str):
+        """End the current phase; its duration is the time since the previous mark"""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        STARTUP_PHASE_SECONDS.set(round(now - self._last, 6), phase)
+        self._last = now
+
+    def ready(self) -> str:
+        """Record that the app can serve; returns the breakdown line for the startup log"""
+        # Read here rather than at import: this module is imported before .env is loaded
+        self.budget = float(os.getenv('STARTUP_BUDGET_SECONDS', '5'))
+        self.ready_seconds = time.perf_counter() - self.started
+        self.ready_at = datetime.now()
+        breakdown = ', '.join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        pre_main = f", {self.pre_main:.2f}s before main.py" if self.pre_main is not None else ""
+        if self.ready_seconds > self.budget:
+            slowest = max(self.phases, key=self.phases.get) if self.phases else 'unknown'
+            logger.warning(f"[STARTUP] Startup took {self.ready_seconds:.2f}s, over the "
+                           f"{self.budget:.1f}s budget - slowest phase: {slowest}")
+        return f"[STARTUP] Ready in {self.ready_seconds:.2f}s ({breakdown}){pre_main}"
+
+    def background_started(self) -> str:
+        """Background processes are up (they start after the server is ready)"""
+        self.background_seconds = time.perf_counter() - self.started
+        return f"[STARTUP] Background processes started {self.background_seconds:.2f}s into startup"
+
+    def background_failed(self, error: BaseException) -> str:
+        """Background processes could not be started - the API keeps serving without them"""
+        self.background_error = f"{type(error).__name__}: {error}"
+        logger.error(f"[STARTUP] Background processes failed to start: {self.background_error}")
+        return f"[STARTUP] Background processes failed to start: {self.background_error}"
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "ready_at": self.ready_at.isoformat() if self.ready_at else None,
+            "ready_seconds": round(self.ready_seconds, 3) if self.ready_seconds is not None else None,
+            "budget_seconds": self.budget,
+            "before_main_seconds": round(self.pre_main, 3) if self.pre_main is not None else None,
+            "phases": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            "background_started_seconds": (round(self.background_seconds, 3)
+                                           if self.background_seconds is not None else None),
+            "background_error": self.background_error,
+            "lazy_imports": {name: round(seconds, 3) for name, seconds in self.lazy_imports.items()}
+        }
+
+
+startup_timer = StartupTimer()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a heavy module on first use, recording how long the import took"""
+    if name in sys.modules:
+        # import_module (not sys.modules) waits if another thread is still importing it
+        return importlib.import_module(name)
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - started
+    startup_timer.lazy_imports[name] = elapsed
+    logger.info(f"[STARTUP] Loaded {name} on first use in {elapsed:.2f}s")
+    return module
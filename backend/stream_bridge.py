@@ -13,6 +13,9 @@ from alpaca.trading.stream import TradingStream
 from alpaca.trading.enums import TradeEvent
 import aiohttp
 
+from signal_latency import mark_trade_stage
+from positions_mirror import apply_fill
+
 load_dotenv()
 
 # Internal API endpoint for sending notifications
@@ -107,8 +110,14 @@ class StreamBridge:
                 }
                 
                 # Handle different event types
+                if event in (TradeEvent.FILL, TradeEvent.PARTIAL_FILL):
+                    apply_fill(cursor, trade['account_id'], order.id, trade['symbol'], trade['action'],
+                               float(order.filled_qty or 0), float(order.filled_avg_price or 0),
+                               order.filled_at or order.updated_at)
+                
                 if event == TradeEvent.FILL:
                     # Order fully filled
+                    mark_trade_stage(cursor, trade_id, 'filled_at')
                     cursor.execute("""
                         UPDATE trades 
                         SET status = 'open',
@@ -188,6 +197,7 @@ class StreamBridge:
                     })
                     
                 elif event == TradeEvent.NEW:
+                    mark_trade_stage(cursor, trade_id, 'broker_accepted_at')
                     notification_data.update({
                         "type": "order_accepted",
                         "status": "pending",
@@ -228,7 +238,8 @@ class StreamBridge:
             stream = TradingStream(
                 api_key=api_key,
                 secret_key=api_secret,
-                paper=paper
+                paper=paper,
+                url_override=os.getenv("ALPACA_STREAM_URL_OVERRIDE")
             )
             
             # Subscribe to trade updates
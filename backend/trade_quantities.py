@@ -0,0 +1,92 @@
+"""
+Maintained executed / remaining quantities on trades
+
+trades.executed_quantity is the number of shares already sold by executed
+take profit and stop loss levels; trades.remaining_quantity is
+quantity - executed_quantity. Both are kept current by triggers in the same
+transaction as the change that affects them:
+
+- a level row entering or leaving status 'executed' adjusts its trade's
+  executed_quantity (take_profit_levels.shares_quantity,
+  stop_loss_levels.executed_shares)
+- any insert/update of trades.quantity or executed_quantity recomputes
+  remaining_quantity, so fills that change quantity are covered too
+
+Level and sell-all paths read these columns instead of summing
+take_profit_levels per trade.
+"""
+
+
+def install_trade_quantity_tracking(cursor):
+    """Add the columns and triggers (idempotent)"""
+    cursor.execute("""
+        ALTER TABLE trades
+        ADD COLUMN IF NOT EXISTS executed_quantity DECIMAL(10, 4) NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS remaining_quantity DECIMAL(10, 4)
+    """)
+
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION trades_set_remaining_quantity() RETURNS trigger AS $$
+        BEGIN
+            NEW.remaining_quantity := NEW.quantity - COALESCE(NEW.executed_quantity, 0);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS trades_remaining_quantity ON trades")
+    cursor.execute("""
+        CREATE TRIGGER trades_remaining_quantity
+        BEFORE INSERT OR UPDATE OF quantity, executed_quantity ON trades
+        FOR EACH ROW EXECUTE FUNCTION trades_set_remaining_quantity()
+    """)
+
+    # TG_ARGV[0] names the column holding the shares a level sold
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION trades_apply_level_execution() RETURNS trigger AS $$
+        DECLARE
+            delta NUMERIC := 0;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'executed' THEN
+                delta := delta - COALESCE((to_jsonb(OLD) ->> TG_ARGV[0])::numeric, 0);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'executed' THEN
+                delta := delta + COALESCE((to_jsonb(NEW) ->> TG_ARGV[0])::numeric, 0);
+            END IF;
+
+            IF delta <> 0 THEN
+                UPDATE trades
+                SET executed_quantity = executed_quantity + delta
+                WHERE id = COALESCE(NEW.trade_id, OLD.trade_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table, column in (('take_profit_levels', 'shares_quantity'), ('stop_loss_levels', 'executed_shares')):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_executed_quantity ON {table}")
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_executed_quantity
+            AFTER INSERT OR UPDATE OF status, {column} OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION trades_apply_level_execution('{column}')
+        """)
+
+
+def backfill_trade_quantities(cursor) -> int:
+    """Recompute executed/remaining quantities from executed levels. Returns rows updated."""
+    cursor.execute("""
+        UPDATE trades t
+        SET executed_quantity = COALESCE(tp.shares, 0) + COALESCE(sl.shares, 0)
+        FROM trades t2
+        LEFT JOIN (
+            SELECT trade_id, SUM(shares_quantity) AS shares
+            FROM take_profit_levels WHERE status = 'executed'
+            GROUP BY trade_id
+        ) tp ON tp.trade_id = t2.id
+        LEFT JOIN (
+            SELECT trade_id, SUM(executed_shares) AS shares
+            FROM stop_loss_levels WHERE status = 'executed'
+            GROUP BY trade_id
+        ) sl ON sl.trade_id = t2.id
+        WHERE t.id = t2.id
+    """)
+    return cursor.rowcount
@@ -0,0 +1,168 @@
+"""
+Webhook log storage helpers
+
+webhook_logs is range-partitioned by day on created_at so old deliveries can be
+discarded by dropping whole partitions instead of DELETE + VACUUM.
+
+Environment:
+- WEBHOOK_LOG_RETENTION_DAYS: days of partitions to keep (default 30)
+- WEBHOOK_LOG_PARTITIONS_AHEAD: future daily partitions to pre-create (default 3)
+- WEBHOOK_LOG_PAYLOAD_MODE: "full" stores every payload, "hash" stores only
+  sha256 + size for successfully processed deliveries (failures keep the payload)
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_LOG_RETENTION_DAYS = int(os.getenv('WEBHOOK_LOG_RETENTION_DAYS', '30'))
+WEBHOOK_LOG_PARTITIONS_AHEAD = int(os.getenv('WEBHOOK_LOG_PARTITIONS_AHEAD', '3'))
+WEBHOOK_LOG_PAYLOAD_MODE = os.getenv('WEBHOOK_LOG_PAYLOAD_MODE', 'full').lower()
+
+PARTITION_PREFIX = 'webhook_logs_p'
+DEFAULT_PARTITION = 'webhook_logs_default'
+
+
+def create_webhook_logs_table(cursor):
+    """Create the partitioned webhook_logs parent table, default partition and indexes"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_logs (
+            id BIGSERIAL,
+            instance_id VARCHAR(255),
+            event_type VARCHAR(50),
+            payload JSONB,
+            payload_hash CHAR(64),
+            payload_size INTEGER,
+            processed BOOLEAN DEFAULT FALSE,
+            error_message TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+
+    # Catches rows if maintenance has fallen behind so inserts never fail
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION}
+        PARTITION OF webhook_logs DEFAULT
+    """)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_webhook_logs_created_at ON webhook_logs(created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_webhook_logs_processed ON webhook_logs(processed) WHERE processed = FALSE")
+
+
+def get_webhook_logs_kind(cursor) -> Optional[str]:
+    """pg_class.relkind of webhook_logs: 'p' partitioned, 'r' plain table, None if missing"""
+    cursor.execute("""
+        SELECT c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'webhook_logs' AND n.nspname = current_schema()
+    """)
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day.strftime('%Y%m%d')}"
+
+
+def ensure_partitions(cursor, start: Optional[date] = None, days_ahead: int = WEBHOOK_LOG_PARTITIONS_AHEAD) -> List[str]:
+    """Create daily partitions from start (default today) through days_ahead. Returns created names."""
+    start = start or datetime.utcnow().date()
+    existing = set(list_partitions(cursor))
+    created = []
+
+    for offset in range(days_ahead + 1):
+        day = start + timedelta(days=offset)
+        name = partition_name(day)
+        if name in existing:
+            continue
+
+        # A savepoint keeps one conflicting partition (rows already sitting in
+        # the default partition for that range) from aborting the whole run
+        cursor.execute("SAVEPOINT webhook_partition")
+        try:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {name}
+                PARTITION OF webhook_logs
+                FOR VALUES FROM (%s) TO (%s)
+            """, (day, day + timedelta(days=1)))
+            cursor.execute("RELEASE SAVEPOINT webhook_partition")
+            created.append(name)
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT webhook_partition")
+            logger.warning(f"[WEBHOOK_LOGS] Could not create partition {name}: {e}")
+
+    return created
+
+
+def list_partitions(cursor) -> List[str]:
+    """Names of the daily partitions currently attached to webhook_logs"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'webhook_logs'
+    """)
+    return [row[0] for row in cursor.fetchall() if row[0].startswith(PARTITION_PREFIX)]
+
+
+def drop_expired_partitions(cursor, retention_days: int = WEBHOOK_LOG_RETENTION_DAYS) -> List[str]:
+    """Drop daily partitions older than the retention window. Returns dropped names."""
+    cutoff = datetime.utcnow().date() - timedelta(days=retention_days)
+    dropped = []
+
+    for name in list_partitions(cursor):
+        try:
+            day = datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m%d').date()
+        except ValueError:
+            continue
+        if day < cutoff:
+            cursor.execute(f"DROP TABLE IF EXISTS {name}")
+            dropped.append(name)
+
+    # Rows that landed in the default partition are pruned the slow way
+    cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < %s", (cutoff,))
+
+    return dropped
+
+
+def log_webhook(cursor, instance_id: str, event_type: str, raw_payload: bytes,
+                data: Optional[dict] = None, processed: bool = False,
+                error_message: Optional[str] = None):
+    """Record a webhook delivery.
+
+    In "hash" mode only the payload hash and size are kept for processed
+    deliveries; failures always keep the full payload for debugging.
+    """
+    payload_hash = hashlib.sha256(raw_payload).hexdigest()
+    payload_size = len(raw_payload)
+
+    if processed and WEBHOOK_LOG_PAYLOAD_MODE == 'hash':
+        payload = None
+    elif data is not None:
+        payload = json.dumps(data)
+    else:
+        payload = json.dumps({'raw': raw_payload.decode('utf-8', errors='replace')})
+
+    cursor.execute("""
+        INSERT INTO webhook_logs (
+            instance_id, event_type, payload, payload_hash, payload_size,
+            processed, error_message
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (
+        instance_id,
+        event_type,
+        payload,
+        payload_hash,
+        payload_size,
+        processed,
+        error_message
+    ))